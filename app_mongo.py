@@ -1,24 +1,50 @@
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response
 import hashlib
 import uuid
-import time
-import threading
 import json
+import atexit
+import time
+import random
 from datetime import datetime, timedelta
-from pymongo import MongoClient, GEOSPHERE, ASCENDING, DESCENDING
+from pymongo import MongoClient, DESCENDING
 from pymongo.errors import DuplicateKeyError
-from bson import json_util # Important pour sérialiser les données BSON (comme les dates)
 import os # Ajout pour le chemin du JSON
+from event_hub import EventHub, build_routing
+from event_bus import create_bus
+from events import build_event, order_fields, ORDER_EVENT_FIELDS
+from scheduler import TimerScheduler
+from candidates import rank_candidates, rank_candidates_geo, nearest_drivers
+from dispatch import DispatchEngine
+from positions import PositionBuffer, parse_samples, record_trail, get_trail
+from sync import changes_since, current_version
+from restaurant_cache import RestaurantCache
+from restaurant_search import RestaurantSearch
+from menu_index import MenuIndex
+from outbox import EventOutbox
+from data_loader import load_seed_file
+from indexes import ensure_indexes
+from serializer import dumps, sse_frame
+from metrics import Metrics, MongoCommandListener, RequestMetrics, instrument_event_hub
 
 app = Flask(__name__)
 app.secret_key = 'votre_cle_secrete'
 
+# Métriques du processus (GET /metrics): requêtes HTTP, commandes MongoDB, flux SSE
+metrics = Metrics()
+RequestMetrics(metrics).init_app(app)
+
+def json_response(payload, status=200):
+    """Réponse JSON pour un contenu qui contient des types BSON (dates, ObjectId)"""
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
 # --- Connexion MongoDB ---
 try:
     # Utilisation d'une variable d'environnement pour l'URI, sinon fallback
     MONGO_URI = os.environ.get('MONGO_URI', 'enter you mongoURI')
-    client = MongoClient(MONGO_URI)
-    db = client['delivery_db'] # Nom de la base de données
+    # Nombre, durée et octets des commandes par collection (octets mesurés sur une commande sur N, 0: jamais)
+    mongo_metrics = MongoCommandListener(metrics, bytes_every=int(os.environ.get('METRICS_BYTES_EVERY', 10)))
+    client = MongoClient(MONGO_URI, event_listeners=[mongo_metrics])
+    db = client[os.environ.get('MONGO_DB', 'delivery_db')] # Nom de la base de données
 
     # Définition des collections
     users_col = db['users']
@@ -31,6 +57,53 @@ try:
     if 'events' not in db.list_collection_names():
         db.create_collection("events", capped=True, size=10 * 1024 * 1024) # 10MB
     events_col = db['events']
+    # Boîte d'envoi des événements écrits dans une transaction (recopiés dans 'events')
+    outbox_col = db['events_outbox']
+
+    # Historique des trajets GPS (collection time-series, MongoDB 5.0+)
+    if 'livreurs_positions_history' not in db.list_collection_names():
+        db.create_collection(
+            "livreurs_positions_history",
+            timeseries={"timeField": "ts", "metaField": "driver_id", "granularity": "seconds"},
+            expireAfterSeconds=int(os.environ.get('TRAIL_RETENTION_DAYS', 30)) * 86400
+        )
+    history_col = db['livreurs_positions_history']
+
+    # Bus d'événements entre processus: changestream (replica set), redis ou memory
+    EVENT_BUS = os.environ.get('EVENT_BUS', 'changestream')
+    event_bus = create_bus(EVENT_BUS, events_col=events_col, redis_url=os.environ.get('REDIS_URL'))
+
+    # Publication groupée des événements par un thread (un lot par écriture sur le bus)
+    event_outbox = EventOutbox(
+        event_bus, outbox_col,
+        interval_ms=int(os.environ.get('EVENT_FLUSH_MS', 50)),
+        batch_size=int(os.environ.get('EVENT_BATCH_SIZE', 500))
+    )
+
+    # Une seule réception du bus partagée par toutes les connexions SSE du processus,
+    # avec les derniers événements en mémoire pour la reprise (Last-Event-ID)
+    event_hub = EventHub(event_bus, max_queue=100,
+                         replay_size=int(os.environ.get('SSE_REPLAY_SIZE', 10000)))
+    instrument_event_hub(metrics, event_hub)
+    # Délai de reconnexion conseillé aux navigateurs, étalé pour éviter les rafales
+    SSE_RETRY_MS = int(os.environ.get('SSE_RETRY_MS', 2000))
+    SSE_RETRY_JITTER_MS = int(os.environ.get('SSE_RETRY_JITTER_MS', 3000))
+
+    # Un seul thread pour toutes les fenêtres (acceptation, décision manager)
+    timer_scheduler = TimerScheduler(orders_col,
+                                     firing_grace=int(os.environ.get('TIMER_FIRING_GRACE', 30)))
+
+    # Restaurants et menus en cache, invalidés par Change Stream (à défaut, expirés après RESTAURANT_CACHE_TTL)
+    restaurant_cache = RestaurantCache(
+        restaurants_col, max_size=int(os.environ.get('RESTAURANT_CACHE_SIZE', 1000)),
+        ttl=int(os.environ.get('RESTAURANT_CACHE_TTL', 60))
+    )
+    restaurant_search = RestaurantSearch(restaurants_col)
+    restaurant_cache.add_listener(restaurant_search.clear_counts)
+
+    # Index inversé en mémoire des noms de restaurants et des articles (/search)
+    menu_index = MenuIndex(restaurants_col,
+                           reload_interval=int(os.environ.get('MENU_INDEX_RELOAD_SECONDS', 300)))
     
     print("✅ Connexion à MongoDB réussie.")
 
@@ -41,158 +114,127 @@ except Exception as e:
 
 
 # === FONCTION MODIFIÉE: Initialisation depuis le JSON ===
-def init_test_users():
+def init_test_users(path='donnees_fusionnees_avec_menus.json'):
+    """Charge comptes et restaurants du fichier JSON (lu en flux), puis crée les index manquants."""
+    print("Initialisation des utilisateurs...")
     try:
-        # Ouvrir et lire le fichier JSON
-        with open('donnees_fusionnees_avec_menus.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        load_seed_file(path, users_col, stats_col, restaurants_col)
+        print("Initialisation des données de test depuis le JSON terminée.")
     except FileNotFoundError:
-        print("ERREUR: Le fichier 'donnees_denormalisees.json' est introuvable.")
-        return
+        print(f"ERREUR: Le fichier '{path}' est introuvable.")
     except json.JSONDecodeError:
-        print("ERREUR: Le fichier 'donnees_denormalisees.json' contient un JSON invalide.")
-        return
-
-    print("Initialisation des utilisateurs...")
-    
-    # === Initialiser les utilisateurs (clients, managers) ===
-    for user in data.get('utilisateurs', []):
-        username = user.get('username')
-        if not username:
-            continue
-        
-        try:
-            users_col.update_one(
-                {"_id": username},
-                {"$setOnInsert": {
-                    "_id": username,
-                    "password": user['password_hash'],
-                    "role": user['role']
-                }},
-                upsert=True
-            )
-        except Exception as e:
-            print(f"Erreur init user {username}: {e}")
-
-    # === Initialiser les livreurs ===
-    for livreur_data in data.get('livreurs', []):
-        username = livreur_data.get('username')
-        if not username:
-            continue
-        
-        # 1. Créer l'utilisateur
-        try:
-            users_col.update_one(
-                {"_id": username},
-                {"$setOnInsert": {
-                    "_id": username,
-                    "password": livreur_data['password_hash'],
-                    "role": livreur_data['role']
-                }},
-                upsert=True
-            )
-        except Exception as e:
-            print(f"Erreur init livreur user {username}: {e}")
-
-        # 2. Initialiser les scores et statistiques
-        stats = livreur_data.get('livreur', {})
-        avg_rating = stats.get('avg_rating', 4.5)
-        
-        stats_col.update_one(
-            {"_id": username},
-            {"$setOnInsert": {
-                "_id": username,
-                "avg_rating": avg_rating,
-                "delivery_count": 1, # Simuler 1
-                "total_rating": avg_rating
-            }},
-            upsert=True
-        )
-
-    # === Initialiser les restaurants et leurs menus ===
-    for restaurant_data in data.get('restaurants', []):
-        username = restaurant_data.get('username') # username est l'ID (ex: "restaurant1")
-        if not username:
-            continue
-            
-        # 1. Créer l'utilisateur
-        try:
-            users_col.update_one(
-                {"_id": username},
-                {"$setOnInsert": {
-                    "_id": username,
-                    "password": restaurant_data['password_hash'],
-                    "role": restaurant_data['role']
-                }},
-                upsert=True
-            )
-        except Exception as e:
-            print(f"Erreur init restaurant user {username}: {e}")
-
-        info = restaurant_data.get('restaurant', {})
-        if not info:
-            print(f"AVERTISSEMENT: Pas d'infos 'restaurant' pour {username}")
-            continue
-            
-        # 2. Stocker les infos (nom, localisation, menu)
-        lon = float(info.get("longitude", 0.0))
-        lat = float(info.get("latitude", 0.0))
-        
-        # Le menu est déjà une liste d'objets, parfait pour Mongo
-        menu_list = info.get('menu', []) 
-        
-        restaurants_col.update_one(
-            {"_id": username},
-            {"$setOnInsert": {
-                "_id": username,
-                "name": info.get("nom", username),
-                "location": {
-                    "type": "Point",
-                    "coordinates": [lon, lat] # [Longitude, Latitude]
-                },
-                "menu": menu_list # Stocker la liste de menus directement
-            }},
-            upsert=True
-        )
-    
-    print("Initialisation des données de test depuis le JSON terminée.")
-    
-   # --- Création des index MongoDB ---
-    print("Création des index MongoDB...")
-    users_col.create_index("role")
-    orders_col.create_index("client")
-    orders_col.create_index("status")
-    orders_col.create_index("assigned_driver")
-    orders_col.create_index("restaurant")
-    orders_col.create_index([("candidates", ASCENDING)])
-    orders_col.create_index([("created_at", DESCENDING)])
-    stats_col.create_index([("avg_rating", DESCENDING)])
-    positions_col.create_index([("location", GEOSPHERE)])
-    restaurants_col.create_index([("location", GEOSPHERE)])
-    restaurants_col.create_index([("name", "text")])  # NOUVEL INDEX pour la recherche
-    print("Index créés.")
+        print(f"ERREUR: Le fichier '{path}' contient un JSON invalide.")
+
+    # --- Création des index MongoDB (un appel par collection, sauté s'ils existent) ---
+    created = ensure_indexes(db)
+    if created:
+        print(f"Index créés: {', '.join(f'{name} ({len(names)})' for name, names in created.items())}")
+    else:
+        print("Index déjà en place.")
 # =========================================================
 
 
-def publish_event(event_type, data):
-    """Publie un événement en l'insérant dans la collection 'events'."""
-    try:
-        event_data = {
-            'type': event_type,
-            'data': data,
-            'timestamp': datetime.now()
-        }
-        events_col.insert_one(event_data)
-    except Exception as e:
-        print(f"Erreur lors de la publication de l'événement: {e}")
+def publish_event(event_type, data, routing=None, db_session=None):
+    """Publie un événement dans la collection 'events'.
+
+    'routing' désigne les destinataires (client, restaurant, livreurs) ;
+    les managers et les diffusions par rôle sont ajoutés selon le type.
+    Sans db_session, l'événement est mis en file et écrit par lot en
+    arrière-plan ; avec db_session, il est écrit dans la même transaction
+    que la commande (via la boîte d'envoi).
+    """
+    event = build_event(event_type, data, routing)
+    if db_session is not None:
+        event_outbox.publish_in_transaction(event, db_session)
+    else:
+        event_outbox.publish(event)
+
+_transactions_supported = None
+
+def run_in_transaction(callback):
+    """Exécute callback(db_session) dans une transaction MongoDB.
+
+    Un mongod seul (tests, EVENT_BUS=memory) n'a pas de transactions:
+    callback reçoit alors None et ses événements passent par la file.
+    """
+    global _transactions_supported
+    if _transactions_supported is None:
+        hello = client.admin.command('hello')
+        _transactions_supported = 'setName' in hello or hello.get('msg') == 'isdbgrid'
+    if not _transactions_supported:
+        return callback(None)
+    with client.start_session() as db_session:
+        result = db_session.with_transaction(callback)
+    # Transaction validée: ses événements (boîte d'envoi) partent avant ceux déposés ensuite
+    event_outbox.request_relay()
+    return result
+
+def publish_position_events(samples):
+    """Événements des positions écrites lors d'un flush (une par livreur)."""
+    event_outbox.publish_many([
+        build_event('position_updated', {
+            'driver_id': sample['driver_id'],
+            'longitude': sample['longitude'],
+            'latitude': sample['latitude']
+        }, build_routing('position_updated', drivers=[sample['driver_id']]))
+        for sample in samples
+    ])
+
+# Écriture différée des positions GPS: dernier point par livreur, un bulk_write par intervalle
+position_buffer = PositionBuffer(positions_col, on_flush=publish_position_events,
+                                 interval_ms=int(os.environ.get('POSITION_FLUSH_MS', 500)))
 
 def get_livreur_score(livreur_id):
     stats = stats_col.find_one({"_id": livreur_id})
     return float(stats['avg_rating']) if stats and 'avg_rating' in stats else 0.0
 
-def get_all_orders_with_details():
-    # Convertit le curseur en liste et trie
-    return list(orders_col.find().sort("created_at", DESCENDING))
+# Tableau manager: pages de commandes par curseur (created_at, _id), champs des cartes uniquement
+MANAGER_PAGE_SIZE = 50
+ORDER_CARD_PROJECTION = {
+    "id": 1, "articles": 1, "client": 1, "restaurant": 1, "restaurant_name": 1,
+    "status": 1, "assigned_driver": 1, "created_at": 1,
+    "candidates_count": {"$size": {"$ifNull": ["$candidates", []]}}
+}
+
+def encode_order_cursor(order):
+    return f"{order['created_at'].isoformat()}|{order['_id']}"
+
+def decode_order_cursor(cursor):
+    created_at, order_id = cursor.split('|', 1)
+    return datetime.fromisoformat(created_at), order_id
+
+def get_orders_page(status=None, restaurant=None, cursor=None, limit=MANAGER_PAGE_SIZE):
+    """Une page du tableau manager, de la plus récente à la plus ancienne.
+
+    Pagination par clé (created_at, _id): le coût d'une page ne dépend pas
+    de sa profondeur. Renvoie (commandes, curseur suivant ou None).
+    """
+    query = {}
+    if status:
+        query["status"] = status
+    if restaurant:
+        query["restaurant"] = restaurant
+    if cursor:
+        created_at, order_id = decode_order_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": order_id}}
+        ]
+    
+    # Équivalent à find().sort().limit() (même index, tri et limite fusionnés),
+    # avec candidates_count calculé en $project
+    orders = list(orders_col.aggregate([
+        {"$match": query},
+        {"$sort": {"created_at": DESCENDING, "_id": DESCENDING}},
+        {"$limit": limit + 1},
+        {"$project": ORDER_CARD_PROJECTION}
+    ]))
+    
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = encode_order_cursor(orders[-1])
+    return orders, next_cursor
 
 def get_assigned_orders_for_livreur(livreur_id):
     return list(orders_col.find({
@@ -227,8 +269,8 @@ def login():
                 
                 # Si c'est un restaurant, stocker son nom
                 if role == 'restaurant':
-                    info = restaurants_col.find_one({"_id": username}, {"name": 1})
-                    session['restaurant_name'] = info.get('name', username) if info else username
+                    info = restaurant_cache.get(username)
+                    session['restaurant_name'] = info['name'] if info else username
                 
                 flash('Connexion réussie!', 'success')
                 return redirect(url_for('dashboard'))
@@ -246,15 +288,24 @@ def dashboard():
     
     role = session['role']
     username = session['username']
+    # Version prise avant les lectures: /sync renverra tout ce qui change ensuite
+    sync_version = current_version()
     
     if role == 'client':
         orders = get_client_orders(username)
-        return render_template('client_simple.html', username=username, orders=orders)
+        return render_template('client_simple.html', username=username, orders=orders,
+                             sync_version=sync_version)
     elif role == 'manager':
-        all_orders = get_all_orders_with_details()
+        status_filter = request.args.get('status', '')
+        restaurant_filter = request.args.get('restaurant', '').strip()
+        all_orders, next_cursor = get_orders_page(status_filter, restaurant_filter)
         return render_template('manager_simple.html', 
                              username=username,
                              all_orders=all_orders,
+                             next_cursor=next_cursor,
+                             status_filter=status_filter,
+                             restaurant_filter=restaurant_filter,
+                             sync_version=sync_version,
                              get_livreur_score=get_livreur_score)
     elif role == 'restaurant':
         # MODIFIÉ: Obtenir les commandes pour ce restaurant spécifique
@@ -262,7 +313,8 @@ def dashboard():
         restaurant_name = session.get('restaurant_name', username)
         return render_template('restaurant_simple.html', 
                              username=restaurant_name, # Afficher le nom complet
-                             orders=orders)
+                             orders=orders,
+                             sync_version=sync_version)
     elif role == 'livreur':
         available_orders = get_available_orders()
         my_interests = get_my_interests(username)
@@ -271,104 +323,135 @@ def dashboard():
                              username=username, 
                              available_orders=available_orders, 
                              my_interests=my_interests,
-                             assigned_orders=assigned_orders)
+                             assigned_orders=assigned_orders,
+                             sync_version=sync_version,
+                             websocket_enabled=socket_transport is not None)
     
     return redirect(url_for('login'))
 # =======================================================
 
+@app.route('/manager/orders')
+def manager_orders():
+    """Page suivante du tableau manager (défilement infini): cartes HTML + curseur"""
+    if session.get('role') != 'manager':
+        return jsonify({'status': 'error', 'message': 'Non autorisé'}), 401
+    try:
+        limit = min(int(request.args.get('limit', MANAGER_PAGE_SIZE)), 200)
+        orders, next_cursor = get_orders_page(
+            request.args.get('status', ''),
+            request.args.get('restaurant', '').strip(),
+            request.args.get('cursor') or None,
+            limit
+        )
+        html = "".join(render_template('manager_order_card.html', order=order) for order in orders)
+        return jsonify({
+            'status': 'success',
+            'html': html,
+            'count': len(orders),
+            'next_cursor': next_cursor
+        })
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Curseur invalide'}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
 # === NOUVELLE ROUTE: Obtenir la liste des restaurants ===
 @app.route('/get_restaurants')
 def get_restaurants():
     if 'username' not in session:
         return jsonify({'status': 'error', 'message': 'Non autorisé'}), 401
     
-    restaurants_data = list(restaurants_col.find({}, {"_id": 1, "name": 1}))
-    
-    # Reformater pour le frontend
-    restaurants = [
-        {"id": resto["_id"], "name": resto.get("name", resto["_id"])} 
-        for resto in restaurants_data
-    ]
+    restaurants = restaurant_cache.list_restaurants()
     
     return jsonify({'status': 'success', 'restaurants': restaurants})
 # ========================================================
 
-# === NOUVELLE ROUTE: Obtenir les restaurants paginés avec recherche ===
+# === ROUTE MODIFIÉE: Obtenir les restaurants paginés avec recherche ===
 @app.route('/get_restaurants_paginated')
 def get_restaurants_paginated():
+    """Recherche indexée (préfixe ou $text) paginée par curseur: ?search=&cursor=&per_page="""
     if 'username' not in session:
         return jsonify({'status': 'error', 'message': 'Non autorisé'}), 401
     
     try:
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 10))
+        per_page = min(max(int(request.args.get('per_page', 10)), 1), 100)
         search_term = request.args.get('search', '').strip()
+        cursor = request.args.get('cursor') or None
         
-        # Construire la requête de recherche
-        query = {}
-        if search_term:
-            # Recherche insensible à la casse dans le nom du restaurant
-            query["name"] = {"$regex": search_term, "$options": "i"}
-        
-        # Compter le nombre total de restaurants (avec filtre si recherche)
-        total_restaurants = restaurants_col.count_documents(query)
-        
-        # Calculer le skip pour la pagination
-        skip = (page - 1) * per_page
-        
-        # Récupérer les restaurants paginés
-        restaurants_cursor = restaurants_col.find(
-            query, 
-            {"_id": 1, "name": 1}
-        ).skip(skip).limit(per_page)
+        restaurants, next_cursor, mode = restaurant_search.search(search_term, cursor, per_page)
         
-        # Reformater pour le frontend
-        restaurants = [
-            {"id": resto["_id"], "name": resto.get("name", resto["_id"])} 
-            for resto in restaurants_cursor
-        ]
-        
-        # Calculer la pagination
+        # Total mis en cache (estimation sans recherche), pour l'affichage seulement
+        total_restaurants = restaurant_search.count(search_term, mode)
         total_pages = (total_restaurants + per_page - 1) // per_page if total_restaurants > 0 else 1
         
         return jsonify({
             'status': 'success', 
             'restaurants': restaurants,
             'pagination': {
-                'page': page,
                 'per_page': per_page,
                 'total_restaurants': total_restaurants,
                 'total_pages': total_pages,
-                'has_next': page < total_pages,
-                'has_prev': page > 1
+                'has_next': next_cursor is not None,
+                'next_cursor': next_cursor,
+                'mode': mode
             },
             'search_term': search_term
         })
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 # ========================================================
 
 
+# === NOUVELLE ROUTE: Recherche d'articles dans tous les menus ===
+@app.route('/search')
+def search():
+    """Autocomplétion et recherche d'articles: ?q=pizza ma&limit=20"""
+    if 'username' not in session:
+        return jsonify({'status': 'error', 'message': 'Non autorisé'}), 401
+    
+    if not menu_index.ready:
+        return jsonify({'status': 'error', 'message': 'Index en cours de construction'}), 503
+    
+    query = request.args.get('q', '').strip()
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 50)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Paramètre limit invalide'}), 400
+    
+    start = time.perf_counter()
+    suggestions = menu_index.suggest(query)
+    results = menu_index.search(query, limit=limit)
+    took_ms = (time.perf_counter() - start) * 1000
+    
+    return jsonify({
+        'status': 'success',
+        'query': query,
+        'suggestions': suggestions,
+        'results': results,
+        'took_ms': round(took_ms, 3)
+    })
+
+@app.route('/debug_menu_index')
+def debug_menu_index():
+    """Taille de l'index des menus (restaurants, articles, termes, entrées)"""
+    return jsonify(menu_index.stats())
+# ======================================================
+
 # === NOUVELLE ROUTE: Obtenir le menu d'un restaurant ===
 @app.route('/get_menu/<restaurant_id>')
 def get_menu(restaurant_id):
     if 'username' not in session:
         return jsonify({'status': 'error', 'message': 'Non autorisé'}), 401
     
-    resto_data = restaurants_col.find_one({"_id": restaurant_id}, {"menu": 1})
+    # Menu déjà converti en dictionnaire {nom: prix} dans le cache
+    resto_info = restaurant_cache.get(restaurant_id)
     
-    if not resto_data or "menu" not in resto_data:
+    if not resto_info or resto_info['menu'] is None:
         return jsonify({'status': 'error', 'message': 'Menu non trouvé'}), 404
     
-    # Convertir la liste d'objets en dictionnaire {nom: prix}
-    menu_list = resto_data.get('menu', [])
-    menu_dict = {
-        item['nom_article']: float(item['prix']) 
-        for item in menu_list 
-        if 'nom_article' in item and 'prix' in item
-    }
-    
-    return jsonify({'status': 'success', 'menu': menu_dict})
+    return jsonify({'status': 'success', 'menu': resto_info['menu']})
 # ======================================================
 
 # === ROUTE MODIFIÉE: Passer une commande ===
@@ -382,25 +465,25 @@ def passer_commande():
         if not restaurant_id or not items:
             return jsonify({'status': 'error', 'message': 'Données manquantes'}), 400
 
-        id_commande = str(uuid.uuid4())[:8]
+        id_commande = str(uuid.uuid4())
         
         # Formater la chaîne des articles
         articles_str = ", ".join([f"{item['quantity']}x {item['item']}" for item in items])
         total_price = sum(item['quantity'] * item['price'] for item in items)
         
         # Récupérer les infos du restaurant (nom, localisation)
-        resto_info = restaurants_col.find_one({"_id": restaurant_id})
+        resto_info = restaurant_cache.get(restaurant_id)
         if not resto_info:
             return jsonify({'status': 'error', 'message': 'Restaurant non trouvé'}), 404
         
-        resto_loc = resto_info.get("location", {}).get("coordinates", [0.0, 0.0])
+        resto_loc = resto_info["coordinates"]
         
         details_commande = {
             "_id": id_commande,
             "id": id_commande,
             "client": session.get('username'),
             "restaurant": restaurant_id,
-            "restaurant_name": resto_info.get("name", restaurant_id),
+            "restaurant_name": resto_info["name"],
             "restaurant_lon": str(resto_loc[0]), # lon
             "restaurant_lat": str(resto_loc[1]), # lat
             "articles": articles_str,
@@ -409,11 +492,24 @@ def passer_commande():
             "created_at": datetime.now() # Utiliser datetime objet
         }
         
-        orders_col.insert_one(details_commande)
+        def create_order(db_session):
+            # Insertion avec date de modification côté serveur (version pour /sync).
+            # Le filtre ne correspond à aucune commande existante: un identifiant déjà
+            # pris lève DuplicateKeyError (transaction annulée) sans modifier l'autre commande.
+            result = orders_col.update_one(
+                {"_id": id_commande, "created_at": {"$exists": False}},
+                {"$setOnInsert": details_commande, "$currentDate": {"updated_at": True}},
+                upsert=True, session=db_session
+            )
+            if result.upserted_id is None:
+                raise DuplicateKeyError(f"Commande {id_commande} déjà existante")
+            # La commande et son événement sont écrits ensemble ou pas du tout
+            publish_event('order_created', {'order_id': id_commande, 'fields': order_fields(details_commande)},
+                          build_routing('order_created', id_commande,
+                                        client=details_commande['client'], restaurant=restaurant_id),
+                          db_session=db_session)
         
-        # Rendre les détails sérialisables pour l'événement
-        details_commande_serializable = json.loads(json_util.dumps(details_commande))
-        publish_event('order_created', {'order_id': id_commande, 'details': details_commande_serializable})
+        run_in_transaction(create_order)
         
         return jsonify({'status': 'success', 'order_id': id_commande})
     except Exception as e:
@@ -424,18 +520,19 @@ def passer_commande():
 @app.route('/marquer_prete/<order_id>', methods=['POST'])
 def marquer_prete(order_id):
     try:
-        # Vérifier que le restaurant est autorisé
+        # Marquer la commande comme prête, seulement si elle appartient au restaurant
         restaurant_id = session.get('username')
-        order_data = orders_col.find_one({"_id": order_id}, {"restaurant": 1})
+        order_data = orders_col.find_one_and_update(
+            {"_id": order_id, "restaurant": restaurant_id},
+            {"$set": {"status": "ready"}, "$currentDate": {"updated_at": True}},
+            projection={key: 1 for key in ORDER_EVENT_FIELDS}
+        )
         
-        if not order_data or order_data.get('restaurant') != restaurant_id:
+        if not order_data:
              return jsonify({'status': 'error', 'message': 'Non autorisé'}), 403
-             
-        # Marquer la commande comme prête
-        orders_col.update_one({"_id": order_id}, {"$set": {"status": "ready"}})
         
         # Démarrer la fenêtre de 60s pour les livreurs
-        start_acceptance_window(order_id)
+        start_acceptance_window(order_id, order_data)
         
         print(f"✅ Fenêtre d'acceptation ouverte pour {order_id}")
         return jsonify({'status': 'success'})
@@ -443,183 +540,200 @@ def marquer_prete(order_id):
         return jsonify({'status': 'error', 'message': str(e)})
 # ================================================
 
-# === FONCTION MODIFIÉE: Ajout de order_data à l'événement ===
-def start_acceptance_window(order_id):
-    """Démarre la fenêtre d'acceptation de 60s pour les livreurs"""
-    expiration_time = datetime.now() + timedelta(seconds=60)
-    
-    # On stocke le timer directement dans le document de la commande
-    timer_data = {
-        "type": "acceptance_window",
-        "expires_at": expiration_time.isoformat(),
-        "status": "active",
-        "created_at": datetime.now().isoformat()
-    }
-    orders_col.update_one({"_id": order_id}, {"$set": {"timer": timer_data}})
-    
-    # Programmer l'expiration pour déclencher la décision manager
-    schedule_manager_decision(order_id, 60)
-    
-    # MODIFIÉ: Envoyer les détails de la commande dans l'événement
-    order_data = orders_col.find_one({"_id": order_id})
-    # Rendre sérialisable
-    order_data_serializable = json.loads(json_util.dumps(order_data))
+# === FONCTION MODIFIÉE: Champs de la commande dans l'événement ===
+def start_acceptance_window(order_id, order_data):
+    """Démarre la fenêtre d'acceptation de 60s pour les livreurs.
 
+    order_data: commande déjà lue par l'appelant (champs ORDER_EVENT_FIELDS).
+    """
+    # Le timer est stocké dans le document de la commande et programmé
+    # dans le planificateur: à l'expiration, décision du manager
+    expiration_time = timer_scheduler.schedule(order_id, "acceptance_window", 60)
+    
+    fields = order_fields(order_data)
+    fields['status'] = 'ready'
     publish_event('order_ready', {
         'order_id': order_id,
         'expires_at': expiration_time.isoformat(),
-        'order_data': order_data_serializable # Envoyer les détails
-    })
+        'fields': fields
+    }, build_routing('order_ready', order_id,
+                     client=order_data.get('client'), restaurant=order_data.get('restaurant')))
 # =========================================================
 
-def schedule_manager_decision(order_id, delay_seconds):
-    """Programme la décision du manager après un délai"""
-    def start_manager_decision():
-        time.sleep(delay_seconds)
-        
-        order_data = orders_col.find_one({"_id": order_id})
-        if not order_data or order_data.get('status') != 'ready':
-            return
-            
-        candidates = order_data.get('candidates', [])
+def start_manager_decision(order_id):
+    """Fin de la fenêtre d'acceptation: ouvre la fenêtre de décision du manager"""
+    order_data = orders_col.find_one({"_id": order_id})
+    if not order_data or order_data.get('status') != 'ready':
+        return
         
+    candidates = order_data.get('candidates', [])
+    
+    if not candidates and GEO_RANKING:
+        # Aucun intérêt: on propose les livreurs les plus proches du restaurant
+        nearest = nearest_drivers(positions_col, stats_col,
+                                  order_data.get('restaurant_lon', '2.333'),
+                                  order_data.get('restaurant_lat', '48.865'),
+                                  limit=NEAREST_DRIVERS_FALLBACK,
+                                  max_distance_km=GEO_MAX_DISTANCE_KM,
+                                  max_age_seconds=POSITION_MAX_AGE_SECONDS)
+        candidates = [driver['id'] for driver in nearest]
         if candidates:
-            expiration_time = datetime.now() + timedelta(seconds=60)
-            timer_data = {
-                "type": "manager_decision",
-                "expires_at": expiration_time.isoformat(),
-                "status": "active"
-            }
-            orders_col.update_one({"_id": order_id}, {"$set": {"timer": timer_data}})
-            
-            publish_event('manager_decision_started', {
-                'order_id': order_id,
-                'candidates_count': len(candidates),
-                'expires_at': expiration_time.isoformat()
-            })
-            
-            print(f"🔄 Fenêtre manager démarrée pour {order_id} avec {len(candidates)} candidats")
-            
-            schedule_auto_assignment(order_id, 60)
-        else:
-            orders_col.update_one({"_id": order_id}, {"$unset": {"timer": ""}})
-            publish_event('no_candidates', {'order_id': order_id})
-            print(f"❌ Aucun candidat pour {order_id}")
+            orders_col.update_one(
+                {"_id": order_id},
+                {"$set": {"candidates": candidates, "candidates_source": "nearest"}, "$currentDate": {"updated_at": True}}
+            )
+            print(f"📍 {order_id}: {len(candidates)} livreur(s) proche(s) proposé(s)")
     
-    thread = threading.Thread(target=start_manager_decision, daemon=True)
-    thread.start()
-
-def schedule_auto_assignment(order_id, delay_seconds):
-    """Programme l'attribution automatique après un délai"""
-    def auto_assign():
-        time.sleep(delay_seconds)
+    if candidates:
+        expiration_time = timer_scheduler.schedule(order_id, "manager_decision", 60)
         
-        order_data = orders_col.find_one({"_id": order_id})
-        if not order_data or order_data.get('status') != 'ready':
-            return
-            
-        candidates = order_data.get('candidates', [])
+        publish_event('manager_decision_started', {
+            'order_id': order_id,
+            'candidates_count': len(candidates),
+            'expires_at': expiration_time.isoformat()
+        }, build_routing('manager_decision_started', order_id,
+                         restaurant=order_data.get('restaurant'), drivers=candidates))
+        
+        print(f"🔄 Fenêtre manager démarrée pour {order_id} avec {len(candidates)} candidats")
+    else:
+        orders_col.update_one({"_id": order_id}, {"$unset": {"timer": ""}, "$currentDate": {"updated_at": True}})
+        publish_event('no_candidates', {'order_id': order_id},
+                      build_routing('no_candidates', order_id, restaurant=order_data.get('restaurant')))
+        print(f"❌ Aucun candidat pour {order_id}")
+
+def auto_assign(order_id):
+    """Fin de la fenêtre manager: attribution automatique au meilleur candidat"""
+    order_data = orders_col.find_one({"_id": order_id})
+    if not order_data or order_data.get('status') != 'ready':
+        return
         
-        if candidates:
-            resto_lon = order_data.get('restaurant_lon', '2.333')
-            resto_lat = order_data.get('restaurant_lat', '48.865')
-            
-            best_livreur = None
-            best_score = -1
-            
-            for candidate in candidates:
-                driver_score = get_livreur_score(candidate)
-                
-                driver_pos_doc = positions_col.find_one({"_id": candidate})
-                
-                if driver_pos_doc and 'location' in driver_pos_doc:
-                    driver_lon = driver_pos_doc['location']['coordinates'][0]
-                    driver_lat = driver_pos_doc['location']['coordinates'][1]
-                    
-                    distance = calculate_distance(resto_lon, resto_lat, driver_lon, driver_lat)
-                    
-                    combined_score = (driver_score ** 2) / (distance + 1)
-                    
-                    if combined_score > best_score:
-                        best_score = combined_score
-                        best_livreur = candidate
-                else:
-                    if driver_score > best_score:
-                        best_score = driver_score
-                        best_livreur = candidate
+    candidates = order_data.get('candidates', [])
+    
+    if candidates:
+        resto_lon = order_data.get('restaurant_lon', '2.333')
+        resto_lat = order_data.get('restaurant_lat', '48.865')
+        
+        # Notes et positions de tous les candidats en deux requêtes
+        ranked = rank_order_candidates(candidates, resto_lon, resto_lat)
+        
+        if ranked:
+            best = ranked[0]
+            orders_col.update_one(
+                {"_id": order_id},
+                {
+                    "$set": {"status": "assigned", "assigned_driver": best['id']},
+                    "$unset": {"candidates": "", "timer": ""},
+                    "$currentDate": {"updated_at": True}
+                }
+            )
             
-            if best_livreur:
-                orders_col.update_one(
-                    {"_id": order_id},
-                    {
-                        "$set": {"status": "assigned", "assigned_driver": best_livreur},
-                        "$unset": {"candidates": "", "timer": ""}
-                    }
-                )
-                
-                distance_info = ""
-                driver_pos_doc = positions_col.find_one({"_id": best_livreur})
-                if driver_pos_doc:
-                    driver_lon = driver_pos_doc['location']['coordinates'][0]
-                    driver_lat = driver_pos_doc['location']['coordinates'][1]
-                    distance = calculate_distance(resto_lon, resto_lat, driver_lon, driver_lat)
-                    distance_info = f" (distance: {distance}km)"
-                
-                publish_event('auto_assignment', {
-                    'order_id': order_id,
-                    'driver_id': best_livreur,
-                    'score': get_livreur_score(best_livreur),
-                    'distance': distance_info
-                })
-                
-                print(f"🤖 Attribution automatique: {order_id} -> {best_livreur}{distance_info}")
+            notify_auto_assignment(order_data, best['id'], best['score'], best['distance'])
+
+def rank_order_candidates(candidates, resto_lon, resto_lat):
+    """Classement des candidats: $geoNear côté MongoDB si GEO_RANKING, sinon en Python"""
+    if GEO_RANKING:
+        ranked = rank_candidates_geo(positions_col, stats_col, candidates, resto_lon, resto_lat,
+                                     max_distance_km=GEO_MAX_DISTANCE_KM,
+                                     max_age_seconds=POSITION_MAX_AGE_SECONDS)
+        if ranked:
+            return ranked
+        # Aucune position récente dans le rayon: classement sur les notes seules
+    return rank_candidates(stats_col, positions_col, candidates, resto_lon, resto_lat)
+
+def notify_auto_assignment(order_data, driver_id, score, distance):
+    """Publie l'attribution automatique (chemin glouton ou moteur de dispatch)"""
+    order_id = order_data['_id']
+    distance_info = f" (distance: {distance}km)" if distance is not None else ""
+    
+    publish_event('auto_assignment', {
+        'order_id': order_id,
+        'driver_id': driver_id,
+        'score': score,
+        'distance': distance_info
+    }, build_routing('auto_assignment', order_id, client=order_data.get('client'),
+                     restaurant=order_data.get('restaurant'),
+                     drivers=order_data.get('candidates', [])))
+    
+    print(f"🤖 Attribution automatique: {order_id} -> {driver_id}{distance_info}")
+
+# Mode d'attribution à l'expiration de la fenêtre manager:
+# 'batch' = couplage global sur toutes les commandes expirées, 'greedy' = commande par commande
+DISPATCH_MODE = os.environ.get('DISPATCH_MODE', 'batch')
+
+# Classement géographique via $geoNear sur livreurs_positions (GEO_RANKING=1):
+# rayon maximal, positions trop anciennes ignorées, et proposition des N livreurs
+# les plus proches quand aucun ne s'est montré intéressé
+GEO_RANKING = os.environ.get('GEO_RANKING', '0') == '1'
+GEO_MAX_DISTANCE_KM = float(os.environ.get('GEO_MAX_DISTANCE_KM', 10))
+POSITION_MAX_AGE_SECONDS = int(os.environ.get('POSITION_MAX_AGE_SECONDS', 600))
+NEAREST_DRIVERS_FALLBACK = 5
+dispatch_engine = DispatchEngine(orders_col, stats_col, positions_col,
+                                 on_assigned=notify_auto_assignment, interval=2.0)
+
+timer_scheduler.register("acceptance_window", start_manager_decision)
+timer_scheduler.register("manager_decision",
+                         dispatch_engine.wake if DISPATCH_MODE == 'batch' else auto_assign)
+
+def register_interest(livreur, order_id):
+    """Ajoute le livreur aux candidats d'une commande dans sa fenêtre d'acceptation"""
+    order_data = orders_col.find_one({"_id": order_id}, {"timer": 1, "restaurant": 1})
+    timer_data = order_data.get('timer') if order_data else None
+    
+    if not timer_data or timer_data.get('type') != 'acceptance_window':
+        return {'status': 'error', 'message': 'Fenêtre d\'acceptation fermée'}
+    
+    orders_col.update_one(
+        {"_id": order_id},
+        {"$addToSet": {"candidates": livreur}, "$currentDate": {"updated_at": True}}
+    )
     
-    thread = threading.Thread(target=auto_assign, daemon=True)
-    thread.start()
+    publish_event('driver_interest', {
+        'order_id': order_id,
+        'driver_id': livreur,
+        'driver_score': get_livreur_score(livreur)
+    }, build_routing('driver_interest', order_id, restaurant=order_data.get('restaurant')))
+    
+    print(f"✅ {livreur} a montré son intérêt pour {order_id}")
+    return {'status': 'success'}
 
 @app.route('/montrer_interet/<order_id>', methods=['POST'])
 def montrer_interet(order_id):
     try:
-        livreur = session.get('username')
-        
-        order_data = orders_col.find_one({"_id": order_id}, {"timer": 1})
-        timer_data = order_data.get('timer')
-        
-        if not timer_data or timer_data.get('type') != 'acceptance_window':
-            return jsonify({'status': 'error', 'message': 'Fenêtre d\'acceptation fermée'}), 400
-        
-        orders_col.update_one(
-            {"_id": order_id},
-            {"$addToSet": {"candidates": livreur}}
-        )
-        
-        publish_event('driver_interest', {
-            'order_id': order_id,
-            'driver_id': livreur,
-            'driver_score': get_livreur_score(livreur)
-        })
-        
-        print(f"✅ {livreur} a montré son intérêt pour {order_id}")
-        return jsonify({'status': 'success'})
+        result = register_interest(session.get('username'), order_id)
+        return jsonify(result), (200 if result['status'] == 'success' else 400)
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
 @app.route('/choisir_livreur/<order_id>/<livreur>', methods=['POST'])
 def choisir_livreur(order_id, livreur):
     try:
-        orders_col.update_one(
-            {"_id": order_id},
-            {
-                "$set": {"status": "assigned", "assigned_driver": livreur},
-                "$unset": {"candidates": "", "timer": ""}
-            }
-        )
+        timer_scheduler.cancel(order_id)
         
-        publish_event('driver_assigned', {
-            'order_id': order_id,
-            'driver_id': livreur,
-            'assigned_by': session.get('username')
-        })
+        manager = session.get('username')
+        
+        def assign(db_session):
+            # Document avant mise à jour: on récupère les candidats pour le routage
+            order_data = orders_col.find_one_and_update(
+                {"_id": order_id},
+                {
+                    "$set": {"status": "assigned", "assigned_driver": livreur},
+                    "$unset": {"candidates": "", "timer": ""},
+                    "$currentDate": {"updated_at": True}
+                },
+                projection={"client": 1, "restaurant": 1, "candidates": 1},
+                session=db_session
+            ) or {}
+            
+            # L'attribution et sa notification sont atomiques
+            publish_event('driver_assigned', {
+                'order_id': order_id,
+                'driver_id': livreur,
+                'assigned_by': manager
+            }, build_routing('driver_assigned', order_id, client=order_data.get('client'),
+                             restaurant=order_data.get('restaurant'),
+                             drivers=order_data.get('candidates', []) + [livreur]), db_session)
+        
+        run_in_transaction(assign)
         
         print(f"✅ Manager a choisi {livreur} pour {order_id}")
         return jsonify({'status': 'success'})
@@ -631,14 +745,16 @@ def marquer_livree(order_id):
     try:
         order_data = orders_col.find_one_and_update(
             {"_id": order_id},
-            {"$set": {"status": "delivered"}},
-            projection={"assigned_driver": 1}
+            {"$set": {"status": "delivered"}, "$currentDate": {"updated_at": True}},
+            projection={"assigned_driver": 1, "client": 1, "restaurant": 1}
         )
         
         publish_event('order_delivered', {
             'order_id': order_id,
             'driver_id': order_data.get("assigned_driver")
-        })
+        }, build_routing('order_delivered', order_id, client=order_data.get('client'),
+                         restaurant=order_data.get('restaurant'),
+                         drivers=[order_data.get("assigned_driver")]))
         
         print(f"✅ Commande {order_id} livrée")
         return jsonify({'status': 'success'})
@@ -648,21 +764,19 @@ def marquer_livree(order_id):
 @app.route('/get_order_candidates/<order_id>')
 def get_order_candidates(order_id):
     try:
-        order_data = orders_col.find_one({"_id": order_id}, {"candidates": 1, "status": 1})
+        order_data = orders_col.find_one(
+            {"_id": order_id},
+            {"candidates": 1, "status": 1, "restaurant_lon": 1, "restaurant_lat": 1}
+        )
         if not order_data:
             return jsonify({'status': 'error', 'message': 'Commande non trouvée'}), 404
 
         candidates = order_data.get('candidates', [])
-        candidates_with_scores = []
-        
-        for candidate in candidates:
-            score = get_livreur_score(candidate)
-            candidates_with_scores.append({
-                'id': candidate,
-                'score': score
-            })
         
-        candidates_with_scores.sort(key=lambda x: x['score'], reverse=True)
+        # Même classement que l'attribution automatique (note et distance)
+        candidates_with_scores = rank_order_candidates(
+            candidates, order_data.get('restaurant_lon', '2.333'), order_data.get('restaurant_lat', '48.865')
+        )
         
         return jsonify({
             'status': 'success', 
@@ -697,26 +811,123 @@ def get_timer_status(order_id):
 
 @app.route('/events')
 def events():
-    """Endpoint Server-Sent Events (SSE) utilisant les Change Streams MongoDB"""
+    """Endpoint Server-Sent Events (SSE) alimenté par le Change Stream partagé.
+
+    Seuls les événements qui concernent l'utilisateur (rôle, nom, restaurant,
+    commandes suivies via ?order_id=...) sont envoyés. Chaque trame porte un
+    id ; à la reconnexion, le navigateur renvoie le dernier (en-tête
+    Last-Event-ID, ou ?last_event_id=) et reçoit les événements manqués.
+    """
+    if 'username' not in session:
+        return jsonify({'status': 'error', 'message': 'Non autorisé'}), 401
+
+    role = session['role']
+    username = session['username']
+    order_ids = request.args.getlist('order_id') or None
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    retry_ms = SSE_RETRY_MS + random.randint(0, SSE_RETRY_JITTER_MS)
+
     def generate():
-        pipeline = [{'$match': {'operationType': 'insert'}}]
-        
+        sub, replay = event_hub.subscribe(role, username, order_ids, last_event_id)
         try:
-            with events_col.watch(pipeline, full_document='updateLookup') as stream:
-                yield "data: {}\n\n".format(json.dumps({'type': 'connected'}))
-                
-                for change in stream:
-                    event_doc = change['fullDocument']
-                    event_doc.pop('_id', None) 
-                    
-                    # Utiliser json_util.dumps pour gérer les types BSON
-                    yield "data: {}\n\n".format(json_util.dumps(event_doc))
-        except Exception as e:
-            print(f"Erreur SSE/Change Stream: {e}")
-            yield "data: {}\n\n".format(json.dumps({'type': 'error', 'message': str(e)}))
+            yield f"retry: {retry_ms}\n\n"
+            yield sse_frame({'type': 'connected', 'replayed': len(replay)})
+            for frame in replay:
+                yield frame
+            while True:
+                # Trames en attente, dont les pings du hub toutes les 15 s sans événement
+                frames = sub.get()
+                if frames:
+                    yield frames
+        except OverflowError:
+            # Le navigateur se reconnecte seul et reprend au dernier id reçu
+            print(f"⚠️ Client SSE {username} trop lent, déconnecté")
+            yield sse_frame({'type': 'error', 'message': 'overflow'})
+        finally:
+            event_hub.unsubscribe(sub)
 
     return Response(generate(), mimetype='text/event-stream')
 
+def order_access_query(role, username, order_id):
+    """Filtre d'une commande visible par l'utilisateur, None si son rôle n'y a pas accès"""
+    query = {"_id": order_id}
+    if role == 'client':
+        query["client"] = username
+    elif role == 'restaurant':
+        query["restaurant"] = username
+    elif role == 'livreur':
+        query["$or"] = [{"assigned_driver": username}, {"status": "ready"}]
+    elif role != 'manager':
+        return None
+    return query
+
+def can_follow_order(role, username, order_id):
+    query = order_access_query(role, username, order_id)
+    return query is not None and orders_col.count_documents(query, limit=1) > 0
+
+@app.route('/order/<order_id>')
+def get_order(order_id):
+    """Document complet d'une commande, à la demande (les événements n'en portent que les changements)"""
+    if 'username' not in session:
+        return jsonify({'status': 'error', 'message': 'Non autorisé'}), 401
+    
+    query = order_access_query(session['role'], session['username'], order_id)
+    if query is None:
+        return jsonify({'status': 'error', 'message': 'Non autorisé'}), 401
+    
+    order = orders_col.find_one(query)
+    if not order:
+        return jsonify({'status': 'error', 'message': 'Commande non trouvée'}), 404
+    
+    return json_response({'status': 'success', 'order': order})
+
+@app.route('/sync')
+def sync_orders():
+    """Commandes créées ou modifiées depuis ?since=<version>, rendues en cartes HTML.
+
+    Remplace les rechargements complets des tableaux de bord: la page applique
+    les cartes reçues puis repart de la version renvoyée.
+    """
+    if 'username' not in session:
+        return jsonify({'status': 'error', 'message': 'Non autorisé'}), 401
+    
+    role = session['role']
+    username = session['username']
+    try:
+        since = int(request.args['since'])
+    except (KeyError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Paramètre since invalide'}), 400
+    
+    projection = None
+    if role == 'client':
+        scope, template = {"client": username}, 'client_order_card.html'
+    elif role == 'restaurant':
+        scope, template = {"restaurant": username}, 'restaurant_order_card.html'
+    elif role == 'livreur':
+        scope, template = {"assigned_driver": username}, 'livreur_assigned_card.html'
+    elif role == 'manager':
+        scope, template = {}, 'manager_order_card.html'
+        if request.args.get('restaurant'):
+            scope["restaurant"] = request.args['restaurant']
+        projection = dict(ORDER_CARD_PROJECTION, updated_at=1)
+    else:
+        return jsonify({'status': 'error', 'message': 'Non autorisé'}), 401
+    
+    try:
+        orders, version, has_more = changes_since(orders_col, scope, since, projection)
+        
+        changes = []
+        for order in orders:
+            changes.append({
+                'id': order['_id'],
+                'status': order.get('status'),
+                'html': render_template(template, order=order)
+            })
+        
+        return jsonify({'status': 'success', 'orders': changes, 'version': version, 'has_more': has_more})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
 @app.route('/debug_timers')
 def debug_timers():
     """Page de debug pour voir l'état des timers"""
@@ -732,8 +943,32 @@ def debug_timers():
             'order_status': order_data.get('status', 'unknown')
         })
     
-    # Utiliser json_util pour sérialiser (car contient des datetime)
-    return Response(json_util.dumps(timers_info), mimetype='application/json')
+    return json_response(timers_info)
+
+@app.route('/debug_positions')
+def debug_positions():
+    """Statistiques du tampon de positions (latence de flush, taille des lots, points fusionnés)"""
+    return jsonify(position_buffer.stats())
+
+@app.route('/debug_events')
+def debug_events():
+    """Abonnés SSE, mémoire de rejeu et reprises (Last-Event-ID, resync)"""
+    return jsonify(event_hub.stats())
+
+@app.route('/debug_outbox')
+def debug_outbox():
+    """File de publication des événements (en attente, lots, nouvelles tentatives)"""
+    return jsonify(event_outbox.stats())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Métriques au format texte de Prometheus (latences par route, commandes MongoDB, flux SSE)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug_cache')
+def debug_cache():
+    """Compteurs du cache restaurants/menus (succès, échecs, évictions, invalidations)"""
+    return jsonify(restaurant_cache.stats())
 
 @app.route('/force_auto_assign/<order_id>', methods=['POST'])
 def force_auto_assign(order_id):
@@ -749,51 +984,32 @@ def force_auto_assign(order_id):
         resto_lon = order_data.get('restaurant_lon', '2.333')
         resto_lat = order_data.get('restaurant_lat', '48.865')
         
-        best_livreur = None
-        best_combined_score = -1
+        ranked = rank_order_candidates(candidates, resto_lon, resto_lat)
         
-        for candidate in candidates:
-            driver_score = get_livreur_score(candidate)
-            driver_pos_doc = positions_col.find_one({"_id": candidate})
-            
-            if driver_pos_doc:
-                driver_lon = driver_pos_doc['location']['coordinates'][0]
-                driver_lat = driver_pos_doc['location']['coordinates'][1]
-                distance = calculate_distance(resto_lon, resto_lat, driver_lon, driver_lat)
-                combined_score = (driver_score ** 2) / (distance + 1)
-                
-                if combined_score > best_combined_score:
-                    best_combined_score = combined_score
-                    best_livreur = candidate
-            else:
-                if driver_score > best_combined_score:
-                    best_combined_score = driver_score
-                    best_livreur = candidate
-        
-        if best_livreur:
+        if ranked:
+            best = ranked[0]
+            best_livreur = best['id']
+            best_combined_score = best['combined_score']
+            timer_scheduler.cancel(order_id)
             orders_col.update_one(
                 {"_id": order_id},
                 {
                     "$set": {"status": "assigned", "assigned_driver": best_livreur},
-                    "$unset": {"candidates": "", "timer": ""}
+                    "$unset": {"candidates": "", "timer": ""},
+                    "$currentDate": {"updated_at": True}
                 }
             )
             
-            distance_info = ""
-            final_driver_score = get_livreur_score(best_livreur)
-            driver_pos_doc = positions_col.find_one({"_id": best_livreur})
-            if driver_pos_doc:
-                driver_lon = driver_pos_doc['location']['coordinates'][0]
-                driver_lat = driver_pos_doc['location']['coordinates'][1]
-                distance = calculate_distance(resto_lon, resto_lat, driver_lon, driver_lat)
-                distance_info = f" (distance: {distance}km)"
+            final_driver_score = best['score']
+            distance_info = f" (distance: {best['distance']}km)" if best['distance'] is not None else ""
 
             publish_event('auto_assignment', {
                 'order_id': order_id,
                 'driver_id': best_livreur,
                 'score': final_driver_score,
                 'distance': distance_info
-            })
+            }, build_routing('auto_assignment', order_id, client=order_data.get('client'),
+                             restaurant=order_data.get('restaurant'), drivers=candidates))
             
             print(f"🤖 [FORCE] Attribution: {order_id} -> {best_livreur}{distance_info}")
 
@@ -817,20 +1033,8 @@ def logout():
 # === FONCTION MODIFIÉE: Ajout du tri ===
 
 def get_client_orders(username):
-    orders_cursor = orders_col.find({"client": username}).sort("created_at", DESCENDING)
-    orders_list = []
-    
-    # Itérer et convertir les dates en string pour le template
-    for order in orders_cursor:
-        if order.get('created_at') and isinstance(order['created_at'], datetime):
-            order['created_at'] = order['created_at'].isoformat()
-            
-        if order.get('rated_at') and isinstance(order['rated_at'], datetime):
-            order['rated_at'] = order['rated_at'].isoformat()
-            
-        orders_list.append(order)
-        
-    return orders_list
+    # Les dates restent des datetime: le template les formate lui-même
+    return list(orders_col.find({"client": username}).sort("created_at", DESCENDING))
 # =============================================================
 # ======================================
 
@@ -869,11 +1073,13 @@ def annuler_commande(order_id):
         if order_data.get('status') == 'assigned':
             return jsonify({'status': 'error', 'message': 'Impossible d\'annuler: un livreur a déjà été assigné'}), 400
         
+        timer_scheduler.cancel(order_id)
         orders_col.update_one(
             {"_id": order_id},
             {
                 "$set": {"status": "cancelled"},
-                "$unset": {"candidates": "", "timer": ""}
+                "$unset": {"candidates": "", "timer": ""},
+                "$currentDate": {"updated_at": True}
             }
         )
         
@@ -881,7 +1087,9 @@ def annuler_commande(order_id):
             'order_id': order_id,
             'client': username,
             'reason': 'Annulé par le client'
-        })
+        }, build_routing('order_cancelled', order_id, client=username,
+                         restaurant=order_data.get('restaurant'),
+                         drivers=order_data.get('candidates', [])))
         
         print(f"❌ Commande {order_id} annulée par {username}")
         return jsonify({'status': 'success'})
@@ -921,7 +1129,7 @@ def noter_livreur(order_id):
             {"$set": {
                 "client_rating": note,
                 "rated_at": datetime.now()
-            }}
+            }, "$currentDate": {"updated_at": True}}
         )
         
         update_livreur_score(livreur_id, float(note))
@@ -931,7 +1139,8 @@ def noter_livreur(order_id):
             'driver_id': livreur_id,
             'rating': note,
             'client': username
-        })
+        }, build_routing('driver_rated', order_id, client=username,
+                         restaurant=order_data.get('restaurant'), drivers=[livreur_id]))
         
         print(f"⭐ Livreur {livreur_id} noté {note}/5 pour la commande {order_id}")
         return jsonify({'status': 'success', 'message': f'Merci! Vous avez noté {livreur_id} avec {note} étoiles'})
@@ -996,57 +1205,82 @@ def get_livreur_stats(livreur_id):
         return jsonify({'status': 'error', 'message': str(e)})
 
 
-def calculate_distance(lon1, lat1, lon2, lat2):
-    """Calcule la distance en km entre deux points GPS"""
+def record_position(livreur_id, data):
+    """Position courante d'un livreur ({longitude, latitude}), écrite en différé"""
+    longitude = data.get('longitude')
+    latitude = data.get('latitude')
+    
+    if not longitude or not latitude:
+        return {'status': 'error', 'message': 'Coordonnées manquantes'}
+    
+    # Écriture et événement différés: le tampon regroupe les points de tous les livreurs
+    position_buffer.update(livreur_id, float(longitude), float(latitude))
+    
+    return {'status': 'success', 'message': 'Position mise à jour'}
+
+@app.route('/update_position', methods=['POST'])
+def update_position():
     try:
-        from math import radians, sin, cos, sqrt, atan2
-        
-        lon1, lat1, lon2, lat2 = map(radians, [float(lon1), float(lat1), float(lon2), float(lat2)])
+        result = record_position(session.get('username'), request.get_json())
+        return jsonify(result), (200 if result['status'] == 'success' else 400)
         
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        radius_earth = 6371
-        
-        return round(radius_earth * c, 2)
     except Exception as e:
-        print(f"Erreur calcul distance: {e}")
-        return float('inf')
+        return jsonify({'status': 'error', 'message': str(e)})
 
-@app.route('/update_position', methods=['POST'])
-def update_position():
+
+# Résolution du trajet conservé: un point par tranche de N secondes
+TRAIL_RESOLUTION_SECONDS = int(os.environ.get('TRAIL_RESOLUTION_SECONDS', 5))
+
+@app.route('/update_positions', methods=['POST'])
+def update_positions():
+    """Reçoit un lot de points horodatés (reconnexion d'un livreur).
+
+    Le dernier point met à jour livreurs_positions, le trajet complet
+    (sous-échantillonné) est ajouté à l'historique.
+    """
+    if session.get('role') != 'livreur':
+        return jsonify({'status': 'error', 'message': 'Non autorisé'}), 401
     try:
-        data = request.get_json()
-        livreur_id = session.get('username')
-        longitude = data.get('longitude')
-        latitude = data.get('latitude')
+        data = request.get_json() or {}
+        livreur_id = session['username']
         
-        if not longitude or not latitude:
-            return jsonify({'status': 'error', 'message': 'Coordonnées manquantes'}), 400
+        try:
+            samples = parse_samples(data.get('samples'))
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({'status': 'error', 'message': f'Points invalides: {e}'}), 400
         
-        position_doc = {
-            "location": {
-                "type": "Point",
-                "coordinates": [float(longitude), float(latitude)]
-            },
-            "updated_at": datetime.now()
-        }
+        stored = record_trail(history_col, livreur_id, samples, TRAIL_RESOLUTION_SECONDS)
         
-        positions_col.update_one(
-            {"_id": livreur_id},
-            {"$set": position_doc},
-            upsert=True
-        )
+        last = samples[-1]
+        position_buffer.update(livreur_id, last['longitude'], last['latitude'], updated_at=last['ts'])
         
-        publish_event('position_updated', {
-            'driver_id': livreur_id,
-            'longitude': longitude,
-            'latitude': latitude
-        })
+        return jsonify({'status': 'success', 'received': len(samples), 'stored': stored})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
+@app.route('/position_history/<livreur_id>')
+def position_history(livreur_id):
+    """Trajet d'un livreur: ?start=<ISO>&end=<ISO>&resolution=<secondes>"""
+    if session.get('role') != 'manager' and session.get('username') != livreur_id:
+        return jsonify({'status': 'error', 'message': 'Non autorisé'}), 401
+    try:
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else datetime.now()
+        start = (datetime.fromisoformat(request.args['start']) if request.args.get('start')
+                 else end - timedelta(hours=1))
+        resolution = int(request.args.get('resolution', 0))
         
-        return jsonify({'status': 'success', 'message': 'Position mise à jour'})
+        trail = get_trail(history_col, livreur_id, start, end, resolution)
         
+        return json_response({
+            'status': 'success',
+            'driver_id': livreur_id,
+            'points': [
+                {'longitude': p['longitude'], 'latitude': p['latitude'], 'timestamp': p['ts']}
+                for p in trail
+            ]
+        })
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
@@ -1055,15 +1289,28 @@ def update_position():
 def get_my_position():
     try:
         livreur_id = session.get('username')
+        
+        # Point pas encore écrit en base
+        pending = position_buffer.latest(livreur_id)
+        if pending:
+            return json_response({
+                'status': 'success',
+                'position': {
+                    "longitude": pending['longitude'],
+                    "latitude": pending['latitude'],
+                    "updated_at": pending['updated_at']
+                }
+            })
+        
         position_doc = positions_col.find_one({"_id": livreur_id})
         
         if position_doc and 'location' in position_doc:
             pos_data = {
                 "longitude": position_doc['location']['coordinates'][0],
                 "latitude": position_doc['location']['coordinates'][1],
-                "updated_at": position_doc.get('updated_at').isoformat() if position_doc.get('updated_at') else None
+                "updated_at": position_doc.get('updated_at')
             }
-            return jsonify({
+            return json_response({
                 'status': 'success',
                 'position': pos_data
             })
@@ -1078,18 +1325,24 @@ def get_my_position():
 
 @app.context_processor
 def utility_processor():
-    def has_candidates(order_id):
-        order = orders_col.find_one({"_id": order_id}, {"candidates": 1})
-        return (order and order.get("candidates"))
+    # Les templates passent le document de la commande déjà chargé par /dashboard:
+    # aucune requête par ligne. Un identifiant seul reste accepté (requête ciblée).
+    def _order_doc(order, field):
+        if isinstance(order, dict):
+            return order
+        return orders_col.find_one({"_id": order}, {field: 1}) or {}
     
-    def get_candidates_count(order_id):
-        order = orders_col.find_one({"_id": order_id}, {"candidates": 1})
-        return len(order.get("candidates", [])) if order else 0
+    def get_candidates_count(order):
+        if isinstance(order, dict) and "candidates_count" in order:
+            return order["candidates_count"]  # Calculé par $size dans la projection
+        return len(_order_doc(order, "candidates").get("candidates", []))
     
-    def get_timer_data(order_id):
-        order = orders_col.find_one({"_id": order_id}, {"timer": 1})
-        # Rendre sérialisable pour Jinja
-        return json.loads(json_util.dumps(order.get("timer"))) if order and order.get("timer") else {}
+    def has_candidates(order):
+        return get_candidates_count(order) > 0
+    
+    def get_timer_data(order):
+        # Le timer ne contient que des chaînes: directement utilisable par Jinja
+        return _order_doc(order, "timer").get("timer") or {}
     
     return {
         'has_candidates': has_candidates,
@@ -1097,7 +1350,54 @@ def utility_processor():
         'get_timer_data': get_timer_data
     }
 
+# === TRANSPORT WEBSOCKET (optionnel) ===
+# WEBSOCKET_TRANSPORT=1: Flask-SocketIO à côté des flux SSE, avec salons par
+# commande, restaurant et livreur ; positions et intérêts sur la même connexion
+socket_transport = None
+if os.environ.get('WEBSOCKET_TRANSPORT') == '1':
+    try:
+        from realtime_ws import SocketTransport
+    except ImportError:  # dépendance optionnelle
+        print("⚠️ Flask-SocketIO non installé: transport WebSocket désactivé")
+    else:
+        socket_transport = SocketTransport(
+            app, event_hub,
+            async_mode=os.environ.get('SOCKETIO_ASYNC_MODE', 'threading'),
+            can_follow=can_follow_order
+        )
+        socket_transport.action('update_position', roles=('livreur',))(record_position)
+        socket_transport.action('montrer_interet', roles=('livreur',))(
+            lambda livreur, data: register_interest(livreur, data.get('order_id'))
+        )
+
+@app.route('/debug_websocket')
+def debug_websocket():
+    """Connexions WebSocket, événements émis vers les salons, actions reçues"""
+    if socket_transport is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(socket_transport.stats(), enabled=True))
+
+def start_background_services():
+    """Démarre les threads de fond du processus (une seule fois, avant de servir)."""
+    # Bus inutilisable (Change Streams sur un mongod seul): arrêt immédiat plutôt que des SSE muets
+    event_bus.check()
+    timer_scheduler.start()
+    if DISPATCH_MODE == 'batch':
+        dispatch_engine.start()
+    event_outbox.start()
+    event_hub.start()
+    position_buffer.start()
+    restaurant_cache.start()
+    menu_index.start()
+    # Ordre inverse à l'arrêt: les positions publient leurs événements avant la dernière écriture de la file
+    atexit.register(event_outbox.stop)
+    atexit.register(position_buffer.stop)
+
 if __name__ == '__main__':
     init_test_users()
+    start_background_services()
     print("🚀 Démarrage du serveur Flask sur http://127.0.0.1:5000")
-    app.run(debug=True, port=5000, threaded=True)
+    if socket_transport is not None:
+        socket_transport.socketio.run(app, debug=True, port=5000)
+    else:
+        app.run(debug=True, port=5000, threaded=True)
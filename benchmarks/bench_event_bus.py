@@ -0,0 +1,133 @@
+"""Débit et latence des bus d'événements (event_bus.py): memory, redis, changestream.
+
+Pour chaque bus: débit en écrivant --events événements par lots de --batch
+(comme l'EventOutbox) jusqu'à leur réception, puis latence publication ->
+réception d'événements isolés à --rate par seconde. Un bus indisponible
+(Redis arrêté, MongoDB sans replica set) est signalé et ignoré.
+
+    python -m benchmarks.bench_event_bus --backends memory,redis,changestream \\
+        --redis-url redis://localhost:6379/0 --mongo-uri mongodb://localhost:27017/?replicaSet=rs0
+"""
+import argparse
+import threading
+import time
+from datetime import datetime
+
+from event_bus import create_bus
+from event_hub import build_routing
+from events import build_event
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def make_event(i):
+    event = build_event('order_created', {'order_id': f"{i:08x}", 'sent': time.perf_counter(),
+                                          'fields': {'client': 'client1', 'restaurant': 'restaurant1',
+                                                     'restaurant_name': 'Restaurant 1', 'status': 'pending',
+                                                     'articles': '1x Pizza Reine, 2x Coca-Cola',
+                                                     'total_price': 18.5}},
+                        build_routing('order_created', f"{i:08x}", client='client1', restaurant='restaurant1'))
+    event['timestamp'] = datetime.now()
+    return event
+
+
+class Receiver:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.received = 0
+        self.latencies = []
+        self.ready = threading.Event()
+
+    def on_event(self, doc):
+        now = time.perf_counter()
+        with self.cond:
+            self.received += 1
+            self.latencies.append((now - doc['data']['sent']) * 1000)
+            self.cond.notify_all()
+
+    def wait_for(self, count, timeout):
+        with self.cond:
+            return self.cond.wait_for(lambda: self.received >= count, timeout)
+
+
+def open_bus(kind, args):
+    events_col = None
+    if kind == 'changestream':
+        from pymongo import MongoClient
+        db = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=3000)['delivery_bench']
+        db.drop_collection('events')
+        db.create_collection('events', capped=True, size=64 * 1024 * 1024)
+        events_col = db['events']
+    return create_bus(kind, events_col=events_col, redis_url=args.redis_url)
+
+
+def run(kind, args):
+    try:
+        bus = open_bus(kind, args)
+        if kind == 'redis':
+            bus.redis.ping()
+    except Exception as e:
+        print(f"{kind:<13} | indisponible ({type(e).__name__}): {str(e)[:80]}")
+        return
+
+    receiver = Receiver()
+    threading.Thread(target=bus.listen, args=(receiver.on_event,),
+                     kwargs={'on_ready': receiver.ready.set}, daemon=True).start()
+    if not receiver.ready.wait(10):
+        print(f"{kind:<13} | réception non ouverte")
+        return
+    time.sleep(0.2)
+
+    # Débit: lots ordonnés, comme le thread de l'EventOutbox
+    events = [make_event(i) for i in range(args.events)]
+    start = time.perf_counter()
+    for offset in range(0, len(events), args.batch):
+        batch = events[offset:offset + args.batch]
+        now = time.perf_counter()
+        for event in batch:
+            event['data']['sent'] = now
+        bus.write(batch)
+    written = time.perf_counter() - start
+    if not receiver.wait_for(args.events, 60):
+        print(f"{kind:<13} | {receiver.received}/{args.events} événements reçus")
+        return
+    total = time.perf_counter() - start
+
+    # Latence: événements isolés à cadence fixe
+    with receiver.cond:
+        receiver.latencies = []
+    target = receiver.received + args.samples
+    next_at = time.perf_counter()
+    for i in range(args.samples):
+        next_at += 1.0 / args.rate
+        time.sleep(max(0, next_at - time.perf_counter()))
+        event = make_event(args.events + i)
+        event['data']['sent'] = time.perf_counter()
+        bus.write([event])
+    receiver.wait_for(target, 30)
+    lat = receiver.latencies
+
+    print(f"{kind:<13} | écriture {args.events / written:9.0f} év/s | bout en bout {args.events / total:9.0f} év/s "
+          f"| latence p50 {percentile(lat, 50):6.2f} ms  p99 {percentile(lat, 99):6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default='memory,redis,changestream')
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--samples', type=int, default=2000, help="événements isolés pour la latence")
+    parser.add_argument('--rate', type=float, default=500.0, help="cadence des événements isolés (/s)")
+    parser.add_argument('--redis-url', default='redis://localhost:6379/0')
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/?replicaSet=rs0')
+    args = parser.parse_args()
+
+    for kind in args.backends.split(','):
+        run(kind.strip(), args)
+
+
+if __name__ == '__main__':
+    main()
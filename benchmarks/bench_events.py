@@ -0,0 +1,112 @@
+"""Taille et coût de construction des événements: ancien format (v1) contre schéma compact (v2).
+
+v1 embarque le document de commande complet (aller-retour json_util) dans
+order_created et order_ready ; v2 n'envoie que les identifiants et les
+champs modifiés. Pas de MongoDB: les commandes sont générées.
+
+    python -m benchmarks.bench_events --events 20000
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+import bson
+from bson import json_util
+
+from event_hub import build_routing
+from events import build_event, order_fields
+
+CAPPED_SIZE = 10 * 1024 * 1024  # taille de la collection 'events'
+
+
+def make_order(rng, i):
+    now = datetime.now()
+    items = [f"{rng.randint(1, 3)}x {rng.choice(['Pizza Reine', 'Burger BBQ', 'Salade César', 'Tiramisu', 'Coca-Cola'])}"
+             for _ in range(rng.randint(1, 4))]
+    return {
+        "_id": f"{i:08x}",
+        "id": f"{i:08x}",
+        "client": f"client{rng.randint(1, 500)}",
+        "restaurant": f"resto{rng.randint(1, 200)}",
+        "restaurant_name": f"Restaurant {rng.randint(1, 200)}",
+        "restaurant_lon": str(2.35 + rng.gauss(0, 0.05)),
+        "restaurant_lat": str(48.86 + rng.gauss(0, 0.03)),
+        "articles": ", ".join(items),
+        "total_price": round(rng.uniform(8, 60), 2),
+        "status": "ready",
+        "created_at": now,
+        "updated_at": now,
+        "timer": {
+            "type": "acceptance_window",
+            "expires_at": (now + timedelta(seconds=60)).isoformat(),
+            "status": "active",
+            "created_at": now.isoformat()
+        }
+    }
+
+
+def v1_events(order):
+    """Format d'origine: document complet sérialisé puis désérialisé."""
+    routing = build_routing('order_created', order['_id'], client=order['client'], restaurant=order['restaurant'])
+    full = json.loads(json_util.dumps(order))
+    created = {'type': 'order_created', 'data': {'order_id': order['_id'], 'details': full},
+               'routing': routing, 'timestamp': datetime.now()}
+    ready = {'type': 'order_ready', 'data': {'order_id': order['_id'],
+                                             'expires_at': order['timer']['expires_at'],
+                                             'order_data': json.loads(json_util.dumps(order))},
+             'routing': routing, 'timestamp': datetime.now()}
+    return created, ready
+
+
+def v2_events(order):
+    routing = build_routing('order_created', order['_id'], client=order['client'], restaurant=order['restaurant'])
+    created = build_event('order_created', {'order_id': order['_id'], 'fields': order_fields(order)}, routing)
+    fields = order_fields(order)
+    fields['status'] = 'ready'
+    ready = build_event('order_ready', {'order_id': order['_id'], 'expires_at': order['timer']['expires_at'],
+                                        'fields': fields}, routing)
+    return created, ready
+
+
+def sse_frame(event):
+    visible = {k: v for k, v in event.items() if k not in ('_id', 'routing')}
+    return "data: {}\n\n".format(json_util.dumps(visible))
+
+
+def measure(name, builder, orders):
+    start = time.perf_counter()
+    events = [e for order in orders for e in builder(order)]
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    stored = [len(bson.encode(e)) for e in events]
+    frames = [len(sse_frame(e).encode()) for e in events]
+    encode_s = time.perf_counter() - start
+
+    avg_stored = sum(stored) / len(stored)
+    avg_frame = sum(frames) / len(frames)
+    print(f"{name:<4} | BSON moyen: {avg_stored:6.0f} o | trame SSE moyenne: {avg_frame:6.0f} o "
+          f"| événements dans 10 Mo: {int(CAPPED_SIZE / avg_stored):7d} "
+          f"| construction: {len(events) / build_s:9.0f} év/s | encodage: {len(events) / encode_s:9.0f} év/s")
+    return avg_stored, avg_frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--events', type=int, default=20000, help="paires order_created + order_ready")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    orders = [make_order(rng, i) for i in range(args.events)]
+
+    v1_stored, v1_frame = measure('v1', v1_events, orders)
+    v2_stored, v2_frame = measure('v2', v2_events, orders)
+    print(f"Gain: stockage x{v1_stored / v2_stored:.1f}, bande passante SSE x{v1_frame / v2_frame:.1f} "
+          f"(fenêtre de rejeu de la collection plafonnée multipliée d'autant)")
+
+
+if __name__ == '__main__':
+    main()
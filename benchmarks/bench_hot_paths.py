@@ -0,0 +1,242 @@
+"""Micro-benchmarks des chemins chauds de app_mongo, avec comparaison à une référence.
+
+Mesure, sur des données déterministes (graine --seed): haversine_many
+(distances des candidats), le classement des candidats d'une commande,
+update_livreur_score, le rendu des tableaux de bord client et restaurant
+à 1 000 et 10 000 commandes (et d'une page manager), la route /dashboard
+d'un client, les trames SSE de /events et init_test_users (premier
+chargement et relance).
+
+MongoDB: par défaut une base en mémoire (pip install mongomock), sinon un
+mongod jetable via --mongo-uri ; la base delivery_bench y est recréée puis
+supprimée. Les résultats (µs par appel) s'écrivent en JSON (--output) et
+sont comparés à --baseline: code de sortie 1 si le minimum d'une mesure
+dépasse celui de la référence de plus de --tolerance. Comparer sur la même machine et avec le
+même MongoDB que la référence.
+
+    python -m benchmarks.bench_hot_paths
+    python -m benchmarks.bench_hot_paths --mongo-uri mongodb://localhost:27017/ --output hot_paths.json
+    python -m benchmarks.bench_hot_paths --save-baseline
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from benchmarks import harness
+from candidates import haversine_many
+
+BENCH_DB = 'delivery_bench'
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline_hot_paths.json')
+STATUSES = ['pending', 'ready', 'assigned', 'delivered']
+
+
+def load_app(mongo_uri):
+    """Importe app_mongo sur la base de benchmark (sans démarrer ses threads)."""
+    os.environ['MONGO_DB'] = BENCH_DB
+    os.environ.setdefault('EVENT_BUS', 'memory')
+    if mongo_uri == 'memory':
+        from testing_db import install_memory_client
+        install_memory_client(BENCH_DB)
+    else:
+        from pymongo import MongoClient
+        MongoClient(mongo_uri).drop_database(BENCH_DB)
+        os.environ['MONGO_URI'] = mongo_uri
+    import app_mongo
+    return app_mongo
+
+
+def make_dataset(rng, n_clients, n_drivers, n_restaurants, n_items):
+    """Fichier d'initialisation au format de donnees_fusionnees_avec_menus.json."""
+    password_hash = '8d969eef6ecad3c29a3a629280e686cf0c3f5d5a86aff3ca12020c923adc6c92'  # 123456
+    return {
+        'utilisateurs': [{'username': f"client{i}", 'password_hash': password_hash, 'role': 'client'}
+                         for i in range(1, n_clients + 1)],
+        'livreurs': [{'username': f"livreur{i}", 'password_hash': password_hash, 'role': 'livreur',
+                      'livreur': {'avg_rating': round(rng.uniform(3.0, 5.0), 2)}}
+                     for i in range(1, n_drivers + 1)],
+        'restaurants': [{'username': f"restaurant{i}", 'password_hash': password_hash, 'role': 'restaurant',
+                         'restaurant': {
+                             'nom': f"Restaurant {i}",
+                             'longitude': 2.35 + rng.gauss(0, 0.05),
+                             'latitude': 48.86 + rng.gauss(0, 0.03),
+                             'menu': [{'nom_article': f"Article {j}", 'prix': round(rng.uniform(3, 25), 2)}
+                                      for j in range(n_items)]
+                         }}
+                        for i in range(1, n_restaurants + 1)]
+    }
+
+
+def make_orders(rng, count, client, restaurant, drivers):
+    now = datetime.now()
+    orders = []
+    for i in range(count):
+        status = rng.choice(STATUSES)
+        order_id = f"{client[:3]}{i:07d}"
+        order = {
+            '_id': order_id,
+            'id': order_id,
+            'client': client,
+            'restaurant': restaurant,
+            'restaurant_name': 'Restaurant 1',
+            'restaurant_lon': '2.35',
+            'restaurant_lat': '48.86',
+            'articles': '1x Article 1, 2x Article 7',
+            'total_price': round(rng.uniform(10, 60), 2),
+            'status': status,
+            'created_at': now - timedelta(seconds=i),
+            'updated_at': now - timedelta(seconds=i)
+        }
+        if status in ('assigned', 'delivered'):
+            order['assigned_driver'] = rng.choice(drivers)
+        if status == 'delivered' and rng.random() < 0.5:
+            order['client_rating'] = rng.randint(1, 5)
+        orders.append(order)
+    return orders
+
+
+def scale(result, count):
+    """Résultat d'un lot de 'count' appels ramené à un appel."""
+    if count == 1:
+        return result
+    return dict(result, median_us=round(result['median_us'] / count, 3), min_us=round(result['min_us'] / count, 3),
+                p95_us=round(result['p95_us'] / count, 3), number=result['number'] * count)
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    app_mongo = load_app(args.mongo_uri)
+    app = app_mongo.app
+    results = {}
+
+    def bench(name, fn, number=1, repeat=args.repeat, warmup=args.warmup, setup=None, batch=1):
+        # batch: appels effectués par fn(), pour un résultat par appel
+        results[name] = scale(harness.measure(fn, number=number, repeat=repeat, warmup=warmup, setup=setup), batch)
+        print(f"{name:<42} {results[name]['median_us']:12.1f} µs", file=sys.stderr)
+
+    # --- Données ---
+    dataset = make_dataset(rng, args.clients, args.drivers, args.restaurants, args.items)
+    drivers = [d['username'] for d in dataset['livreurs']]
+    data_dir = tempfile.mkdtemp(prefix='bench_hot_paths_')
+    data_path = os.path.join(data_dir, 'donnees.json')
+    with open(data_path, 'w', encoding='utf-8') as f:
+        json.dump(dataset, f)
+
+    def reset_users():
+        for col in (app_mongo.users_col, app_mongo.stats_col, app_mongo.restaurants_col):
+            col.delete_many({})
+
+    bench('init_test_users (premier chargement)', lambda: app_mongo.init_test_users(data_path),
+          repeat=3, warmup=0, setup=reset_users)
+    bench('init_test_users (relance)', lambda: app_mongo.init_test_users(data_path), repeat=3, warmup=1)
+
+    app_mongo.positions_col.insert_many([
+        {'_id': d, 'location': {'type': 'Point',
+                                'coordinates': [2.35 + rng.gauss(0, 0.05), 48.86 + rng.gauss(0, 0.03)]},
+         'updated_at': datetime.now()}
+        for d in drivers
+    ])
+    orders_1k = make_orders(rng, 1000, 'client1', 'restaurant1', drivers)
+    orders_10k = make_orders(rng, 10000, 'client2', 'restaurant2', drivers)
+    app_mongo.orders_col.insert_many(orders_1k)
+
+    # --- Fonctions ---
+    points = [(2.35 + rng.gauss(0, 0.05), 48.86 + rng.gauss(0, 0.03)) for _ in range(1000)]
+    bench('haversine_many (par point)', lambda: haversine_many(2.35, 48.86, points),
+          number=10, batch=len(points))
+
+    candidates = rng.sample(drivers, min(20, len(drivers)))
+    bench('rank_order_candidates (20 candidats)',
+          lambda: app_mongo.rank_order_candidates(candidates, '2.35', '48.86'), number=10)
+
+    rated = iter(range(10 ** 9))
+    bench('update_livreur_score',
+          lambda: app_mongo.update_livreur_score(drivers[next(rated) % len(drivers)], rng.randint(1, 5)),
+          number=50)
+
+    # --- Trames SSE (/events) ---
+    created = app_mongo.build_event('order_created', {
+        'order_id': 'cli0000001', 'fields': app_mongo.order_fields(orders_1k[0])
+    }, app_mongo.build_routing('order_created', 'cli0000001', client='client1', restaurant='restaurant1'))
+    ready = app_mongo.build_event('order_ready', {
+        'order_id': 'cli0000001', 'expires_at': datetime.now().isoformat(),
+        'fields': app_mongo.order_fields(orders_1k[0])
+    }, app_mongo.build_routing('order_ready', 'cli0000001', client='client1', restaurant='restaurant1'))
+    for event in (created, ready):
+        event.pop('routing')
+    bench('sse_frame order_created', lambda: app_mongo.sse_frame(created, '6ad4939d5e6d9420113725f3'),
+          number=1000)
+    bench('sse_frame order_ready', lambda: app_mongo.sse_frame(ready, '6ad4939d5e6d9420113725f3'),
+          number=1000)
+
+    # --- Rendu des tableaux de bord ---
+    from flask import render_template
+    with app.test_request_context('/dashboard'):
+        for orders in (orders_1k, orders_10k):
+            n = len(orders)
+            repeat = args.repeat if n <= 1000 else max(3, args.repeat // 2)
+            bench(f"rendu client_simple ({n} commandes)",
+                  lambda: render_template('client_simple.html', username='client1', orders=orders,
+                                          sync_version=0), repeat=repeat)
+            active = [o for o in orders if o['status'] in ('pending', 'ready', 'assigned')]
+            bench(f"rendu restaurant_simple ({n} commandes)",
+                  lambda: render_template('restaurant_simple.html', username='Restaurant 1', orders=active,
+                                          sync_version=0), repeat=repeat)
+        page = orders_1k[:app_mongo.MANAGER_PAGE_SIZE]
+        bench('rendu manager_simple (1 page)',
+              lambda: render_template('manager_simple.html', username='manager1', all_orders=page,
+                                      next_cursor=None, status_filter='', restaurant_filter='',
+                                      sync_version=0, get_livreur_score=app_mongo.get_livreur_score),
+              number=10)
+
+    # --- Route complète: lecture des commandes et rendu ---
+    test_client = app.test_client()
+    with test_client.session_transaction() as session:
+        session['username'] = 'client1'
+        session['role'] = 'client'
+    bench('route /dashboard client (1000 commandes)', lambda: test_client.get('/dashboard'))
+
+    app_mongo.client.drop_database(BENCH_DB)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default='memory', help="'memory' (mongomock) ou URI d'un mongod jetable")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--drivers', type=int, default=200)
+    parser.add_argument('--restaurants', type=int, default=200)
+    parser.add_argument('--items', type=int, default=20, help="articles par menu")
+    parser.add_argument('--output', help="fichier JSON des résultats")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.3, help="écart toléré sur le minimum (0.3 = +30 %%)")
+    parser.add_argument('--save-baseline', action='store_true', help="enregistrer les résultats comme référence")
+    args = parser.parse_args()
+
+    results = run(args)
+    env = harness.environment(mongo='memory' if args.mongo_uri == 'memory' else 'mongod', seed=args.seed)
+    if args.output:
+        harness.save(args.output, results, env)
+    if args.save_baseline:
+        harness.save(args.baseline, results, env)
+        print(f"Référence enregistrée dans {args.baseline}")
+        return
+
+    baseline = harness.load(args.baseline)
+    if baseline and baseline.get('environment', {}).get('mongo') != env['mongo']:
+        print(f"⚠️ Référence mesurée avec mongo={baseline['environment'].get('mongo')}: comparaison indicative")
+    rows, regressions = harness.compare(results, baseline, args.tolerance)
+    harness.print_table(rows)
+    if regressions and baseline and baseline.get('environment', {}).get('mongo') == env['mongo']:
+        print(f"❌ {regressions} régression(s) au-delà de {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
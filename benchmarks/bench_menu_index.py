@@ -0,0 +1,99 @@
+"""Empreinte mémoire et latence de l'index des menus sur un catalogue synthétique.
+
+Pas de MongoDB: les restaurants sont générés puis ajoutés avec bulk_add().
+
+    python -m benchmarks.bench_menu_index --restaurants 50000 --items 40
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from menu_index import MenuIndex
+
+DISHES = ["pizza", "burger", "salade", "tacos", "sushi", "maki", "ramen", "pho", "curry",
+          "couscous", "tajine", "kebab", "wrap", "panini", "croque", "quiche", "lasagnes",
+          "risotto", "gnocchi", "bagel", "poke", "bibimbap", "falafel", "houmous", "crepe",
+          "gaufre", "tiramisu", "brownie", "cookie", "muffin", "donut", "smoothie", "limonade"]
+VARIANTS = ["margherita", "reine", "4 fromages", "végétarienne", "poulet", "boeuf", "saumon",
+            "thon", "chèvre miel", "épicée", "classique", "royale", "du chef", "maison",
+            "truffe", "bbq", "caesar", "teriyaki", "tikka", "coco", "chocolat", "vanille",
+            "caramel", "citron", "fraise", "mangue", "menthe", "pistache", "avocat", "canard"]
+SIZES = ["", "", "", " petite", " moyenne", " grande", " XL", " menu"]
+NAMES = ["Chez", "Le", "La", "Aux", "Bistro", "Café", "Comptoir", "Maison", "Atelier", "Kitchen"]
+PLACES = ["Paris", "Montmartre", "Bastille", "Marais", "Opéra", "Belleville", "Nation",
+          "République", "Pigalle", "Odéon", "Italie", "Tokyo", "Saigon", "Beyrouth", "Lisbonne"]
+QUERIES = ["pi", "pizz", "pizza ma", "sushi sau", "burger bbq", "tir", "chez", "maison tr",
+           "curry co", "xyzzy", "crêpe choc", "ramen", "pho bo", "lasagnes", "s"]
+
+
+def generate(n_restaurants, n_items, seed):
+    rng = random.Random(seed)
+    for r in range(n_restaurants):
+        name = f"{rng.choice(NAMES)} {rng.choice(PLACES)} {rng.choice(DISHES).title()} {r}"
+        items = []
+        for _ in range(n_items):
+            label = f"{rng.choice(DISHES).title()} {rng.choice(VARIANTS)}{rng.choice(SIZES)}"
+            items.append((label, round(rng.uniform(3, 30), 2)))
+        yield f"resto{r}", name, items
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--restaurants', type=int, default=50000)
+    parser.add_argument('--items', type=int, default=40, help="articles par restaurant")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=200, help="exécutions par requête")
+    args = parser.parse_args()
+
+    # Les données générées sont matérialisées avant la mesure: seul l'index est compté
+    catalogue = list(generate(args.restaurants, args.items, args.seed))
+    gc.collect()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = MenuIndex(restaurants_col=None)
+    index.bulk_add(catalogue)
+    build_time = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Les noms (restaurants, articles) appartiennent au catalogue: on ajoute leur taille
+    strings = sum(len(s.encode()) + 49 for s in index.strings)
+    strings += sum(len(s.encode()) + 49 for s in index.names if s)
+    stats = index.stats()
+    print(f"Catalogue: {stats['restaurants']} restaurants, {stats['items']} articles, "
+          f"{stats['distinct_item_names']} noms d'articles distincts, {stats['terms']} termes, "
+          f"{stats['postings']} entrées")
+    print(f"Construction: {build_time:.1f} s | mémoire index: {current / 2**20:.0f} Mo "
+          f"(+ {strings / 2**20:.0f} Mo de noms) | pic: {peak / 2**20:.0f} Mo")
+
+    # Les millions d'objets du catalogue ne doivent pas peser sur les mesures via le GC
+    gc.collect()
+    gc.freeze()
+
+    print(f"{'requête':<14} {'résultats':>9} {'p50 µs':>9} {'p99 µs':>9} {'suggest p50 µs':>15}")
+    for query in QUERIES:
+        index.search(query)  # échauffement
+        timings = []
+        suggest_timings = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            results = index.search(query)
+            t1 = time.perf_counter()
+            index.suggest(query)
+            t2 = time.perf_counter()
+            timings.append((t1 - t0) * 1e6)
+            suggest_timings.append((t2 - t1) * 1e6)
+        print(f"{query:<14} {len(results):>9} {percentile(timings, 50):>9.0f} "
+              f"{percentile(timings, 99):>9.0f} {percentile(suggest_timings, 50):>15.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Coût de sérialisation JSON des commandes: json_util contre serializer.dumps.
+
+Compare les chemins d'origine (aller-retour json.loads(json_util.dumps(doc))
+puis jsonify, json_util.dumps seul pour les trames SSE, isoformat() champ
+par champ) à la sérialisation en une passe, avec orjson et avec le module
+json standard. Pas de MongoDB: les commandes sont générées.
+
+    python -m benchmarks.bench_serializer --orders 20000
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId, json_util
+
+import serializer
+
+
+def make_order(rng, i):
+    now = datetime.now()
+    items = [f"{rng.randint(1, 3)}x {rng.choice(['Pizza Reine', 'Burger BBQ', 'Salade César', 'Tiramisu'])}"
+             for _ in range(rng.randint(1, 4))]
+    return {
+        "_id": ObjectId(),
+        "client": f"client{rng.randint(1, 500)}",
+        "restaurant": f"resto{rng.randint(1, 200)}",
+        "restaurant_name": f"Restaurant {rng.randint(1, 200)}",
+        "articles": ", ".join(items),
+        "total_price": round(rng.uniform(8, 60), 2),
+        "status": "ready",
+        "created_at": now,
+        "updated_at": now,
+        "timer": {
+            "type": "acceptance_window",
+            "expires_at": now + timedelta(seconds=60),
+            "status": "active",
+            "created_at": now
+        },
+        "candidates": [{"livreur": f"livreur{rng.randint(1, 100)}", "distance_km": round(rng.uniform(0.1, 5), 2),
+                        "applied_at": now} for _ in range(rng.randint(0, 5))]
+    }
+
+
+def roundtrip(doc):
+    """Chemin d'origine des réponses API: aller-retour json_util puis jsonify."""
+    return json.dumps(json.loads(json_util.dumps(doc))).encode()
+
+
+def json_util_frame(doc):
+    """Chemin d'origine des trames SSE."""
+    return json_util.dumps(doc).encode()
+
+
+def isoformat_fields(doc):
+    """Chemin d'origine de get_client_orders: conversion champ par champ puis jsonify."""
+    doc = dict(doc)
+    doc['_id'] = str(doc['_id'])
+    for key in ('created_at', 'updated_at'):
+        doc[key] = doc[key].isoformat()
+    doc['timer'] = {k: v.isoformat() if isinstance(v, datetime) else v for k, v in doc['timer'].items()}
+    doc['candidates'] = [{k: v.isoformat() if isinstance(v, datetime) else v for k, v in c.items()}
+                         for c in doc['candidates']]
+    return json.dumps(doc).encode()
+
+
+def stdlib_dumps(doc, _encoder=json.JSONEncoder(default=serializer._default_std, separators=(',', ':'),
+                                                 ensure_ascii=False)):
+    return _encoder.encode(doc).encode()
+
+
+def measure(fn, orders, repeat):
+    fn(orders[0])  # échauffement
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for doc in orders:
+            fn(doc)
+        best = min(best, time.perf_counter() - start)
+    return best / len(orders) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    orders = [make_order(rng, i) for i in range(args.orders)]
+
+    paths = [
+        ('json_util aller-retour + jsonify', roundtrip),
+        ('json_util.dumps (SSE)', json_util_frame),
+        ('isoformat() + jsonify', isoformat_fields),
+        ('serializer, json standard', stdlib_dumps),
+    ]
+    if serializer.orjson is not None:
+        paths.append(('serializer, orjson', serializer.dumps))
+    else:
+        print("orjson non installé: seul le repli json standard est mesuré")
+
+    reference = None
+    print(f"{'chemin':<34} {'µs/doc':>8} {'octets':>7} {'gain':>6}")
+    for name, fn in paths:
+        per_doc = measure(fn, orders, args.repeat)
+        size = sum(len(fn(doc)) for doc in orders[:1000]) / min(1000, len(orders))
+        reference = reference or per_doc
+        print(f"{name:<34} {per_doc:>8.1f} {size:>7.0f} {reference / per_doc:>5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Mesure répétable et comparaison à une référence, pour les micro-benchmarks.
+
+Chaque mesure exécute la fonction 'warmup' fois sans chronométrer, puis
+'repeat' répétitions de 'number' appels ; le résultat est donné par appel
+(médiane, minimum, p95 des répétitions). Les résultats s'écrivent en JSON
+et se comparent à un fichier de référence sur le minimum, le moins
+sensible aux autres processus (régression s'il dépasse celui de la
+référence de plus de 'tolerance').
+"""
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+
+
+def measure(fn, number=1, repeat=7, warmup=1, setup=None):
+    """Temps par appel de fn() en microsecondes: {median_us, min_us, p95_us, number, repeat}.
+
+    setup() est appelé avant chaque répétition, hors chronométrage. Les
+    print() de la fonction mesurée sont supprimés.
+    """
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(warmup + repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            elapsed = time.perf_counter() - start
+            if i >= warmup:
+                timings.append(elapsed / number * 1e6)
+    timings.sort()
+    return {
+        'median_us': round(timings[len(timings) // 2], 3),
+        'min_us': round(timings[0], 3),
+        'p95_us': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'number': number,
+        'repeat': repeat
+    }
+
+
+def environment(**extra):
+    """Contexte des mesures, enregistré avec les résultats."""
+    return dict({
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'date': datetime.now().isoformat(timespec='seconds')
+    }, **extra)
+
+
+def save(path, results, env):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'environment': env, 'results': results}, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+
+
+def load(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def compare(results, baseline, tolerance=0.2, metric='min_us'):
+    """Lignes de comparaison {name, value_us, baseline_us, ratio, status} et nombre de régressions."""
+    reference = baseline.get('results', {}) if baseline else {}
+    rows = []
+    regressions = 0
+    for name, result in results.items():
+        base = reference.get(name)
+        if not base:
+            rows.append({'name': name, 'value_us': result[metric], 'baseline_us': None,
+                         'ratio': None, 'status': 'nouveau'})
+            continue
+        ratio = result[metric] / base[metric] if base[metric] else 1.0
+        if ratio > 1 + tolerance:
+            status = 'régression'
+            regressions += 1
+        elif ratio < 1 - tolerance:
+            status = 'amélioration'
+        else:
+            status = 'stable'
+        rows.append({'name': name, 'value_us': result[metric], 'baseline_us': base[metric],
+                     'ratio': round(ratio, 3), 'status': status})
+    return rows, regressions
+
+
+def print_table(rows, out=sys.stdout):
+    print(f"{'Mesure':<42} {'minimum':>12} {'référence':>12} {'ratio':>7}  statut", file=out)
+    for row in rows:
+        baseline = f"{row['baseline_us']:10.1f}µs" if row['baseline_us'] is not None else f"{'-':>12}"
+        ratio = f"{row['ratio']:7.2f}" if row['ratio'] is not None else f"{'-':>7}"
+        print(f"{row['name']:<42} {row['value_us']:10.1f}µs {baseline} {ratio}  {row['status']}", file=out)
@@ -0,0 +1,215 @@
+"""Test d'endurance des flux SSE contre un serveur lancé avec serve.py.
+
+Ouvre --streams connexions /events (green threads eventlet, une session
+manager partagée), puis, une fois toutes ouvertes, publie des commandes
+à --rate par seconde pendant --duration secondes et mesure le retard de livraison (réception moins
+'timestamp' de l'événement: client et serveur sur la même horloge).
+Une connexion coupée se reconnecte avec Last-Event-ID et compte comme
+déconnexion.
+
+Critères (code de sortie 1 si non atteints): toutes les connexions
+ouvertes, aucune déconnexion, aucun événement manqué, retard p99 sous
+--max-lag-ms.
+
+    ulimit -n 20000
+    python -m benchmarks.soak_sse --host 127.0.0.1:5000 --streams 10000 --duration 600
+"""
+import eventlet
+
+eventlet.monkey_patch()
+
+import argparse
+import http.client
+import json
+import resource
+import sys
+import time
+import urllib.parse
+from datetime import datetime
+
+
+class Stats:
+    def __init__(self):
+        self.connected = 0
+        self.opened = 0
+        self.failed = 0
+        self.disconnects = 0
+        self.frames = 0
+        self.resyncs = 0
+        self.lags = []      # retards depuis le dernier rapport
+        self.all_lags = []
+        self.seen = {}      # order_id -> nombre de flux qui ont reçu order_created
+        self.published = []
+        self.stop_at = float('inf')        # fin des flux
+        self.publish_until = float('inf')  # fin de la publication
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def login(host, username, password, role):
+    conn = http.client.HTTPConnection(host, timeout=30)
+    body = urllib.parse.urlencode({'username': username, 'password': password, 'role': role})
+    conn.request('POST', '/login', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie')
+    if response.status != 302 or not cookie:
+        sys.exit(f"❌ Connexion de {username} impossible ({response.status})")
+    return cookie.split(';', 1)[0]
+
+
+def stream(host, cookie, stats):
+    """Une connexion /events, reprise avec Last-Event-ID si elle tombe."""
+    last_event_id = None
+    first = True
+    while time.time() < stats.stop_at:
+        headers = {'Cookie': cookie, 'Accept': 'text/event-stream'}
+        if last_event_id:
+            headers['Last-Event-ID'] = last_event_id
+        try:
+            conn = http.client.HTTPConnection(host, timeout=60)
+            conn.request('GET', '/events', headers=headers)
+            response = conn.getresponse()
+            if response.status != 200:
+                raise ConnectionError(f"HTTP {response.status}")
+        except Exception:
+            if first:
+                stats.failed += 1
+                return
+            eventlet.sleep(1)
+            continue
+
+        if first:
+            stats.opened += 1
+            first = False
+        stats.connected += 1
+        try:
+            event_id = None
+            while time.time() < stats.stop_at:
+                line = response.readline()  # décode aussi le transfert par morceaux
+                if not line:
+                    break
+                if line.startswith(b'id: '):
+                    event_id = line[4:].strip().decode()
+                elif line.startswith(b'data: '):
+                    handle(json.loads(line[6:]), stats)
+                    if event_id:
+                        last_event_id = event_id
+                    event_id = None
+        except Exception:
+            pass
+        finally:
+            stats.connected -= 1
+            conn.close()
+        if time.time() < stats.stop_at:
+            stats.disconnects += 1
+
+
+def handle(event, stats):
+    stats.frames += 1
+    event_type = event.get('type')
+    if event_type == 'resync':
+        stats.resyncs += 1
+    if event_type != 'order_created':
+        return
+    sent = datetime.fromisoformat(event['timestamp'])
+    stats.lags.append((datetime.now() - sent).total_seconds() * 1000)
+    order_id = event['data']['order_id']
+    stats.seen[order_id] = stats.seen.get(order_id, 0) + 1
+
+
+def publisher(host, cookie, restaurant, rate, stats):
+    """Crée des commandes à cadence fixe jusqu'à la fin du test."""
+    payload = json.dumps({'restaurant_id': restaurant,
+                          'items': [{'item': 'Pizza', 'quantity': 1, 'price': 12.0}]})
+    conn = http.client.HTTPConnection(host, timeout=30)
+    next_at = time.time()
+    while next_at < stats.publish_until:
+        eventlet.sleep(max(0, next_at - time.time()))
+        next_at += 1.0 / rate
+        try:
+            conn.request('POST', '/passer_commande', payload,
+                         {'Cookie': cookie, 'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            body = json.loads(response.read() or b'{}')
+            if body.get('order_id'):
+                stats.published.append(body['order_id'])
+        except Exception as e:
+            print(f"Erreur publication: {e}")
+            conn.close()
+            conn = http.client.HTTPConnection(host, timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1:5000')
+    parser.add_argument('--streams', type=int, default=10000)
+    parser.add_argument('--ramp', type=int, default=500, help="nouvelles connexions par seconde")
+    parser.add_argument('--duration', type=int, default=600, help="secondes, une fois tous les flux ouverts")
+    parser.add_argument('--rate', type=float, default=2.0, help="commandes publiées par seconde")
+    parser.add_argument('--max-lag-ms', type=float, default=3000.0,
+                        help="retard p99 maximal d'un événement diffusé à tous les flux")
+    parser.add_argument('--manager', default='manager1')
+    parser.add_argument('--client', default='client1')
+    parser.add_argument('--restaurant', default='restaurant1')
+    parser.add_argument('--password', default='123456')
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < args.streams + 100:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, args.streams + 100), hard))
+
+    manager_cookie = login(args.host, args.manager, args.password, 'manager')
+    client_cookie = login(args.host, args.client, args.password, 'client')
+
+    stats = Stats()
+    pool = eventlet.GreenPool(args.streams + 1)
+    for i in range(args.streams):
+        pool.spawn(stream, args.host, manager_cookie, stats)
+        if i % args.ramp == args.ramp - 1:
+            eventlet.sleep(1)
+            print(f"… {stats.opened} flux ouverts, {stats.failed} échecs")
+    deadline = time.time() + 300
+    while stats.opened + stats.failed < args.streams and time.time() < deadline:
+        eventlet.sleep(1)
+    print(f"{stats.opened} flux ouverts, {stats.failed} échecs: début de la publication")
+
+    # Publication seulement une fois les flux ouverts: chaque commande doit les atteindre tous
+    stats.publish_until = time.time() + args.duration
+    pool.spawn(publisher, args.host, client_cookie, args.restaurant, args.rate, stats)
+
+    def report():
+        lags, stats.lags = stats.lags, []
+        stats.all_lags.extend(lags)
+        print(f"{time.strftime('%H:%M:%S')} | connectés: {stats.connected:6d} | déconnexions: {stats.disconnects:4d} "
+              f"| trames: {stats.frames:9d} | retard p50/p95/p99: {percentile(lags, 50):6.0f} / "
+              f"{percentile(lags, 95):6.0f} / {percentile(lags, 99):6.0f} ms")
+
+    while time.time() < stats.publish_until:
+        eventlet.sleep(min(10, max(0, stats.publish_until - time.time())))
+        report()
+
+    # Dernières livraisons, puis les flux s'arrêtent à leur prochaine trame
+    deadline = time.time() + 10
+    while time.time() < deadline and any(stats.seen.get(o, 0) < stats.opened for o in stats.published):
+        eventlet.sleep(0.5)
+    stats.stop_at = 0
+    report()
+
+    lags = stats.all_lags
+    missed = sum(1 for order_id in stats.published if stats.seen.get(order_id, 0) < stats.opened)
+    p99 = percentile(lags, 99)
+    print(f"Flux: {stats.opened}/{args.streams} ouverts, {stats.disconnects} déconnexions, {stats.resyncs} resync")
+    print(f"Commandes: {len(stats.published)} publiées, {missed} non reçues par tous les flux")
+    print(f"Retard: p50 {percentile(lags, 50):.0f} ms, p95 {percentile(lags, 95):.0f} ms, p99 {p99:.0f} ms")
+
+    ok = stats.opened == args.streams and stats.disconnects == 0 and missed == 0 and p99 <= args.max_lag_ms
+    print("✅ Objectif atteint" if ok else "❌ Objectif non atteint")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
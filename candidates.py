@@ -0,0 +1,149 @@
+from math import radians, sin, cos, sqrt, atan2
+from datetime import datetime, timedelta
+
+RADIUS_EARTH_KM = 6371
+
+
+def haversine_many(lon, lat, points):
+    """Distances en km entre un point et une liste de (lon, lat), en une passe.
+
+    Les termes du point de référence sont calculés une seule fois.
+    """
+    lon1 = radians(float(lon))
+    lat1 = radians(float(lat))
+    cos_lat1 = cos(lat1)
+
+    distances = []
+    for lon2, lat2 in points:
+        lon2 = radians(lon2)
+        lat2 = radians(lat2)
+        a = sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+        distances.append(round(RADIUS_EARTH_KM * 2 * atan2(sqrt(a), sqrt(1 - a)), 2))
+    return distances
+
+
+def combined_score(score, distance):
+    """Score d'attribution: note au carré pondérée par la distance au restaurant."""
+    if distance is None:
+        return score
+    return (score ** 2) / (distance + 1)
+
+
+def fetch_driver_data(stats_col, positions_col, driver_ids):
+    """Notes et positions d'un ensemble de livreurs, une requête $in chacune.
+
+    Renvoie ({id: avg_rating}, {id: [lon, lat]}).
+    """
+    scores = {
+        stats['_id']: float(stats['avg_rating'])
+        for stats in stats_col.find({"_id": {"$in": driver_ids}}, {"avg_rating": 1})
+        if 'avg_rating' in stats
+    }
+    positions = {
+        pos['_id']: pos['location']['coordinates']
+        for pos in positions_col.find({"_id": {"$in": driver_ids}}, {"location": 1})
+        if 'location' in pos
+    }
+    return scores, positions
+
+
+def rank_candidates(stats_col, positions_col, candidates, resto_lon, resto_lat):
+    """Classe les candidats d'une commande avec deux requêtes $in.
+
+    Renvoie une liste de dicts {id, score, distance, combined_score} triée
+    par combined_score décroissant (ordre d'intérêt conservé en cas d'égalité).
+    distance vaut None pour un livreur sans position connue.
+    """
+    if not candidates:
+        return []
+
+    scores, positions = fetch_driver_data(stats_col, positions_col, candidates)
+
+    located = [c for c in candidates if c in positions]
+    distances = dict(zip(located, haversine_many(
+        resto_lon, resto_lat, [positions[c] for c in located]
+    )))
+
+    ranked = []
+    for candidate in candidates:
+        score = scores.get(candidate, 0.0)
+        distance = distances.get(candidate)
+        ranked.append({
+            'id': candidate,
+            'score': score,
+            'distance': distance,
+            'combined_score': combined_score(score, distance)
+        })
+
+    ranked.sort(key=lambda c: c['combined_score'], reverse=True)
+    return ranked
+
+
+def _geo_ranking_pipeline(stats_col, resto_lon, resto_lat, query, max_distance_km, limit):
+    """Pipeline $geoNear centré sur le restaurant, joint aux statistiques,
+    qui calcule le score combiné et trie côté MongoDB."""
+    pipeline = [
+        {"$geoNear": {
+            "near": {"type": "Point", "coordinates": [float(resto_lon), float(resto_lat)]},
+            "distanceField": "distance_m",
+            "maxDistance": max_distance_km * 1000,
+            "spherical": True,
+            "key": "location",
+            "query": query
+        }}
+    ]
+    if limit:
+        # Les plus proches d'abord: on borne avant la jointure
+        pipeline.append({"$limit": limit})
+    pipeline += [
+        {"$lookup": {
+            "from": stats_col.name,
+            "localField": "_id",
+            "foreignField": "_id",
+            "as": "stats"
+        }},
+        {"$project": {
+            "_id": 0,
+            "id": "$_id",
+            "score": {"$toDouble": {"$ifNull": [{"$arrayElemAt": ["$stats.avg_rating", 0]}, 0]}},
+            "distance": {"$round": [{"$divide": ["$distance_m", 1000]}, 2]}
+        }},
+        {"$addFields": {
+            "combined_score": {"$divide": [
+                {"$multiply": ["$score", "$score"]},
+                {"$add": ["$distance", 1]}
+            ]}
+        }},
+        {"$sort": {"combined_score": -1, "distance": 1}}
+    ]
+    return pipeline
+
+
+def rank_candidates_geo(positions_col, stats_col, candidates, resto_lon, resto_lat,
+                        max_distance_km=10, max_age_seconds=600):
+    """Classe les candidats en un seul aller-retour via $geoNear.
+
+    Les livreurs trop loin ou dont la position date de plus de
+    max_age_seconds sont exclus. Même format que rank_candidates.
+    """
+    if not candidates:
+        return []
+    query = {
+        "_id": {"$in": candidates},
+        "updated_at": {"$gte": datetime.now() - timedelta(seconds=max_age_seconds)}
+    }
+    return list(positions_col.aggregate(_geo_ranking_pipeline(
+        stats_col, resto_lon, resto_lat, query, max_distance_km, None
+    )))
+
+
+def nearest_drivers(positions_col, stats_col, resto_lon, resto_lat, limit=5,
+                    max_distance_km=10, max_age_seconds=600, exclude=None):
+    """Les N livreurs les plus proches du restaurant, intérêt ou non,
+    classés par score combiné. Sert quand personne ne s'est proposé."""
+    query = {"updated_at": {"$gte": datetime.now() - timedelta(seconds=max_age_seconds)}}
+    if exclude:
+        query["_id"] = {"$nin": list(exclude)}
+    return list(positions_col.aggregate(_geo_ranking_pipeline(
+        stats_col, resto_lon, resto_lat, query, max_distance_km, limit
+    )))
@@ -0,0 +1,207 @@
+"""Chargement du fichier d'initialisation (comptes, notes des livreurs, restaurants).
+
+Le fichier est lu par morceaux: seul l'élément en cours de décodage est en
+mémoire, quelle que soit la taille des tableaux 'utilisateurs', 'livreurs'
+et 'restaurants'. Les documents sont écrits par bulk_write non ordonnés
+d'upserts $setOnInsert: les documents déjà présents ne sont pas modifiés
+et une relance ne coûte qu'un lot par batch_size éléments.
+"""
+import json
+import re
+import time
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from restaurant_search import normalize_name
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_NUMBER_TAIL = re.compile(r'[0-9.eE+-]*')
+_decoder = json.JSONDecoder()
+
+
+class _StreamReader:
+    """Tampon sur un fichier texte, rechargé au fil du décodage."""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+
+    def fill(self):
+        data = self.f.read(self.chunk_size)
+        if not data:
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Prochain caractère significatif ('' en fin de fichier)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def take(self, expected):
+        ch = self.peek()
+        if not ch or ch not in expected:
+            raise json.JSONDecodeError(f"'{expected}' attendu", self.buffer, self.pos)
+        self.pos += 1
+        return ch
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Valeur coupée par la fin du tampon: recharger et recommencer
+                if self.fill():
+                    continue
+                raise
+            # Un nombre en fin de tampon ('12', '1.', '2e') peut continuer dans le morceau suivant
+            if (not isinstance(value, (dict, list, str))
+                    and _NUMBER_TAIL.match(self.buffer, end).end() == len(self.buffer) and self.fill()):
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_sections(f, chunk_size=1 << 20):
+    """(section, élément) pour chaque élément des tableaux d'un objet JSON {section: [...]}.
+
+    Les sections qui ne sont pas des tableaux sont ignorées. Lève
+    json.JSONDecodeError si le fichier est invalide.
+    """
+    reader = _StreamReader(f, chunk_size)
+    reader.take('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        section = reader.value()
+        reader.take(':')
+        if reader.peek() == '[':
+            reader.take('[')
+            if reader.peek() == ']':
+                reader.take(']')
+            else:
+                while True:
+                    yield section, reader.value()
+                    if reader.take(',]') == ']':
+                        break
+        else:
+            reader.value()
+        if reader.take(',}') == '}':
+            return
+
+
+def user_operation(entry):
+    return UpdateOne({"_id": entry['username']}, {"$setOnInsert": {
+        "_id": entry['username'],
+        "password": entry['password_hash'],
+        "role": entry['role']
+    }}, upsert=True)
+
+
+def driver_stats_operation(entry):
+    avg_rating = entry.get('livreur', {}).get('avg_rating', 4.5)
+    return UpdateOne({"_id": entry['username']}, {"$setOnInsert": {
+        "_id": entry['username'],
+        "avg_rating": avg_rating,
+        "delivery_count": 1,  # Simuler 1
+        "total_rating": avg_rating
+    }}, upsert=True)
+
+
+def restaurant_operation(entry):
+    username = entry['username']
+    info = entry['restaurant']
+    name = info.get("nom", username)
+    return UpdateOne({"_id": username}, {"$setOnInsert": {
+        "_id": username,
+        "name": name,
+        "name_normalized": normalize_name(name),
+        "location": {
+            "type": "Point",
+            "coordinates": [float(info.get("longitude", 0.0)), float(info.get("latitude", 0.0))]
+        },
+        "menu": info.get('menu', [])
+    }}, upsert=True)
+
+
+class _BatchWriter:
+    """Opérations en attente par collection, écrites par bulk_write non ordonnés."""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.pending = {}
+        self.inserted = {}
+
+    def add(self, collection, operation):
+        operations = self.pending.setdefault(collection.name, (collection, []))[1]
+        operations.append(operation)
+        if len(operations) >= self.batch_size:
+            self.flush(collection.name)
+
+    def flush(self, name=None):
+        for key in ([name] if name else list(self.pending)):
+            collection, operations = self.pending.pop(key, (None, None))
+            if not operations:
+                continue
+            try:
+                result = collection.bulk_write(operations, ordered=False)
+                upserted = result.upserted_count
+            except BulkWriteError as e:
+                # Les autres opérations du lot sont passées (non ordonné)
+                errors = e.details.get('writeErrors', [])
+                upserted = e.details.get('nUpserted', 0)
+                print(f"Erreur init {key}: {errors[0]['errmsg'] if errors else e}")
+            self.inserted[key] = self.inserted.get(key, 0) + upserted
+
+
+def load_seed_file(path, users_col, stats_col, restaurants_col, batch_size=1000, report_every=5.0):
+    """Charge le fichier d'initialisation ; renvoie {collection: documents créés}.
+
+    Affiche la progression toutes les report_every secondes et le débit
+    final. Lève FileNotFoundError et json.JSONDecodeError.
+    """
+    writer = _BatchWriter(batch_size)
+    start = time.perf_counter()
+    last_report = start
+    entries = 0
+    missing_info = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for section, entry in iter_json_sections(f):
+            if not isinstance(entry, dict) or not entry.get('username'):
+                continue
+            if section not in ('utilisateurs', 'livreurs', 'restaurants'):
+                continue
+            try:
+                writer.add(users_col, user_operation(entry))
+            except KeyError as e:
+                print(f"Erreur init user {entry['username']}: champ {e} manquant")
+            if section == 'livreurs':
+                writer.add(stats_col, driver_stats_operation(entry))
+            elif section == 'restaurants':
+                if entry.get('restaurant'):
+                    writer.add(restaurants_col, restaurant_operation(entry))
+                else:
+                    missing_info += 1
+            entries += 1
+            if entries % batch_size == 0:
+                now = time.perf_counter()
+                if now - last_report >= report_every:
+                    last_report = now
+                    print(f"  initialisation: {entries} éléments ({entries / (now - start):,.0f}/s)")
+    writer.flush()
+    elapsed = time.perf_counter() - start
+    if missing_info:
+        print(f"AVERTISSEMENT: Pas d'infos 'restaurant' pour {missing_info} restaurant(s)")
+    created = ', '.join(f"{count} {name}" for name, count in writer.inserted.items())
+    print(f"Initialisation: {entries} éléments en {elapsed:.1f} s ({entries / max(elapsed, 1e-9):,.0f}/s), "
+          f"documents créés: {created or 'aucun'}")
+    return writer.inserted
@@ -0,0 +1,217 @@
+import heapq
+import threading
+from datetime import datetime
+
+from candidates import fetch_driver_data, haversine_many, combined_score
+
+
+_UNSERVED = object()
+
+
+def solve_assignment(edges):
+    """Couplage biparti commandes x livreurs de coût minimal.
+
+    edges: {order_id: [(driver_id, cost), ...]} (graphe creux: seuls les
+    candidats de chaque commande). Chaque livreur reçoit au plus une
+    commande. Algorithme hongrois par plus courts chemins augmentants
+    (Dijkstra avec potentiels), une commande à la fois: on sert le plus de
+    commandes possible, au coût total minimal pour ces commandes.
+
+    Renvoie {order_id: driver_id} pour les commandes servies.
+    """
+    costs = [c for adj in edges.values() for _, c in adj]
+    if not costs:
+        return {}
+
+    # Chaque commande reçoit un livreur fictif privé au coût prohibitif: toutes
+    # les lignes sont couplables (l'algorithme reste optimal ligne par ligne)
+    # et une attribution réelle de plus est toujours préférée.
+    lo, hi = min(costs), max(costs)
+    unserved_cost = hi + len(edges) * (hi - lo) + 1
+    edges = {
+        o: adj + [((_UNSERVED, o), unserved_cost)]
+        for o, adj in edges.items() if adj
+    }
+
+    order_pot = {o: min(c for _, c in adj) for o, adj in edges.items()}
+    driver_pot = {}
+    match_order = {}
+    match_driver = {}
+
+    for source in order_pot:
+        dist = {}
+        prev = {}
+        done = set()
+        reached_from = {source: 0.0}
+        heap = []
+
+        def relax(order, base):
+            pot = order_pot[order]
+            for driver, cost in edges[order]:
+                if driver in done:
+                    continue
+                nd = base + cost - pot - driver_pot.get(driver, 0.0)
+                if nd < dist.get(driver, float('inf')):
+                    dist[driver] = nd
+                    prev[driver] = order
+                    heapq.heappush(heap, (nd, driver))
+
+        relax(source, 0.0)
+        target = None
+        while heap:
+            d, driver = heapq.heappop(heap)
+            if driver in done or d > dist[driver]:
+                continue
+            done.add(driver)
+            owner = match_driver.get(driver)
+            if owner is None:
+                target = driver
+                break
+            # L'arête couplée a un coût réduit nul
+            reached_from[owner] = d
+            relax(owner, d)
+
+        if target is None:
+            continue
+
+        # Mise à jour des potentiels (coûts réduits restent >= 0)
+        total = dist[target]
+        for order, d in reached_from.items():
+            order_pot[order] += total - d
+        for driver in done:
+            driver_pot[driver] = driver_pot.get(driver, 0.0) - (total - dist[driver])
+
+        # Inverser le chemin alternant
+        driver = target
+        while True:
+            order = prev[driver]
+            previous_driver = match_order.get(order)
+            match_order[order] = driver
+            match_driver[driver] = order
+            if order == source:
+                break
+            driver = previous_driver
+
+    # Retirer les commandes restées sur leur livreur fictif
+    return {
+        o: d for o, d in match_order.items()
+        if not (isinstance(d, tuple) and d[0] is _UNSERVED)
+    }
+
+
+def greedy_assignment(values):
+    """Attribution actuelle: chaque commande prend son meilleur candidat,
+    indépendamment des autres. values: {order_id: [(driver_id, valeur), ...]}."""
+    result = {}
+    for order, adj in values.items():
+        best_driver = None
+        best_value = -1
+        for driver, value in adj:
+            if value > best_value:
+                best_value = value
+                best_driver = driver
+        if best_driver is not None:
+            result[order] = best_driver
+    return result
+
+
+def build_values(orders, scores, positions):
+    """Valeur (score**2)/(distance+1) de chaque paire commande x candidat.
+
+    Renvoie ({order_id: [(driver_id, valeur), ...]}, {(order_id, driver_id): distance}).
+    """
+    values = {}
+    distances = {}
+    for order in orders:
+        candidates = order.get('candidates', [])
+        located = [c for c in candidates if c in positions]
+        order_distances = dict(zip(located, haversine_many(
+            order.get('restaurant_lon', '2.333'), order.get('restaurant_lat', '48.865'),
+            [positions[c] for c in located]
+        )))
+        adj = []
+        for candidate in candidates:
+            distance = order_distances.get(candidate)
+            distances[(order['_id'], candidate)] = distance
+            adj.append((candidate, combined_score(scores.get(candidate, 0.0), distance)))
+        values[order['_id']] = adj
+    return values, distances
+
+
+class DispatchEngine:
+    """Attribution groupée des commandes dont la fenêtre manager a expiré.
+
+    Toutes les commandes concernées sont résolues ensemble par un couplage
+    de coût minimal, pour qu'un même livreur ne gagne pas plusieurs
+    commandes simultanées pendant que d'autres restent inoccupés.
+    """
+
+    def __init__(self, orders_col, stats_col, positions_col, on_assigned, interval=2.0):
+        self.orders_col = orders_col
+        self.stats_col = stats_col
+        self.positions_col = positions_col
+        self.on_assigned = on_assigned
+        self.interval = interval
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        print(f"🚚 Moteur de dispatch démarré (cadence {self.interval}s)")
+
+    def wake(self, order_id=None):
+        """Déclenche un tour au plus tôt (appelé à l'expiration d'une fenêtre)."""
+        self.wakeup.set()
+
+    def expired_orders(self):
+        return list(self.orders_col.find(
+            {
+                "status": "ready",
+                "timer.type": "manager_decision",
+                "timer.expires_at": {"$lte": datetime.now().isoformat()},
+                "candidates.0": {"$exists": True}
+            },
+            {"candidates": 1, "restaurant_lon": 1, "restaurant_lat": 1,
+             "client": 1, "restaurant": 1}
+        ))
+
+    def run_once(self):
+        orders = self.expired_orders()
+        if not orders:
+            return 0
+
+        driver_ids = list({c for order in orders for c in order['candidates']})
+        scores, positions = fetch_driver_data(self.stats_col, self.positions_col, driver_ids)
+        values, distances = build_values(orders, scores, positions)
+
+        edges = {o: [(d, -v) for d, v in adj] for o, adj in values.items()}
+        assignment = solve_assignment(edges)
+
+        by_id = {order['_id']: order for order in orders}
+        assigned = 0
+        for order_id, driver_id in assignment.items():
+            # Conditionnel: le manager a pu choisir entre-temps
+            result = self.orders_col.update_one(
+                {"_id": order_id, "status": "ready"},
+                {
+                    "$set": {"status": "assigned", "assigned_driver": driver_id},
+                    "$unset": {"candidates": "", "timer": ""},
+                    "$currentDate": {"updated_at": True}
+                }
+            )
+            if result.modified_count:
+                assigned += 1
+                self.on_assigned(by_id[order_id], driver_id, scores.get(driver_id, 0.0),
+                                 distances.get((order_id, driver_id)))
+        return assigned
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Erreur dispatch: {e}")
@@ -0,0 +1,205 @@
+import queue
+import time
+
+import bson
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import OperationFailure
+
+# Historique du Change Stream perdu (oplog trop court pour le jeton de reprise)
+CHANGE_STREAM_HISTORY_LOST = 286
+# $changeStream refusé: mongod seul, sans replica set
+CHANGE_STREAMS_UNSUPPORTED = 40573
+UNSUPPORTED_MESSAGE = ("EVENT_BUS=changestream nécessite un replica set: "
+                       "lancez avec EVENT_BUS=memory (un seul processus) ou EVENT_BUS=redis")
+
+
+def change_streams_unsupported(error):
+    """Vrai si l'erreur de watch() signifie que le serveur n'a pas de Change Streams."""
+    if isinstance(error, OperationFailure):
+        return error.code == CHANGE_STREAMS_UNSUPPORTED
+    return isinstance(error, NotImplementedError)  # client de test (mongomock)
+
+
+class ChangeStreamBus:
+    """Événements écrits dans la collection plafonnée 'events' et reçus par Change Stream.
+
+    Nécessite un replica set. C'est le seul bus qui conserve les événements:
+    un processus redémarré peut rejouer les derniers (recent, after).
+    """
+
+    name = 'changestream'
+
+    def __init__(self, events_col):
+        self.events_col = events_col
+        self.resume_token = None
+
+    def write(self, events, ordered=True):
+        """Écrit un lot ; lève BulkWriteError comme insert_many (gérée par l'EventOutbox)."""
+        self.events_col.insert_many(events, ordered=ordered)
+
+    def check(self):
+        """Vérifie au démarrage que le serveur accepte les Change Streams (RuntimeError sinon)."""
+        try:
+            self.events_col.watch([{'$match': {'operationType': 'insert'}}]).close()
+        except Exception as e:
+            if change_streams_unsupported(e):
+                raise RuntimeError(UNSUPPORTED_MESSAGE) from e
+            raise
+
+    def listen(self, on_event, on_ready=None, on_gap=None):
+        """Boucle de réception (thread dédié). Reprend après une erreur avec le jeton de reprise,
+        sauf si le serveur n'a pas de Change Streams: la réception s'arrête alors."""
+        pipeline = [{'$match': {'operationType': 'insert'}}]
+        while True:
+            try:
+                with self.events_col.watch(pipeline, resume_after=self.resume_token) as stream:
+                    if on_ready is not None:
+                        on_ready()
+                    for change in stream:
+                        self.resume_token = stream.resume_token
+                        on_event(change['fullDocument'])
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    print("⚠️ Jeton de reprise du Change Stream expiré, resynchronisation des abonnés")
+                    self.resume_token = None
+                    if on_gap is not None:
+                        on_gap()
+                elif change_streams_unsupported(e):
+                    print(f"❌ {UNSUPPORTED_MESSAGE}")
+                    return
+                else:
+                    print(f"Erreur SSE/Change Stream: {e}")
+                    time.sleep(1)
+            except Exception as e:
+                if change_streams_unsupported(e):
+                    print(f"❌ {UNSUPPORTED_MESSAGE}")
+                    return
+                print(f"Erreur SSE/Change Stream: {e}")
+                time.sleep(1)
+
+    def recent(self, limit):
+        """Derniers événements, du plus ancien au plus récent."""
+        docs = list(self.events_col.find().sort('$natural', -1).limit(limit))
+        docs.reverse()
+        return docs
+
+    def after(self, event_id, limit):
+        """Événements postérieurs à event_id (au plus limit), None si event_id n'est plus conservé.
+
+        Lus dans l'ordre des _id: deux processus qui publient dans la même
+        seconde peuvent être légèrement réordonnés.
+        """
+        try:
+            oid = ObjectId(event_id)
+        except (InvalidId, TypeError):
+            return None
+        if self.events_col.count_documents({'_id': oid}, limit=1) == 0:
+            return None
+        return list(self.events_col.find({'_id': {'$gt': oid}}).sort('_id', 1).limit(limit))
+
+    def stats(self):
+        return {'bus': self.name, 'resumable': self.resume_token is not None}
+
+
+class RedisBus:
+    """Redis pub/sub: une publication par événement (encodé en BSON), sans écriture MongoDB.
+
+    Aucun historique: un message publié pendant une coupure est perdu, et
+    les abonnés reçoivent alors un 'resync'. Les _id sont posés à la
+    publication pour servir d'id SSE.
+    """
+
+    name = 'redis'
+
+    def __init__(self, redis_client, channel='delivery:events'):
+        self.redis = redis_client
+        self.channel = channel
+        self.reconnects = 0
+
+    def write(self, events, ordered=True):
+        pipe = self.redis.pipeline(transaction=False)
+        for event in events:
+            event.setdefault('_id', ObjectId())
+            pipe.publish(self.channel, bson.encode(event))
+        pipe.execute()
+
+    def check(self):
+        pass  # reconnexion gérée par listen()
+
+    def listen(self, on_event, on_ready=None, on_gap=None):
+        ready = False
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                if not ready:
+                    if on_ready is not None:
+                        on_ready()
+                    ready = True
+                elif on_gap is not None:
+                    # Messages publiés pendant la coupure perdus
+                    on_gap()
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        on_event(bson.decode(message['data']))
+            except Exception as e:
+                print(f"Erreur SSE/Redis: {e}")
+                self.reconnects += 1
+                time.sleep(1)
+            finally:
+                pubsub.close()
+
+    def recent(self, limit):
+        return []
+
+    def after(self, event_id, limit):
+        return None
+
+    def stats(self):
+        return {'bus': self.name, 'channel': self.channel, 'reconnects': self.reconnects}
+
+
+class MemoryBus:
+    """Bus interne au processus (un seul nœud, tests): ni MongoDB ni Redis."""
+
+    name = 'memory'
+
+    def __init__(self, max_size=100000):
+        self.queue = queue.Queue(max_size)
+
+    def write(self, events, ordered=True):
+        for event in events:
+            event.setdefault('_id', ObjectId())
+            # Copie: l'EventHub retire _id et routing du document reçu
+            self.queue.put(dict(event))
+
+    def check(self):
+        pass
+
+    def listen(self, on_event, on_ready=None, on_gap=None):
+        if on_ready is not None:
+            on_ready()
+        while True:
+            on_event(self.queue.get())
+
+    def recent(self, limit):
+        return []
+
+    def after(self, event_id, limit):
+        return None
+
+    def stats(self):
+        return {'bus': self.name, 'backlog': self.queue.qsize()}
+
+
+def create_bus(kind, events_col=None, redis_url=None):
+    """Bus d'événements selon EVENT_BUS: changestream (défaut), redis ou memory."""
+    if kind == 'changestream':
+        return ChangeStreamBus(events_col)
+    if kind == 'redis':
+        import redis  # dépendance optionnelle
+        return RedisBus(redis.Redis.from_url(redis_url or 'redis://localhost:6379/0'))
+    if kind == 'memory':
+        return MemoryBus()
+    raise ValueError(f"Bus d'événements inconnu: {kind}")
@@ -0,0 +1,361 @@
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+from serializer import sse_frame
+
+# Commentaire SSE qui garde ouverte une connexion sans événement
+PING_FRAME = b": ping\n\n"
+
+
+# Rôles qui reçoivent un type d'événement quel que soit l'utilisateur.
+# Les autres destinataires (client, restaurant, livreurs concernés) sont
+# désignés par le bloc 'routing' attaché à chaque événement.
+BROADCAST_ROLES = {
+    'order_created': ('manager',),
+    'order_ready': ('manager', 'livreur'),
+    'driver_interest': ('manager',),
+    'manager_decision_started': ('manager',),
+    'no_candidates': ('manager',),
+    'driver_assigned': ('manager',),
+    'auto_assignment': ('manager',),
+    'order_delivered': ('manager',),
+    'order_cancelled': ('manager', 'livreur'),
+    'driver_rated': ('manager',),
+    'position_updated': (),
+}
+
+# Événements fusionnables: seul le plus récent par clé est utile au navigateur
+COALESCE_KEYS = {
+    'position_updated': 'driver_id',
+}
+
+
+def build_routing(event_type, order_id=None, client=None, restaurant=None, drivers=None):
+    """Construit le bloc de routage stocké avec l'événement."""
+    return {
+        'roles': list(BROADCAST_ROLES.get(event_type, ('manager',))),
+        'order_id': order_id,
+        'client': client,
+        'restaurant': restaurant,
+        'drivers': [d for d in (drivers or []) if d]
+    }
+
+
+def event_matches(routing, role, username, order_ids=None):
+    """Indique si un événement concerne un abonné (rôle, utilisateur, commandes suivies)."""
+    if not routing:
+        return role == 'manager'
+
+    if order_ids is not None and routing.get('order_id') not in order_ids:
+        return False
+
+    if role in routing.get('roles', []):
+        return True
+    if role == 'client':
+        return username == routing.get('client')
+    if role == 'restaurant':
+        return username == routing.get('restaurant')
+    if role == 'livreur':
+        return username in routing.get('drivers', [])
+    return False
+
+
+class Subscriber:
+    """File bornée d'un client SSE. Les positions sont fusionnées, les autres
+    événements font décrocher l'abonné si la file déborde."""
+
+    def __init__(self, role, username, order_ids=None, max_queue=100):
+        self.role = role
+        self.username = username
+        self.order_ids = set(order_ids) if order_ids else None
+        self.max_queue = max_queue
+        self.queue = deque()
+        self.pending_keys = {}
+        self.overflowed = False
+        self.dropped = 0
+        self.skip_ids = set()  # déjà envoyés par un rejeu depuis la collection
+        self.active = False    # trame reçue depuis le dernier ping
+        self.cond = threading.Condition()
+
+    def wants(self, routing):
+        return event_matches(routing, self.role, self.username, self.order_ids)
+
+    def put(self, event_type, coalesce_key, frame, event_id=None):
+        with self.cond:
+            if self.overflowed:
+                return
+            self.active = True
+
+            # Remplacer sur place un événement fusionnable encore en attente
+            if coalesce_key is not None:
+                key = (event_type, coalesce_key)
+                entry = self.pending_keys.get(key)
+                if entry is not None:
+                    entry[1] = frame
+                    entry[2] = event_id
+                    self.dropped += 1
+                    return
+
+            if len(self.queue) >= self.max_queue:
+                if coalesce_key is not None:
+                    self.dropped += 1
+                    return
+                # Consommateur trop lent: on le déconnecte, il reprendra au dernier id reçu
+                self.overflowed = True
+                self.queue.clear()
+                self.pending_keys.clear()
+                self.cond.notify()
+                return
+
+            entry = [(event_type, coalesce_key) if coalesce_key is not None else None, frame, event_id]
+            self.queue.append(entry)
+            if coalesce_key is not None:
+                self.pending_keys[(event_type, coalesce_key)] = entry
+            self.cond.notify()
+
+    def ping(self):
+        """Ajoute un ping si rien n'a été envoyé depuis le précédent."""
+        with self.cond:
+            if self.active or self.overflowed:
+                self.active = False
+                return
+            self.queue.append([None, PING_FRAME, None])
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        """Renvoie les trames SSE en attente, concaténées (un seul envoi), None si
+        timeout. Lève OverflowError si décroché."""
+        with self.cond:
+            if not self.queue and not self.overflowed:
+                self.cond.wait(timeout)
+            if self.overflowed:
+                raise OverflowError("File SSE saturée")
+            frames = []
+            while self.queue:
+                key, frame, event_id = self.queue.popleft()
+                if key is not None:
+                    self.pending_keys.pop(key, None)
+                if event_id is None or event_id not in self.skip_ids:
+                    frames.append(frame)
+            return b"".join(frames) if frames else None
+
+
+class EventHub:
+    """Une seule réception du bus d'événements par processus, redistribuée aux abonnés SSE.
+
+    Le bus (event_bus.py: Change Stream, Redis pub/sub ou mémoire) livre
+    chaque événement publié par n'importe quel processus. Chaque trame porte
+    l'_id de l'événement comme id SSE. Les replay_size derniers événements
+    restent en mémoire: un navigateur qui se reconnecte avec Last-Event-ID
+    reçoit ce qu'il a manqué depuis cette mémoire, sinon depuis le bus s'il
+    conserve les événements, sinon un événement 'resync'.
+    """
+
+    def __init__(self, bus, max_queue=100, replay_size=10000, keepalive_interval=15):
+        self.bus = bus
+        self.max_queue = max_queue
+        self.replay_size = replay_size
+        self.keepalive_interval = keepalive_interval
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.keepalive_thread = None
+        self.listeners = []    # autres transports (WebSocket): cb(event_id, routing, event_doc)
+        # (event_id, routing, type, coalesce_key, frame), dans l'ordre de réception
+        self.recent = deque(maxlen=replay_size)
+        self.positions = {}    # event_id -> numéro d'ordre dans le processus
+        self.dispatched = 0
+        self.counters = {
+            'replays': 0,
+            'replayed_events': 0,
+            'replays_from_bus': 0,
+            'resyncs': 0
+        }
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            if self.keepalive_thread is None or not self.keepalive_thread.is_alive():
+                self.keepalive_thread = threading.Thread(target=self._keepalive, daemon=True)
+                self.keepalive_thread.start()
+
+    def subscribe(self, role, username, order_ids=None, last_event_id=None):
+        """Inscrit un abonné. Renvoie (abonné, trames à rejouer avant le direct).
+
+        Sans last_event_id, rien à rejouer. Si l'id n'est plus connu, la
+        seule trame est un 'resync': la page resynchronise ses commandes
+        (GET /sync) au lieu de se recharger.
+        """
+        sub = Subscriber(role, username, order_ids, self.max_queue)
+        replay = []
+        with self.lock:
+            # Rejeu et inscription sous le même verrou: ni trou ni doublon
+            from_memory = self._replay_from_memory(sub, last_event_id) if last_event_id else []
+            self.subscribers.add(sub)
+        self.start()
+
+        if last_event_id:
+            self.counters['replays'] += 1
+            if from_memory is not None:
+                replay = from_memory
+            else:
+                replay = self._replay_from_bus(sub, last_event_id)
+            if replay is None:
+                self.counters['resyncs'] += 1
+                replay = [self.resync_frame()]
+            else:
+                self.counters['replayed_events'] += len(replay)
+        return sub, replay
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscribers.discard(sub)
+
+    def add_listener(self, callback):
+        """callback(event_id, routing, event_doc) pour chaque nouvel événement (hors rejeu)."""
+        self.listeners.append(callback)
+
+    def resync_frame(self):
+        """Événement 'resync' portant l'id le plus récent, d'où repartira la prochaine reconnexion."""
+        with self.lock:
+            latest = self.recent[-1][0] if self.recent else None
+        return sse_frame({'type': 'resync'}, latest)
+
+    def stats(self):
+        with self.lock:
+            subs = list(self.subscribers)
+            buffered = len(self.recent)
+        stats = dict(self.counters)
+        stats.update({
+            'subscribers': len(subs),
+            'queued': sum(len(s.queue) for s in subs),
+            'dropped': sum(s.dropped for s in subs),
+            'replay_buffer': buffered,
+            'replay_size': self.replay_size
+        })
+        stats.update(self.bus.stats())
+        return stats
+
+    def dispatch(self, event_doc, deliver=True):
+        """Sérialise une fois l'événement, le garde pour le rejeu et le pousse aux abonnés concernés."""
+        event_id = event_doc.pop('_id', None)
+        event_id = str(event_id) if event_id is not None else None
+        routing = event_doc.pop('routing', None)
+        event_type = event_doc.get('type')
+
+        coalesce_field = COALESCE_KEYS.get(event_type)
+        coalesce_key = (event_doc.get('data') or {}).get(coalesce_field) if coalesce_field else None
+
+        frame = sse_frame(event_doc, event_id)
+        with self.lock:
+            if event_id is not None:
+                if event_id in self.positions:
+                    return  # déjà reçu (préchargement au démarrage)
+                if len(self.recent) == self.recent.maxlen:
+                    self.positions.pop(self.recent[0][0], None)
+                self.recent.append((event_id, routing, event_type, coalesce_key, frame))
+                self.dispatched += 1
+                self.positions[event_id] = self.dispatched
+            if not deliver:
+                return
+            for sub in self.subscribers:
+                if sub.wants(routing):
+                    sub.put(event_type, coalesce_key, frame, event_id)
+        for callback in self.listeners:
+            try:
+                callback(event_id, routing, event_doc)
+            except Exception as e:
+                print(f"Erreur diffusion de l'événement {event_type}: {e}")
+
+    def _replay_from_memory(self, sub, last_event_id):
+        """Trames postérieures à last_event_id, None si l'id n'est plus en mémoire. Appelé sous self.lock."""
+        position = self.positions.get(last_event_id)
+        if position is None:
+            return None
+        first = self.dispatched - len(self.recent) + 1
+        return _select(sub, islice(self.recent, position - first + 1, None))
+
+    def _replay_from_bus(self, sub, last_event_id):
+        """Rejeu depuis le bus (collection plafonnée) quand l'id est sorti de la mémoire (redémarrage).
+
+        None si le bus ne conserve pas les événements, si l'id a déjà été
+        écrasé ou si l'écart dépasse replay_size.
+        """
+        try:
+            docs = self.bus.after(last_event_id, self.replay_size + 1)
+        except Exception as e:
+            print(f"Erreur rejeu SSE depuis le bus: {e}")
+            return None
+        if docs is None or len(docs) > self.replay_size:
+            return None
+
+        self.counters['replays_from_bus'] += 1
+        entries = []
+        for doc in docs:
+            event_id = str(doc.pop('_id'))
+            routing = doc.pop('routing', None)
+            event_type = doc.get('type')
+            coalesce_field = COALESCE_KEYS.get(event_type)
+            coalesce_key = (doc.get('data') or {}).get(coalesce_field) if coalesce_field else None
+            entries.append((event_id, routing, event_type, coalesce_key, sse_frame(doc, event_id)))
+        # Les mêmes événements peuvent arriver en direct pendant la lecture
+        with sub.cond:
+            sub.skip_ids.update(entry[0] for entry in entries)
+        return _select(sub, entries)
+
+    def _preload(self):
+        """Remplit la mémoire de rejeu avec les derniers événements conservés par le bus (démarrage).
+
+        Appelé une fois la réception ouverte: un événement arrivé entre-temps est dédoublonné.
+        """
+        if self.dispatched:
+            return
+        try:
+            docs = self.bus.recent(self.replay_size)
+        except Exception as e:
+            print(f"Erreur préchargement des événements SSE: {e}")
+            return
+        for doc in docs:
+            self.dispatch(doc, deliver=False)
+        if docs:
+            print(f"✅ {len(docs)} événement(s) disponibles pour la reprise des flux SSE")
+
+    def _run(self):
+        self.bus.listen(self.dispatch, on_ready=self._preload,
+                        on_gap=lambda: self._broadcast(self.resync_frame()))
+
+    def _keepalive(self):
+        """Pings de tous les abonnés inactifs depuis un seul thread: les flux
+        attendent sans délai d'expiration (pas de minuteur par connexion)."""
+        while True:
+            time.sleep(self.keepalive_interval)
+            with self.lock:
+                subs = list(self.subscribers)
+            for sub in subs:
+                sub.ping()
+
+    def _broadcast(self, frame):
+        with self.lock:
+            subs = list(self.subscribers)
+        for sub in subs:
+            sub.put('resync', None, frame)
+
+
+def _select(sub, entries):
+    """Trames destinées à l'abonné ; un seul événement fusionnable (position) par clé, le plus récent."""
+    frames = []
+    latest = {}
+    for event_id, routing, event_type, coalesce_key, frame in entries:
+        if not sub.wants(routing):
+            continue
+        if coalesce_key is not None:
+            key = (event_type, coalesce_key)
+            if key in latest:
+                frames[latest[key]] = None
+            latest[key] = len(frames)
+        frames.append(frame)
+    return [frame for frame in frames if frame is not None]
@@ -0,0 +1,38 @@
+import itertools
+from datetime import datetime
+
+from event_hub import build_routing
+
+# Version du schéma des documents de la collection 'events'.
+# v1: documents de commande complets dans les données (details, order_data).
+# v2: identifiants et champs modifiés seulement, plus un numéro de séquence.
+EVENT_SCHEMA_VERSION = 2
+
+# Champs d'une commande affichés par les tableaux de bord à sa création
+ORDER_EVENT_FIELDS = ('client', 'restaurant', 'restaurant_name', 'articles', 'total_price', 'status')
+
+_sequence = itertools.count(1)
+
+
+def build_event(event_type, data, routing=None):
+    """Document d'événement {v, type, seq, data, routing, timestamp}.
+
+    seq est croissant dans le processus qui publie. data ne contient que
+    des identifiants et les champs modifiés ; le document complet de la
+    commande se lit à la demande (GET /order/<order_id>).
+    """
+    if routing is None:
+        routing = build_routing(event_type, order_id=data.get('order_id'))
+    return {
+        'v': EVENT_SCHEMA_VERSION,
+        'type': event_type,
+        'seq': next(_sequence),
+        'data': data,
+        'routing': routing,
+        'timestamp': datetime.now()
+    }
+
+
+def order_fields(order, keys=ORDER_EVENT_FIELDS):
+    """Champs d'une commande déjà en mémoire, sans relecture ni aller-retour JSON."""
+    return {key: order[key] for key in keys if order.get(key) is not None}
@@ -0,0 +1,64 @@
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel, TEXT
+
+from restaurant_search import backfill_normalized_names
+
+# Index de chaque collection: créés en un appel create_indexes par collection
+INDEXES = {
+    'users': [
+        IndexModel("role"),
+    ],
+    'orders': [
+        IndexModel("client"),
+        IndexModel("status"),
+        IndexModel("assigned_driver"),
+        IndexModel("restaurant"),
+        IndexModel([("candidates", ASCENDING)]),
+        IndexModel([("created_at", DESCENDING)]),
+        # Pagination par clé du tableau manager, avec ou sans filtre
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("restaurant", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel("timer.status", sparse=True),  # Rechargement des timers au démarrage
+        # Synchronisation incrémentale (/sync) par périmètre
+        IndexModel([("updated_at", ASCENDING)]),
+        IndexModel([("client", ASCENDING), ("updated_at", ASCENDING)]),
+        IndexModel([("restaurant", ASCENDING), ("updated_at", ASCENDING)]),
+        IndexModel([("assigned_driver", ASCENDING), ("updated_at", ASCENDING)]),
+    ],
+    'livreur_stats': [
+        IndexModel([("avg_rating", DESCENDING)]),
+    ],
+    'livreurs_positions': [
+        IndexModel([("location", GEOSPHERE)]),
+    ],
+    'restaurants': [
+        IndexModel([("location", GEOSPHERE)]),
+        IndexModel([("name", TEXT)]),  # Recherche plein texte ($text)
+        # Recherche par préfixe et pagination par clé (nom normalisé, _id)
+        IndexModel([("name_normalized", ASCENDING), ("_id", ASCENDING)]),
+    ],
+}
+
+# Préparation des documents avant la création des index d'une collection
+PREPARE = {
+    'restaurants': backfill_normalized_names,
+}
+
+
+def ensure_indexes(db, indexes=INDEXES, prepare=PREPARE):
+    """Crée les index manquants, en un seul create_indexes par collection.
+
+    Une collection dont tous les index existent déjà (même nom) n'est pas
+    touchée: au démarrage, le coût se limite à un listIndexes par
+    collection. Sinon prepare[collection] (s'il existe) est appelé avant la
+    création. Renvoie {collection: noms des index créés}.
+    """
+    created = {}
+    for name, models in indexes.items():
+        existing = set(db[name].index_information())
+        missing = [model for model in models if model.document['name'] not in existing]
+        if missing:
+            if name in prepare:
+                prepare[name](db[name])
+            created[name] = db[name].create_indexes(missing)
+    return created
@@ -1,32 +1,425 @@
-from locust import HttpUser, task, between
+"""Scénarios de charge: clients, restaurants, livreurs, managers et flux SSE.
 
-class MongoAppUser(HttpUser):
-    wait_time = between(1, 2)
+Chaque persona se connecte avec son propre compte et suit le cycle réel
+d'une commande à partir de son flux /events, comme le navigateur:
+le client commande des articles du vrai menu, le restaurant marque prêtes
+les commandes reçues (order_created), les livreurs montrent leur intérêt
+pendant la fenêtre de 60 s (order_ready) et livrent ce qui leur est
+attribué, le manager choisit un livreur pendant sa fenêtre
+(manager_decision_started) et le client note la livraison. Des
+auditeurs SSE supplémentaires gardent des flux manager ouverts.
+
+Chaque événement reçu est compté comme une requête de type SSE, nommée
+d'après son type, dont le temps est le retard de livraison (réception
+moins 'timestamp' de l'événement: serveur et locust sur la même horloge).
+En fin de test, p50/p95/p99 sont affichés par route et par type
+d'événement, et le code de sortie vaut 1 si un seuil est dépassé:
+LOAD_MAX_P99_MS (routes HTTP), LOAD_MAX_EVENT_LAG_MS (retard SSE),
+LOAD_MAX_FAILURE_RATIO.
+
+Comptes (mot de passe LOAD_PASSWORD): LOAD_CLIENTS, LOAD_RESTAURANTS,
+LOAD_DRIVERS, LOAD_MANAGERS, listes séparées par des virgules ou plages
+'client{1..200}', distribués à tour de rôle. Prévoir au moins autant de
+comptes restaurant et manager que d'utilisateurs simulés de ces rôles:
+deux restaurants sur le même compte marqueraient deux fois la même commande.
+
+    locust -f locustfile.py --headless -u 300 -r 30 -t 10m \\
+        --host http://127.0.0.1:5000 --csv load
+"""
+import itertools
+import json
+import os
+import random
+import re
+import time
+from collections import deque
+from datetime import datetime
+
+import gevent
+from locust import HttpUser, between, events, task
+from locust.clients import HttpSession
+from locust.exception import StopUser
+
+PASSWORD = os.environ.get('LOAD_PASSWORD', '123456')
+# Seuils de validation d'une version (code de sortie 1 si dépassés)
+MAX_P99_MS = float(os.environ.get('LOAD_MAX_P99_MS', 1000))
+MAX_EVENT_LAG_MS = float(os.environ.get('LOAD_MAX_EVENT_LAG_MS', 3000))
+MAX_FAILURE_RATIO = float(os.environ.get('LOAD_MAX_FAILURE_RATIO', 0.01))
+
+# Fenêtre d'acceptation des livreurs (start_acceptance_window): 60 s
+ACCEPTANCE_WINDOW_SECONDS = 60
+
+
+def accounts(variable, default):
+    """Comptes d'un rôle: 'a,b,c' ou 'client{1..200}'."""
+    names = []
+    for part in os.environ.get(variable, default).split(','):
+        part = part.strip()
+        match = re.fullmatch(r'(.*)\{(\d+)\.\.(\d+)\}(.*)', part)
+        if match:
+            prefix, first, last, suffix = match.groups()
+            names.extend(f"{prefix}{i}{suffix}" for i in range(int(first), int(last) + 1))
+        elif part:
+            names.append(part)
+    return names
+
+
+CLIENTS = accounts('LOAD_CLIENTS', 'client1')
+RESTAURANTS = accounts('LOAD_RESTAURANTS', 'restaurant1')
+DRIVERS = accounts('LOAD_DRIVERS', 'livreur1')
+MANAGERS = accounts('LOAD_MANAGERS', 'manager1')
+
+# Comptes distribués à tour de rôle entre les utilisateurs simulés
+NEXT_ACCOUNT = {
+    'client': itertools.cycle(CLIENTS),
+    'restaurant': itertools.cycle(RESTAURANTS),
+    'livreur': itertools.cycle(DRIVERS),
+    'manager': itertools.cycle(MANAGERS),
+}
+
+SYNC_VERSION = re.compile(r'let syncVersion = (\d+);')
+
+
+class RoleUser(HttpUser):
+    """Utilisateur connecté avec un rôle, qui écoute son flux /events en tâche de fond."""
+
+    abstract = True
+    host = 'http://127.0.0.1:5000'
+    role = None
+    listen_in_background = True
 
     def on_start(self):
-        """Simulate login once per user session"""
-        response = self.client.post("/login", data={
-            "username": "client1",
-            "password": "123456",   # <- Ce mot de passe correspond au hash dans le JSON
-            "role": "client"
-        }, allow_redirects=False)
-        
-        if response.status_code != 302:  # Flask redirige après une connexion réussie
-            print("❌ Login failed:", response.status_code, response.text)
-        else:
-            print("✅ Logged in as client1")
+        # Les sous-classes préparent leur état avant d'appeler on_start (le flux l'utilise)
+        self.username = next(NEXT_ACCOUNT[self.role])
+        self.sync_version = None
+        self.running = True
+        self.stream_greenlet = None
+        response = self.client.post('/login', data={
+            'username': self.username,
+            'password': PASSWORD,
+            'role': self.role
+        }, allow_redirects=False, name='/login')
+        if response.status_code != 302:
+            print(f"❌ Connexion de {self.username} impossible ({response.status_code})")
+            raise StopUser()
+        if self.listen_in_background:
+            self.stream_greenlet = gevent.spawn(self.listen)
+
+    def on_stop(self):
+        self.running = False
+        if self.stream_greenlet is not None:
+            self.stream_greenlet.kill(block=False)
+
+    # --- Flux SSE ---
+
+    def listen(self):
+        """Garde /events ouvert (reprise avec Last-Event-ID) et mesure le retard de chaque événement."""
+        stream = HttpSession(self.host, self.environment.events.request, self)
+        stream.cookies.update(self.client.cookies)
+        last_event_id = None
+        while self.running:
+            headers = {'Accept': 'text/event-stream'}
+            if last_event_id:
+                headers['Last-Event-ID'] = last_event_id
+            response = None
+            try:
+                response = stream.get('/events', headers=headers, stream=True, name='/events', timeout=(10, None))
+                event_id = None
+                # chunk_size=None: chaque trame est traitée dès son arrivée
+                for line in response.iter_lines(chunk_size=None):
+                    if not self.running:
+                        return
+                    if line.startswith(b'id: '):
+                        event_id = line[4:].decode()
+                    elif line.startswith(b'data: '):
+                        self.receive(json.loads(line[6:]), len(line))
+                        if event_id:
+                            last_event_id = event_id
+                        event_id = None
+            except Exception:
+                pass
+            finally:
+                if response is not None:
+                    response.close()
+            if self.running:
+                gevent.sleep(random.uniform(2, 5))
+
+    def receive(self, event, size):
+        event_type = event.get('type')
+        if event_type == 'resync':
+            # Écart trop grand pour la reprise: le navigateur appelle /sync
+            self.sync_version = None
+        elif 'timestamp' in event:
+            lag = (datetime.now() - datetime.fromisoformat(event['timestamp'])).total_seconds() * 1000
+            self.environment.events.request.fire(
+                request_type='SSE', name=event_type, response_time=max(0.0, lag),
+                response_length=size, exception=None, context={}
+            )
+        self.on_event(event_type, event.get('data') or {})
+
+    def on_event(self, event_type, data):
+        """Réaction de la persona à un événement de son flux."""
+
+    # --- Tableau de bord ---
+
+    def open_dashboard(self):
+        response = self.client.get('/dashboard', name='/dashboard')
+        match = SYNC_VERSION.search(response.text or '')
+        if match:
+            self.sync_version = int(match.group(1))
+
+    def sync(self):
+        if self.sync_version is None:
+            self.open_dashboard()
+            return
+        response = self.client.get(f'/sync?since={self.sync_version}', name='/sync')
+        try:
+            self.sync_version = response.json().get('version', self.sync_version)
+        except ValueError:
+            pass
+
+
+class ClientUser(RoleUser):
+    """Commande des articles du menu, suit ses commandes et note les livraisons."""
+
+    weight = 10
+    role = 'client'
+    wait_time = between(2, 6)
+
+    def on_start(self):
+        self.menus = {}
+        self.orders = deque(maxlen=20)
+        self.to_rate = deque()
+        super().on_start()
+        self.client.get('/get_restaurants', name='/get_restaurants')
+        self.open_dashboard()
+
+    def on_event(self, event_type, data):
+        # Plusieurs utilisateurs simulés peuvent partager un compte: chacun note ses propres commandes
+        if event_type == 'order_delivered' and data.get('order_id') in self.orders:
+            self.to_rate.append(data['order_id'])
+
+    def menu(self, restaurant_id):
+        if restaurant_id not in self.menus:
+            response = self.client.get(f'/get_menu/{restaurant_id}', name='/get_menu/[restaurant]')
+            try:
+                self.menus[restaurant_id] = response.json().get('menu') or {}
+            except ValueError:
+                return {}
+        return self.menus[restaurant_id]
+
+    @task(3)
+    def passer_commande(self):
+        restaurant_id = random.choice(RESTAURANTS)
+        menu = self.menu(restaurant_id)
+        if not menu:
+            return
+        names = random.sample(list(menu), min(len(menu), random.randint(1, 3)))
+        items = [{'item': name, 'quantity': random.randint(1, 2), 'price': menu[name]} for name in names]
+        response = self.client.post('/passer_commande', json={'restaurant_id': restaurant_id, 'items': items},
+                                    name='/passer_commande')
+        try:
+            order_id = response.json().get('order_id')
+        except ValueError:
+            order_id = None
+        if order_id:
+            self.orders.append(order_id)
+
+    @task(4)
+    def synchroniser(self):
+        self.sync()
 
     @task(2)
-    def get_restaurants(self):
-        self.client.get("/get_restaurants")
+    def suivre_commande(self):
+        if self.orders:
+            self.client.get(f'/order/{random.choice(self.orders)}', name='/order/[id]')
 
     @task(1)
-    def passer_commande(self):
-        payload = {
-            "restaurant_id": "restaurant1",
-            "items": [
-                {"item": "Pizza", "quantity": 1, "price": 12.0},
-                {"item": "Boisson", "quantity": 1, "price": 3.0}
-            ]
-        }
-        self.client.post("/passer_commande", json=payload)
+    def rechercher(self):
+        with self.client.get(f"/search?q={random.choice(['pizza', 'burger', 'sushi', 'salade', 'pi'])}",
+                             name='/search', catch_response=True) as response:
+            # 503 pendant la construction de l'index des menus, au démarrage du serveur
+            if response.status_code == 503:
+                response.success()
+
+    @task(1)
+    def tableau_de_bord(self):
+        self.open_dashboard()
+
+    @task(2)
+    def noter_livreur(self):
+        if self.to_rate:
+            order_id = self.to_rate.popleft()
+            self.client.post(f'/noter_livreur/{order_id}', json={'note': random.randint(3, 5)},
+                             name='/noter_livreur/[id]')
+
+
+class RestaurantUser(RoleUser):
+    """Marque prêtes les commandes reçues par son flux, après un temps de préparation."""
+
+    weight = 2
+    role = 'restaurant'
+    wait_time = between(1, 3)
+
+    def on_start(self):
+        self.to_prepare = deque()
+        super().on_start()
+        self.open_dashboard()
+
+    def on_event(self, event_type, data):
+        if event_type == 'order_created' and data.get('order_id'):
+            self.to_prepare.append((time.time() + random.uniform(2, 10), data['order_id']))
+
+    @task(5)
+    def marquer_prete(self):
+        if self.to_prepare and self.to_prepare[0][0] <= time.time():
+            _, order_id = self.to_prepare.popleft()
+            self.client.post(f'/marquer_prete/{order_id}', name='/marquer_prete/[id]')
+
+    @task(3)
+    def synchroniser(self):
+        self.sync()
+
+    @task(1)
+    def tableau_de_bord(self):
+        self.open_dashboard()
+
+
+class DriverUser(RoleUser):
+    """Envoie sa position, montre son intérêt pendant la fenêtre de 60 s et livre ses commandes."""
+
+    weight = 6
+    role = 'livreur'
+    wait_time = between(1, 3)
+
+    def on_start(self):
+        # Autour de Paris, comme les restaurants de test
+        self.longitude = 2.35 + random.uniform(-0.05, 0.05)
+        self.latitude = 48.86 + random.uniform(-0.03, 0.03)
+        self.ready = deque(maxlen=50)
+        self.to_deliver = deque()
+        super().on_start()
+        self.open_dashboard()
+
+    def on_event(self, event_type, data):
+        if event_type == 'order_ready' and data.get('order_id'):
+            self.ready.append((time.time(), data['order_id']))
+        elif event_type in ('driver_assigned', 'auto_assignment') and data.get('driver_id') == self.username:
+            self.to_deliver.append((time.time() + random.uniform(5, 20), data['order_id']))
+
+    @task(6)
+    def update_position(self):
+        self.longitude += random.uniform(-0.001, 0.001)
+        self.latitude += random.uniform(-0.001, 0.001)
+        self.client.post('/update_position', json={'longitude': self.longitude, 'latitude': self.latitude},
+                         name='/update_position')
+
+    @task(4)
+    def montrer_interet(self):
+        # Une partie seulement des commandes prêtes, et seulement dans la fenêtre
+        while self.ready:
+            received, order_id = self.ready.popleft()
+            if time.time() - received < ACCEPTANCE_WINDOW_SECONDS - 5 and random.random() < 0.5:
+                self.client.post(f'/montrer_interet/{order_id}', name='/montrer_interet/[id]')
+                return
+
+    @task(3)
+    def marquer_livree(self):
+        if self.to_deliver and self.to_deliver[0][0] <= time.time():
+            _, order_id = self.to_deliver.popleft()
+            self.client.post(f'/marquer_livree/{order_id}', name='/marquer_livree/[id]')
+
+    @task(2)
+    def synchroniser(self):
+        self.sync()
+
+    @task(1)
+    def tableau_de_bord(self):
+        self.open_dashboard()
+
+
+class ManagerUser(RoleUser):
+    """Supervise toutes les commandes et choisit un livreur pendant sa fenêtre de décision."""
+
+    weight = 1
+    role = 'manager'
+    wait_time = between(1, 3)
+
+    def on_start(self):
+        self.decisions = deque()
+        super().on_start()
+        self.open_dashboard()
+
+    def on_event(self, event_type, data):
+        # Les candidats sont aussi attribués automatiquement en fin de fenêtre:
+        # le manager n'en traite qu'une partie
+        if event_type == 'manager_decision_started' and data.get('order_id') and random.random() < 0.7:
+            self.decisions.append(data['order_id'])
+
+    @task(4)
+    def choisir_livreur(self):
+        if not self.decisions:
+            return
+        order_id = self.decisions.popleft()
+        response = self.client.get(f'/get_order_candidates/{order_id}', name='/get_order_candidates/[id]')
+        try:
+            body = response.json()
+        except ValueError:
+            return
+        if body.get('order_status') == 'ready' and body.get('candidates'):
+            driver = body['candidates'][0]['id']
+            self.client.post(f'/choisir_livreur/{order_id}/{driver}', name='/choisir_livreur/[id]/[livreur]')
+
+    @task(3)
+    def synchroniser(self):
+        self.sync()
+
+    @task(2)
+    def tableau_de_bord(self):
+        self.client.get(random.choice(['/dashboard', '/dashboard?status=ready', '/dashboard?status=pending']),
+                        name='/dashboard [manager]')
+
+    @task(1)
+    def page_suivante(self):
+        self.client.get('/manager/orders?limit=50', name='/manager/orders')
+
+
+class StreamListener(RoleUser):
+    """Flux /events manager ouvert pendant tout le test (le nombre de connexions pèse sur la diffusion)."""
+
+    weight = 4
+    role = 'manager'
+    listen_in_background = False
+    wait_time = between(1, 1)
+
+    @task
+    def ecouter(self):
+        self.listen()
+
+
+@events.quitting.add_listener
+def report_percentiles(environment, **kwargs):
+    """p50/p95/p99 par route et par type d'événement, et validation des seuils."""
+    failures = []
+    print(f"\n{'Type':<5} {'Nom':<40} {'Requêtes':>9} {'Échecs':>7} {'p50':>7} {'p95':>7} {'p99':>7}")
+    for (name, method), entry in sorted(environment.stats.entries.items(), key=lambda item: (item[0][1], item[0][0])):
+        if not entry.num_requests:
+            continue
+        p50, p95, p99 = (entry.get_response_time_percentile(p) for p in (0.5, 0.95, 0.99))
+        print(f"{method:<5} {name:<40} {entry.num_requests:>9} {entry.num_failures:>7} {p50:>7.0f} {p95:>7.0f} {p99:>7.0f}")
+        if method == 'SSE':
+            if p99 > MAX_EVENT_LAG_MS:
+                failures.append(f"retard {name} p99 {p99:.0f} ms > {MAX_EVENT_LAG_MS:.0f} ms")
+        elif name != '/events' and p99 > MAX_P99_MS:
+            failures.append(f"{method} {name} p99 {p99:.0f} ms > {MAX_P99_MS:.0f} ms")
+
+    total = environment.stats.total
+    if total.fail_ratio > MAX_FAILURE_RATIO:
+        failures.append(f"taux d'échec {total.fail_ratio:.2%} > {MAX_FAILURE_RATIO:.2%}")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        environment.process_exit_code = 1
+    else:
+        print("✅ Seuils respectés")
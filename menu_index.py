@@ -0,0 +1,348 @@
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from functools import lru_cache
+
+from event_bus import change_streams_unsupported
+from restaurant_search import normalize_name
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+@lru_cache(maxsize=200000)
+def tokenize(text):
+    """Mots normalisés (minuscules, sans accents) d'un nom de restaurant ou d'article."""
+    return tuple(TOKEN_RE.findall(normalize_name(text)))
+
+
+class MenuIndex:
+    """Index inversé en mémoire des noms de restaurants et des articles de menu.
+
+    Les restaurants et articles reçoivent des identifiants entiers ; chaque
+    terme pointe vers un array('I') de ces identifiants, et le vocabulaire
+    trié sert d'arbre de préfixes compact (bisect) pour l'autocomplétion.
+    Le dernier mot d'une requête est traité comme un préfixe.
+
+    Un restaurant modifié reçoit un nouvel identifiant ; les anciennes
+    entrées sont ignorées à la lecture puis purgées par compact().
+
+    Sans Change Streams (mongod sans replica set), l'index est reconstruit
+    toutes les reload_interval secondes.
+    """
+
+    def __init__(self, restaurants_col, max_expansions=64, compact_ratio=0.3, reload_interval=300):
+        self.restaurants_col = restaurants_col
+        self.reload_interval = reload_interval
+        self.mode = 'changestream'
+        self.max_expansions = max_expansions
+        self.compact_ratio = compact_ratio
+        self.lock = threading.RLock()
+        self.ready = False
+        self.thread = None
+        self.build_ms = 0.0
+        self._reset()
+
+    STATE = ('rids', 'rid_of', 'names', 'menus', 'item_owner', 'name_postings',
+             'item_postings', 'terms', 'strings', 'dead_items', 'bulk')
+
+    def _reset(self):
+        self.rids = []            # entier -> _id du restaurant (None si remplacé)
+        self.rid_of = {}          # _id -> entier courant
+        self.names = []           # entier -> nom du restaurant
+        self.menus = []           # entier -> (premier id d'article, noms, prix)
+        self.item_owner = array('I')
+        self.name_postings = {}   # terme -> restaurants
+        self.item_postings = {}   # terme -> articles
+        self.terms = []           # vocabulaire trié
+        self.strings = {}         # noms d'articles partagés entre restaurants
+        self.dead_items = 0
+        self.bulk = False
+
+    # --- Construction ---
+
+    def load(self):
+        """Reconstruit l'index depuis MongoDB (une seule lecture en flux).
+
+        La construction se fait à côté puis remplace l'index courant: les
+        recherches continuent pendant ce temps sur l'ancienne version.
+        """
+        start = time.perf_counter()
+        fresh = MenuIndex(None, self.max_expansions, self.compact_ratio)
+        fresh.bulk = True
+        cursor = self.restaurants_col.find(
+            {}, {"name": 1, "menu.nom_article": 1, "menu.prix": 1}, batch_size=1000
+        )
+        for count, doc in enumerate(cursor, 1):
+            fresh._add_doc(doc)
+            if count % 100 == 0:
+                # Construction longue (CPU): rend la main aux autres green threads sous eventlet
+                time.sleep(0)
+        fresh._end_bulk()
+        with self.lock:
+            self.__dict__.update({key: getattr(fresh, key) for key in self.STATE})
+            self.ready = True
+        self.build_ms = (time.perf_counter() - start) * 1000
+        return len(self.rid_of)
+
+    def add_restaurant(self, restaurant_id, name, items):
+        """Ajoute ou remplace un restaurant. items: [(nom_article, prix), ...]."""
+        with self.lock:
+            self._remove(restaurant_id)
+            self._add(restaurant_id, name, items)
+            self._maybe_compact()
+
+    def remove_restaurant(self, restaurant_id):
+        with self.lock:
+            self._remove(restaurant_id)
+            self._maybe_compact()
+
+    def bulk_add(self, restaurants):
+        """Ajout en masse [(id, nom, items), ...] avec un seul tri du vocabulaire."""
+        with self.lock:
+            self.bulk = True
+            for restaurant_id, name, items in restaurants:
+                self._remove(restaurant_id)
+                self._add(restaurant_id, name, items)
+            self._end_bulk()
+            self.ready = True
+
+    def _add_doc(self, doc):
+        items = [
+            (item['nom_article'], float(item['prix']))
+            for item in doc.get('menu', [])
+            if 'nom_article' in item and 'prix' in item
+        ]
+        self._remove(doc['_id'])
+        self._add(doc['_id'], doc.get('name', doc['_id']), items)
+
+    def _add(self, restaurant_id, name, items):
+        r = len(self.rids)
+        self.rids.append(restaurant_id)
+        self.rid_of[restaurant_id] = r
+        self.names.append(name)
+
+        first = len(self.item_owner)
+        names = tuple(self.strings.setdefault(n, n) for n, _ in items)
+        self.menus.append((first, names, array('d', (p for _, p in items))))
+
+        for term in set(tokenize(name)):
+            self._post(self.name_postings, term, r)
+        for i, item_name in enumerate(names):
+            self.item_owner.append(r)
+            for term in set(tokenize(item_name)):
+                self._post(self.item_postings, term, first + i)
+
+    def _post(self, postings, term, doc_id):
+        ids = postings.get(term)
+        if ids is None:
+            if term not in self.name_postings and term not in self.item_postings:
+                if self.bulk:
+                    self.terms.append(term)
+                else:
+                    insort(self.terms, term)
+            ids = postings[term] = array('I')
+        ids.append(doc_id)
+
+    def _end_bulk(self):
+        self.terms.sort()
+        self.bulk = False
+
+    def _remove(self, restaurant_id):
+        r = self.rid_of.pop(restaurant_id, None)
+        if r is None:
+            return
+        self.rids[r] = None
+        self.names[r] = None
+        self.dead_items += len(self.menus[r][1])
+        self.menus[r] = None
+
+    def _maybe_compact(self):
+        total = len(self.item_owner)
+        if total and self.dead_items > 1000 and self.dead_items > total * self.compact_ratio:
+            self.compact()
+
+    def compact(self):
+        """Reconstruit les listes sans les restaurants remplacés ou supprimés."""
+        with self.lock:
+            live = [
+                (self.rids[r], self.names[r], list(zip(self.menus[r][1], self.menus[r][2])))
+                for r in self.rid_of.values()
+            ]
+            self._reset()
+            self.bulk_add(live)
+
+    # --- Lecture ---
+
+    def _expand(self, prefix):
+        """Termes du vocabulaire commençant par prefix (au plus max_expansions)."""
+        terms = []
+        i = bisect_left(self.terms, prefix)
+        while i < len(self.terms) and len(terms) < self.max_expansions:
+            term = self.terms[i]
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+            i += 1
+        return terms
+
+    def _matching(self, postings, exact, prefix, max_scan):
+        """Identifiants qui contiennent tous les mots exacts et un terme commençant par prefix.
+
+        La plus petite liste est parcourue (au plus max_scan entrées) ; l'appartenance
+        aux autres se vérifie par bisect, les listes étant triées par construction.
+        Un même identifiant peut sortir plusieurs fois (plusieurs complétions).
+        """
+        sources = []
+        for term in exact:
+            ids = postings.get(term)
+            if ids is None:
+                return
+            sources.append([ids])
+        expanded = [postings[t] for t in self._expand(prefix) if t in postings]
+        if not expanded:
+            return
+        sources.append(expanded)
+        sources.sort(key=lambda lists: sum(len(ids) for ids in lists))
+
+        others = sources[1:]
+        scanned = 0
+        for ids in sources[0]:
+            for doc_id in ids:
+                scanned += 1
+                if scanned > max_scan:
+                    return
+                for lists in others:
+                    for other in lists:
+                        i = bisect_left(other, doc_id)
+                        if i < len(other) and other[i] == doc_id:
+                            break
+                    else:
+                        break  # absent de toutes les listes de ce mot
+                else:
+                    yield doc_id
+
+    def search(self, query, limit=20, items_per_restaurant=5, max_scan=5000):
+        """Restaurants dont le nom ou des articles contiennent tous les mots de la requête.
+
+        Renvoie [{id, name, name_match, items: [{nom_article, prix}]}] : les
+        correspondances sur le nom d'abord, puis sur les articles.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        exact, prefix = tokens[:-1], tokens[-1]
+
+        with self.lock:
+            results = {}
+            for r in self._matching(self.name_postings, exact, prefix, max_scan):
+                if r in results or self.rids[r] is None:
+                    continue
+                results[r] = {'id': self.rids[r], 'name': self.names[r],
+                              'name_match': True, 'items': []}
+                if len(results) >= limit:
+                    break
+
+            seen = set()
+            for item_id in self._matching(self.item_postings, exact, prefix, max_scan):
+                r = self.item_owner[item_id]
+                if item_id in seen or self.rids[r] is None:
+                    continue
+                seen.add(item_id)
+                entry = results.get(r)
+                if entry is None:
+                    if len(results) >= limit:
+                        break
+                    entry = results[r] = {'id': self.rids[r], 'name': self.names[r],
+                                          'name_match': False, 'items': []}
+                if len(entry['items']) < items_per_restaurant:
+                    first, names, prices = self.menus[r]
+                    entry['items'].append({'nom_article': names[item_id - first],
+                                           'prix': prices[item_id - first]})
+
+        return list(results.values())
+
+    def suggest(self, query, limit=8):
+        """Complétions du dernier mot, les plus fréquentes d'abord."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self.lock:
+            terms = self._expand(tokens[-1])
+            frequency = {
+                t: len(self.name_postings.get(t, ())) + len(self.item_postings.get(t, ()))
+                for t in terms
+            }
+        terms.sort(key=lambda t: -frequency[t])
+        return terms[:limit]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'ready': self.ready,
+                'mode': self.mode,
+                'restaurants': len(self.rid_of),
+                'items': len(self.item_owner) - self.dead_items,
+                'dead_items': self.dead_items,
+                'terms': len(self.terms),
+                'postings': sum(len(ids) for ids in self.name_postings.values())
+                + sum(len(ids) for ids in self.item_postings.values()),
+                'distinct_item_names': len(self.strings),
+                'build_ms': round(self.build_ms, 1)
+            }
+
+    # --- Mise à jour par Change Stream ---
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                # Le flux est ouvert avant la lecture complète: aucune
+                # modification faite pendant la construction n'est perdue
+                with self.restaurants_col.watch(full_document='updateLookup') as stream:
+                    count = self.load()
+                    print(f"🔎 Index des menus construit ({count} restaurants, {self.build_ms:.0f} ms)")
+                    for change in stream:
+                        self._apply(change)
+            except Exception as e:
+                if change_streams_unsupported(e):
+                    break
+                print(f"Erreur Change Stream index des menus: {e}")
+                if not self.ready:
+                    self._load_logged()  # /search disponible en attendant le flux
+                time.sleep(1)
+
+        print(f"⚠️ Change Streams indisponibles: index des menus reconstruit toutes les {self.reload_interval} s")
+        self.mode = 'reload'
+        while True:
+            self._load_logged()
+            time.sleep(self.reload_interval)
+
+    def _load_logged(self):
+        try:
+            count = self.load()
+            print(f"🔎 Index des menus construit ({count} restaurants, {self.build_ms:.0f} ms)")
+        except Exception as e:
+            print(f"Erreur construction de l'index des menus: {e}")
+
+    def _apply(self, change):
+        operation = change['operationType']
+        if operation in ('insert', 'update', 'replace'):
+            doc = change.get('fullDocument')
+            if doc is None:
+                self.remove_restaurant(change['documentKey']['_id'])
+                return
+            with self.lock:
+                self._add_doc(doc)
+                self._maybe_compact()
+        elif operation == 'delete':
+            self.remove_restaurant(change['documentKey']['_id'])
+        else:
+            # drop, rename, invalidate: le flux se termine et l'index est reconstruit
+            self.ready = False
@@ -0,0 +1,259 @@
+import itertools
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+
+import bson
+from flask import request
+from pymongo import monitoring
+
+# Seaux des histogrammes, en secondes (ou en nombre d'allers-retours)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+EVENT_LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} counter")
+        with self.lock:
+            values = list(self.values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+
+
+class Histogram:
+    """Histogramme à seaux fixes par jeu d'étiquettes: un bisect et un verrou par observation."""
+
+    def __init__(self, name, help, buckets, label_names=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.label_names = label_names
+        self.series = {}  # étiquettes -> [comptes par seau (+Inf en dernier), somme]
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} histogram")
+        with self.lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self.series.items()]
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+
+
+class Gauge:
+    """Valeur lue au moment de l'export: read() renvoie un nombre ou {étiquettes: nombre}."""
+
+    def __init__(self, name, help, read, label_names=()):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.label_names = label_names
+
+    def render(self, lines):
+        try:
+            value = self.read()
+        except Exception as e:
+            print(f"Erreur lecture de la métrique {self.name}: {e}")
+            return
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} gauge")
+        values = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, number in values:
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {number}")
+
+
+class Metrics:
+    """Métriques du processus, exportées au format texte de Prometheus (GET /metrics).
+
+    Les compteurs et histogrammes sont mis à jour sur le chemin des
+    requêtes (un verrou court par observation) ; les jauges sont lues
+    seulement à l'export.
+    """
+
+    def __init__(self):
+        self.collectors = []
+        # Allers-retours MongoDB de la requête en cours (par thread, ou par green thread sous eventlet)
+        self.local = threading.local()
+
+    def counter(self, name, help, label_names=()):
+        return self._add(Counter(name, help, label_names))
+
+    def histogram(self, name, help, buckets, label_names=()):
+        return self._add(Histogram(name, help, buckets, label_names))
+
+    def gauge(self, name, help, read, label_names=()):
+        return self._add(Gauge(name, help, read, label_names))
+
+    def _add(self, collector):
+        self.collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        for collector in self.collectors:
+            collector.render(lines)
+        lines.append('')
+        return '\n'.join(lines)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Commandes MongoDB par collection et opération: nombre, durée, échecs et octets.
+
+    La durée est celle mesurée par pymongo (envoi et réponse). Les octets
+    s'obtiennent en réencodant commande et réponse en BSON (environ 12 µs
+    pour 20 petits documents): seule une commande sur bytes_every est
+    mesurée, et compte pour bytes_every (0: pas de mesure des octets).
+    Chaque commande lancée pendant une requête HTTP compte un aller-retour
+    pour cette requête.
+    """
+
+    def __init__(self, metrics, bytes_every=10):
+        self.local = metrics.local
+        self.bytes_every = bytes_every
+        self.calls = itertools.count()
+        self.pending = {}  # request_id -> (collection, octets envoyés ou None si non mesuré)
+        self.duration = metrics.histogram(
+            'mongodb_command_duration_seconds', "Durée des commandes MongoDB", MONGO_BUCKETS,
+            ('collection', 'command'))
+        self.failures = metrics.counter(
+            'mongodb_command_failures_total', "Commandes MongoDB en échec", ('collection', 'command'))
+        self.sent = metrics.counter(
+            'mongodb_command_sent_bytes_total', "Octets envoyés à MongoDB (BSON, estimation par échantillon)",
+            ('collection', 'command'))
+        self.received = metrics.counter(
+            'mongodb_command_received_bytes_total', "Octets reçus de MongoDB (BSON, estimation par échantillon)",
+            ('collection', 'command'))
+
+    def started(self, event):
+        command = event.command
+        name = event.command_name
+        collection = command.get('collection') if name == 'getMore' else command.get(name)
+        if not isinstance(collection, str):
+            collection = ''
+        sent = None
+        if self.bytes_every and next(self.calls) % self.bytes_every == 0:
+            sent = len(bson.encode(command))
+        self.pending[event.request_id] = (collection, sent)
+        try:
+            self.local.round_trips += 1
+        except AttributeError:
+            pass  # hors requête HTTP (threads de fond)
+
+    def succeeded(self, event):
+        collection, sent = self.pending.pop(event.request_id, ('', None))
+        labels = (collection, event.command_name)
+        self.duration.observe(labels, event.duration_micros / 1e6)
+        if sent is not None:
+            self.sent.inc(labels, sent * self.bytes_every)
+            self.received.inc(labels, len(bson.encode(event.reply)) * self.bytes_every)
+
+    def failed(self, event):
+        collection, sent = self.pending.pop(event.request_id, ('', None))
+        labels = (collection, event.command_name)
+        self.duration.observe(labels, event.duration_micros / 1e6)
+        self.failures.inc(labels)
+        if sent is not None:
+            self.sent.inc(labels, sent * self.bytes_every)
+
+
+class RequestMetrics:
+    """Durée des requêtes Flask par route et méthode, statuts et allers-retours MongoDB par requête.
+
+    Pour un flux (SSE), la durée s'arrête à l'envoi des en-têtes.
+    """
+
+    def __init__(self, metrics):
+        self.local = metrics.local
+        self.duration = metrics.histogram(
+            'http_request_duration_seconds', "Durée des requêtes HTTP", REQUEST_BUCKETS, ('endpoint', 'method'))
+        self.round_trips = metrics.histogram(
+            'http_request_mongodb_round_trips', "Commandes MongoDB par requête HTTP", ROUND_TRIP_BUCKETS,
+            ('endpoint', 'method'))
+        self.responses = metrics.counter(
+            'http_requests_total', "Requêtes HTTP par statut", ('endpoint', 'method', 'status'))
+
+    def init_app(self, app):
+        app.before_request(self._before)
+        app.after_request(self._after)
+
+    def _before(self):
+        self.local.start = time.perf_counter()
+        self.local.round_trips = 0
+
+    def _after(self, response):
+        start = getattr(self.local, 'start', None)
+        if start is None:
+            return response
+        labels = (request.endpoint or 'none', request.method)
+        self.duration.observe(labels, time.perf_counter() - start)
+        self.round_trips.observe(labels, self.local.round_trips)
+        self.responses.inc(labels + (response.status_code,))
+        del self.local.start
+        del self.local.round_trips
+        return response
+
+
+def instrument_event_hub(metrics, hub):
+    """Connexions SSE, trames en attente et retard des événements reçus par le hub.
+
+    Le retard est l'écart entre la publication (timestamp de l'événement)
+    et sa réception par le hub, avant envoi aux navigateurs.
+    """
+    lag = metrics.histogram('sse_event_lag_seconds', "Retard des événements reçus par le hub",
+                            EVENT_LAG_BUCKETS, ('type',))
+    last_lag = {}
+
+    def observe(event_id, routing, event_doc):
+        timestamp = event_doc.get('timestamp')
+        if isinstance(timestamp, datetime):
+            seconds = max(0.0, (datetime.now() - timestamp).total_seconds())
+            lag.observe((event_doc.get('type', ''),), seconds)
+            last_lag['seconds'] = seconds
+
+    hub.add_listener(observe)
+    metrics.gauge('sse_event_last_lag_seconds', "Retard du dernier événement reçu",
+                  lambda: last_lag.get('seconds', 0.0))
+    metrics.gauge('sse_connections', "Flux SSE ouverts", lambda: hub.stats()['subscribers'])
+    metrics.gauge('sse_queued_frames', "Trames en attente d'envoi", lambda: hub.stats()['queued'])
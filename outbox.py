@@ -0,0 +1,222 @@
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY = 11000
+
+
+class EventOutbox:
+    """Publication différée et groupée des événements (boîte d'envoi).
+
+    Les handlers déposent les événements en mémoire ; un seul thread les
+    écrit sur le bus (event_bus.py) par lots ordonnés toutes les
+    interval_ms, ou dès que batch_size événements attendent. L'ordre de dépôt est conservé, donc
+    l'ordre des événements d'une même commande. Un lot en échec reste en
+    tête de file et est réessayé avec un délai croissant ; au-delà de
+    max_pending événements, publish() attend qu'il y ait de la place.
+
+    Pour un événement qui doit être atomique avec l'écriture d'une commande,
+    publish_in_transaction() l'insère dans outbox_col avec la session de la
+    transaction ; après la validation, request_relay() réveille le thread,
+    qui le publie sur le bus avant les événements déposés ensuite (une
+    collection plafonnée ne peut pas être écrite dans une transaction, et
+    Redis ou la mémoire n'y participent pas).
+    """
+
+    def __init__(self, bus, outbox_col=None, interval_ms=50, batch_size=500,
+                 max_pending=10000, max_backoff=5.0, relay_interval=1.0):
+        self.bus = bus
+        self.outbox_col = outbox_col
+        self.interval = interval_ms / 1000.0
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_backoff = max_backoff
+        self.relay_interval = relay_interval
+        self.pending = deque()
+        self.cond = threading.Condition()
+        self.thread = None
+        self.stopping = False
+        self.relay_requested = True  # reprendre ce qui reste d'un arrêt précédent
+        self.counters = {
+            'queued': 0,
+            'published': 0,
+            'batches': 0,
+            'retries': 0,
+            'rejected': 0,    # événements refusés par MongoDB (document invalide)
+            'dropped': 0,     # file pleine trop longtemps
+            'relayed': 0,
+            'last_batch_size': 0,
+            'max_pending_seen': 0
+        }
+
+    def start(self):
+        with self.cond:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping = False
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def publish(self, event, timeout=1.0):
+        """Dépose un événement sans appel réseau. Attend au plus timeout si la file est pleine."""
+        with self.cond:
+            if len(self.pending) >= self.max_pending:
+                self.cond.notify_all()
+                self.cond.wait_for(lambda: len(self.pending) < self.max_pending, timeout)
+                if len(self.pending) >= self.max_pending:
+                    self.counters['dropped'] += 1
+                    print(f"Événement {event.get('type')} perdu: file de publication pleine")
+                    return False
+            self.pending.append(event)
+            self.counters['queued'] += 1
+            if len(self.pending) > self.counters['max_pending_seen']:
+                self.counters['max_pending_seen'] = len(self.pending)
+            if len(self.pending) >= self.batch_size:
+                self.cond.notify_all()
+        return True
+
+    def publish_many(self, events):
+        for event in events:
+            self.publish(event)
+
+    def publish_in_transaction(self, event, db_session):
+        """Écrit l'événement dans la boîte d'envoi, dans la transaction de db_session.
+
+        Appeler request_relay() une fois la transaction validée.
+        """
+        self.outbox_col.insert_one(event, session=db_session)
+
+    def request_relay(self):
+        """Fait publier tout de suite la boîte d'envoi (après la validation d'une transaction)."""
+        with self.cond:
+            self.relay_requested = True
+            self.cond.notify_all()
+
+    def flush(self, defer_to_relay=False):
+        """Écrit un lot. Renvoie le nombre d'événements sortis de la file.
+
+        Avec defer_to_relay, rien n'est écrit si un relais est demandé: les
+        événements validés en transaction passent avant ceux déposés après.
+        """
+        with self.cond:
+            if defer_to_relay and self.relay_requested:
+                return 0
+            batch = list(islice(self.pending, self.batch_size))
+        if not batch:
+            return 0
+
+        done = 0
+        rejected = 0
+        try:
+            self.bus.write(batch, ordered=True)
+            done = len(batch)
+        except BulkWriteError as e:
+            done = e.details.get('nInserted', 0)
+            errors = e.details.get('writeErrors', [])
+            if errors and errors[0].get('index') == done:
+                if errors[0].get('code') == DUPLICATE_KEY:
+                    # Déjà écrit lors d'un essai précédent (l'_id est posé par pymongo)
+                    done += 1
+                else:
+                    # Document invalide: le réessayer bloquerait toute la file
+                    print(f"Événement rejeté par MongoDB: {errors[0].get('errmsg')}")
+                    done += 1
+                    rejected = 1
+            if done == 0:
+                raise
+
+        with self.cond:
+            for _ in range(done):
+                self.pending.popleft()
+            self.counters['published'] += done - rejected
+            self.counters['rejected'] += rejected
+            self.counters['batches'] += 1
+            self.counters['last_batch_size'] = done
+            self.cond.notify_all()
+        return done
+
+    def relay(self):
+        """Publie sur le bus les événements écrits en transaction, puis les retire."""
+        if self.outbox_col is None:
+            return 0
+        relayed = 0
+        while True:
+            docs = list(self.outbox_col.find().sort('_id', 1).limit(self.batch_size))
+            if not docs:
+                return relayed
+            try:
+                self.bus.write(docs, ordered=False)
+            except BulkWriteError as e:
+                # Doublons: déjà recopiés avant un arrêt, avant la suppression
+                if any(err.get('code') != DUPLICATE_KEY for err in e.details.get('writeErrors', [])):
+                    raise
+            self.outbox_col.delete_many({'_id': {'$in': [doc['_id'] for doc in docs]}})
+            relayed += len(docs)
+            with self.cond:
+                self.counters['relayed'] += len(docs)
+                self.cond.notify_all()
+            if len(docs) < self.batch_size:
+                return relayed
+
+    def stop(self, timeout=5.0):
+        """Écrit ce qui reste en file avant l'arrêt du processus."""
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+            thread = self.thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        else:
+            deadline = time.monotonic() + timeout
+            while self.pending and time.monotonic() < deadline:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Erreur publication des événements à l'arrêt: {e}")
+                    break
+        if self.pending:
+            print(f"⚠️ {len(self.pending)} événement(s) non publié(s) à l'arrêt")
+
+    def stats(self):
+        with self.cond:
+            c = dict(self.counters)
+            c['pending'] = len(self.pending)
+        c['interval_ms'] = int(self.interval * 1000)
+        c['batch_size'] = self.batch_size
+        return c
+
+    def _run(self):
+        backoff = 0.0
+        next_relay = 0.0
+        while True:
+            with self.cond:
+                if backoff:
+                    self.cond.wait(backoff)
+                elif not self.stopping and not self.relay_requested and len(self.pending) < self.batch_size:
+                    self.cond.wait(self.interval)
+                stopping = self.stopping
+                relay_now = self.relay_requested or time.monotonic() >= next_relay
+                self.relay_requested = False
+
+            try:
+                # Boîte d'envoi d'abord: un événement validé en transaction précède
+                # ceux de la même commande déposés en file après la validation
+                if relay_now:
+                    next_relay = time.monotonic() + self.relay_interval
+                    self.relay()
+                while self.pending and self.flush(defer_to_relay=True) == self.batch_size:
+                    pass
+                backoff = 0.0
+            except Exception as e:
+                if relay_now:
+                    with self.cond:
+                        self.relay_requested = True  # relais à refaire avant toute autre écriture
+                backoff = min(self.max_backoff, backoff * 2 or 0.1)
+                self.counters['retries'] += 1
+                print(f"Erreur publication des événements (nouvel essai dans {backoff:.1f}s): {e}")
+                continue
+
+            if stopping and not self.pending:
+                return
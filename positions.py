@@ -0,0 +1,207 @@
+import threading
+import time
+from datetime import datetime
+from pymongo import UpdateOne
+
+
+class PositionBuffer:
+    """Tampon d'écriture différée pour les positions GPS des livreurs.
+
+    Seul le dernier point de chaque livreur est gardé en mémoire. Un thread
+    l'écrit toutes les interval_ms avec un seul bulk_write non ordonné, puis
+    appelle on_flush(samples) pour publier au plus un événement par livreur.
+    """
+
+    def __init__(self, positions_col, on_flush=None, interval_ms=500):
+        self.positions_col = positions_col
+        self.on_flush = on_flush
+        self.interval = interval_ms / 1000.0
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+        self.counters = {
+            'received': 0,
+            'coalesced': 0,   # points remplacés avant écriture
+            'flushed': 0,
+            'batches': 0,
+            'errors': 0,
+            'last_batch_size': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0
+        }
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def update(self, driver_id, longitude, latitude, updated_at=None):
+        """Enregistre un point. Ne fait aucun appel réseau."""
+        sample = {
+            "driver_id": driver_id,
+            "longitude": longitude,
+            "latitude": latitude,
+            "updated_at": updated_at or datetime.now()
+        }
+        with self.lock:
+            self.counters['received'] += 1
+            previous = self.pending.get(driver_id)
+            if previous is not None:
+                self.counters['coalesced'] += 1
+                if previous['updated_at'] > sample['updated_at']:
+                    return
+            self.pending[driver_id] = sample
+
+    def latest(self, driver_id):
+        """Point en attente d'écriture pour ce livreur (lecture de ses propres écritures)."""
+        with self.lock:
+            return self.pending.get(driver_id)
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return 0
+            samples = self.pending
+            self.pending = {}
+
+        start = time.perf_counter()
+        operations = [
+            UpdateOne(
+                {"_id": driver_id},
+                {"$set": {
+                    "location": {
+                        "type": "Point",
+                        "coordinates": [s['longitude'], s['latitude']]
+                    },
+                    "updated_at": s['updated_at']
+                }},
+                upsert=True
+            )
+            for driver_id, s in samples.items()
+        ]
+        try:
+            self.positions_col.bulk_write(operations, ordered=False)
+        except Exception as e:
+            print(f"Erreur écriture positions: {e}")
+            with self.lock:
+                self.counters['errors'] += 1
+                # Remettre les points non écrits, sauf s'ils ont été remplacés
+                for driver_id, sample in samples.items():
+                    self.pending.setdefault(driver_id, sample)
+            return 0
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self.lock:
+            c = self.counters
+            c['flushed'] += len(samples)
+            c['batches'] += 1
+            c['last_batch_size'] = len(samples)
+            c['last_flush_ms'] = elapsed_ms
+            c['max_flush_ms'] = max(c['max_flush_ms'], elapsed_ms)
+            c['total_flush_ms'] += elapsed_ms
+
+        if self.on_flush:
+            try:
+                self.on_flush(list(samples.values()))
+            except Exception as e:
+                print(f"Erreur publication positions: {e}")
+        return len(samples)
+
+    def stop(self):
+        """Arrête le thread et écrit les derniers points."""
+        self.stopped.set()
+        self.flush()
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counters)
+            c['pending'] = len(self.pending)
+        c['avg_flush_ms'] = round(c.pop('total_flush_ms') / c['batches'], 3) if c['batches'] else 0.0
+        c['interval_ms'] = int(self.interval * 1000)
+        return c
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+
+MAX_TRAIL_SAMPLES = 1000
+
+
+def parse_samples(raw_samples):
+    """Valide une liste de points [{longitude, latitude, timestamp}, ...].
+
+    timestamp: millisecondes epoch (Date.now() côté navigateur) ou ISO 8601.
+    Renvoie les points triés par date. Lève ValueError si invalide.
+    """
+    if not isinstance(raw_samples, list) or not raw_samples:
+        raise ValueError("Liste de points vide")
+    if len(raw_samples) > MAX_TRAIL_SAMPLES:
+        raise ValueError(f"Trop de points (max {MAX_TRAIL_SAMPLES})")
+
+    samples = []
+    for raw in raw_samples:
+        ts = raw.get('timestamp')
+        if isinstance(ts, (int, float)):
+            ts = datetime.fromtimestamp(ts / 1000.0)
+        elif isinstance(ts, str):
+            ts = datetime.fromisoformat(ts)
+            if ts.tzinfo is not None:
+                # Même convention que le reste de l'application: heure locale naïve
+                ts = ts.astimezone().replace(tzinfo=None)
+        else:
+            raise ValueError("Horodatage manquant")
+        lon = float(raw['longitude'])
+        lat = float(raw['latitude'])
+        if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+            raise ValueError("Coordonnées invalides")
+        samples.append({"longitude": lon, "latitude": lat, "ts": ts})
+
+    samples.sort(key=lambda s: s['ts'])
+    return samples
+
+
+def downsample(samples, resolution_seconds):
+    """Garde le premier point de chaque tranche de resolution_seconds (points triés)."""
+    if resolution_seconds <= 0:
+        return samples
+    kept = []
+    last_bucket = None
+    for sample in samples:
+        bucket = int(sample['ts'].timestamp() // resolution_seconds)
+        if bucket != last_bucket:
+            kept.append(sample)
+            last_bucket = bucket
+    return kept
+
+
+def record_trail(history_col, driver_id, samples, resolution_seconds):
+    """Ajoute le trajet sous-échantillonné à la collection time-series. Renvoie le nombre de points écrits."""
+    kept = downsample(samples, resolution_seconds)
+    if kept:
+        history_col.insert_many([
+            {
+                "driver_id": driver_id,
+                "ts": s['ts'],
+                "location": {"type": "Point", "coordinates": [s['longitude'], s['latitude']]}
+            }
+            for s in kept
+        ], ordered=False)
+    return len(kept)
+
+
+def get_trail(history_col, driver_id, start, end, resolution_seconds=0):
+    """Trajet d'un livreur entre deux dates, éventuellement sous-échantillonné."""
+    cursor = history_col.find(
+        {"driver_id": driver_id, "ts": {"$gte": start, "$lte": end}},
+        {"_id": 0, "ts": 1, "location.coordinates": 1}
+    ).sort("ts", 1)
+    samples = [
+        {"longitude": doc['location']['coordinates'][0],
+         "latitude": doc['location']['coordinates'][1],
+         "ts": doc['ts']}
+        for doc in cursor
+    ]
+    return downsample(samples, resolution_seconds)
@@ -0,0 +1,136 @@
+import json
+import threading
+
+from flask import session
+from flask_socketio import SocketIO, join_room
+
+from serializer import dumps
+
+# Salons des diffusions par rôle (BROADCAST_ROLES d'event_hub)
+ROLE_ROOMS = {
+    'manager': 'managers',
+    'livreur': 'drivers',
+}
+
+
+class _Json:
+    """Encodeur Socket.IO: types BSON (dates, ObjectId) comme pour les trames SSE."""
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return dumps(obj).decode()
+
+    loads = staticmethod(json.loads)
+
+
+def member_rooms(role, username):
+    """Salons rejoints à la connexion d'un utilisateur."""
+    rooms = []
+    if role in ROLE_ROOMS:
+        rooms.append(ROLE_ROOMS[role])
+    if role == 'livreur':
+        rooms.append(f"driver:{username}")
+    elif role == 'restaurant':
+        rooms.append(f"restaurant:{username}")
+    elif role == 'client':
+        rooms.append(f"client:{username}")
+    return rooms
+
+
+def rooms_for(routing):
+    """Salons destinataires d'un événement, d'après son bloc de routage."""
+    if not routing:
+        return ['managers']
+    rooms = [ROLE_ROOMS[role] for role in routing.get('roles', []) if role in ROLE_ROOMS]
+    if routing.get('client'):
+        rooms.append(f"client:{routing['client']}")
+    if routing.get('restaurant'):
+        rooms.append(f"restaurant:{routing['restaurant']}")
+    rooms.extend(f"driver:{driver}" for driver in routing.get('drivers', []))
+    if routing.get('order_id'):
+        rooms.append(f"order:{routing['order_id']}")
+    return rooms
+
+
+class SocketTransport:
+    """Transport WebSocket optionnel (Flask-SocketIO), à côté des flux SSE.
+
+    Chaque connexion rejoint les salons de son utilisateur (managers,
+    drivers, driver:<id>, restaurant:<id>, client:<id>) et peut suivre une
+    commande (order:<id>). Les événements reçus par le Change Stream de
+    l'EventHub sont émis une fois par événement vers les seuls salons
+    concernés ; un client présent dans plusieurs salons ne le reçoit
+    qu'une fois. Les actions des livreurs (position, intérêt) passent par
+    la même connexion, avec accusé de réception.
+    """
+
+    def __init__(self, app, event_hub, async_mode='threading', can_follow=None):
+        self.socketio = SocketIO(app, async_mode=async_mode, json=_Json)
+        self.can_follow = can_follow
+        self.lock = threading.Lock()
+        self.counters = {
+            'connections': 0,
+            'rejected': 0,
+            'emitted': 0,
+            'actions': 0,
+            'action_errors': 0
+        }
+        self.socketio.on_event('connect', self._connect)
+        self.socketio.on_event('disconnect', self._disconnect)
+        self.socketio.on_event('follow_order', self._follow_order)
+        event_hub.add_listener(self.on_event)
+
+    def action(self, name, roles=None):
+        """Décorateur: handler(username, data) -> dict renvoyé en accusé de réception."""
+        def register(handler):
+            def on_action(data=None):
+                if 'username' not in session or (roles and session.get('role') not in roles):
+                    return {'status': 'error', 'message': 'Non autorisé'}
+                self._count('actions')
+                try:
+                    return handler(session['username'], data or {})
+                except Exception as e:
+                    self._count('action_errors')
+                    return {'status': 'error', 'message': str(e)}
+            self.socketio.on_event(name, on_action)
+            return handler
+        return register
+
+    def on_event(self, event_id, routing, event_doc):
+        """Appelé par l'EventHub pour chaque nouvel événement."""
+        rooms = rooms_for(routing)
+        if not rooms:
+            return
+        payload = dict(event_doc, id=event_id)
+        self.socketio.emit('event', payload, to=rooms)
+        self._count('emitted')
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def _connect(self, auth=None):
+        if 'username' not in session:
+            self._count('rejected')
+            return False
+        for room in member_rooms(session['role'], session['username']):
+            join_room(room)
+        with self.lock:
+            self.counters['connections'] += 1
+
+    def _disconnect(self, reason=None):
+        with self.lock:
+            self.counters['connections'] -= 1
+
+    def _follow_order(self, data=None):
+        order_id = (data or {}).get('order_id')
+        if 'username' not in session or not order_id:
+            return {'status': 'error', 'message': 'Non autorisé'}
+        if self.can_follow and not self.can_follow(session['role'], session['username'], order_id):
+            return {'status': 'error', 'message': 'Commande non trouvée'}
+        join_room(f"order:{order_id}")
+        return {'status': 'success'}
+
+    def _count(self, key):
+        with self.lock:
+            self.counters[key] += 1
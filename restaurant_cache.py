@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict
+
+from event_bus import change_streams_unsupported
+
+
+def build_menu(menu_list):
+    """Convertit la liste d'articles stockée en dictionnaire {nom_article: prix}."""
+    return {
+        item['nom_article']: float(item['prix'])
+        for item in menu_list
+        if 'nom_article' in item and 'prix' in item
+    }
+
+
+class RestaurantCache:
+    """Cache en mémoire (LRU borné) des restaurants et de leurs menus.
+
+    Chaque entrée, indexée par id de restaurant, contient le nom, les
+    coordonnées et le menu déjà converti en {nom_article: prix}. Un Change
+    Stream sur la collection des restaurants invalide l'entrée modifiée ;
+    la liste complète (id, nom) est invalidée à chaque changement. Sans
+    Change Streams (mongod sans replica set), tout le cache expire toutes
+    les ttl secondes.
+    """
+
+    def __init__(self, restaurants_col, max_size=1000, ttl=60):
+        self.restaurants_col = restaurants_col
+        self.max_size = max_size
+        self.ttl = ttl
+        self.mode = 'changestream'
+        self.entries = OrderedDict()
+        self.restaurant_list = None
+        # Incrémenté à chaque invalidation: un chargement commencé avant
+        # n'est pas mis en cache (il pourrait contenir une version périmée)
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.thread = None
+        self.listeners = []
+        self.counters = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'list_hits': 0,
+            'list_misses': 0
+        }
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def add_listener(self, callback):
+        """callback(restaurant_id) est appelé après chaque invalidation (None = tout)."""
+        self.listeners.append(callback)
+
+    def get(self, restaurant_id):
+        """Entrée {id, name, coordinates, menu} du restaurant, None s'il n'existe pas."""
+        with self.lock:
+            entry = self.entries.get(restaurant_id)
+            if entry is not None:
+                self.entries.move_to_end(restaurant_id)
+                self.counters['hits'] += 1
+                return entry
+            self.counters['misses'] += 1
+            generation = self.generation
+
+        doc = self.restaurants_col.find_one({"_id": restaurant_id}, {"name": 1, "location": 1, "menu": 1})
+        if not doc:
+            return None
+        entry = {
+            'id': doc['_id'],
+            'name': doc.get('name', doc['_id']),
+            'coordinates': doc.get('location', {}).get('coordinates', [0.0, 0.0]),
+            'menu': build_menu(doc['menu']) if 'menu' in doc else None
+        }
+
+        with self.lock:
+            if generation == self.generation:
+                self.entries[restaurant_id] = entry
+                self.entries.move_to_end(restaurant_id)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+                    self.counters['evictions'] += 1
+        return entry
+
+    def list_restaurants(self):
+        """Liste [{id, name}] de tous les restaurants."""
+        with self.lock:
+            if self.restaurant_list is not None:
+                self.counters['list_hits'] += 1
+                return self.restaurant_list
+            self.counters['list_misses'] += 1
+            generation = self.generation
+
+        restaurants = [
+            {"id": resto["_id"], "name": resto.get("name", resto["_id"])}
+            for resto in self.restaurants_col.find({}, {"_id": 1, "name": 1})
+        ]
+
+        with self.lock:
+            if generation == self.generation:
+                self.restaurant_list = restaurants
+        return restaurants
+
+    def invalidate(self, restaurant_id=None):
+        """Retire un restaurant (ou tout le cache si restaurant_id est None)."""
+        with self.lock:
+            self.generation += 1
+            self.counters['invalidations'] += 1
+            self.restaurant_list = None
+            if restaurant_id is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(restaurant_id, None)
+        for callback in self.listeners:
+            callback(restaurant_id)
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counters)
+            c['size'] = len(self.entries)
+            c['max_size'] = self.max_size
+            c['mode'] = self.mode
+        lookups = c['hits'] + c['misses']
+        c['hit_ratio'] = round(c['hits'] / lookups, 3) if lookups else 0.0
+        return c
+
+    def _run(self):
+        while True:
+            try:
+                with self.restaurants_col.watch() as stream:
+                    # Des changements ont pu être manqués avant l'ouverture du flux
+                    self.invalidate()
+                    for change in stream:
+                        key = change.get('documentKey')
+                        if key is None:
+                            # drop, rename...: on repart de zéro
+                            self.invalidate()
+                        else:
+                            self.invalidate(key['_id'])
+            except Exception as e:
+                if change_streams_unsupported(e):
+                    break
+                print(f"Erreur Change Stream restaurants: {e}")
+                self.invalidate()
+                time.sleep(1)
+
+        print(f"⚠️ Change Streams indisponibles: cache des restaurants vidé toutes les {self.ttl} s")
+        self.mode = 'ttl'
+        while True:
+            time.sleep(self.ttl)
+            self.invalidate()
@@ -0,0 +1,169 @@
+import base64
+import json
+import re
+import threading
+import time
+import unicodedata
+
+from pymongo import ASCENDING, UpdateOne
+
+
+def normalize_name(name):
+    """Nom en minuscules, sans accents ni espaces multiples (champ name_normalized)."""
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(stripped.lower().split())
+
+
+def backfill_normalized_names(restaurants_col, batch_size=1000):
+    """Renseigne name_normalized sur les restaurants qui ne l'ont pas encore."""
+    operations = []
+    updated = 0
+    for resto in restaurants_col.find({"name_normalized": {"$exists": False}}, {"name": 1}):
+        operations.append(UpdateOne(
+            {"_id": resto["_id"]},
+            {"$set": {"name_normalized": normalize_name(resto.get("name", resto["_id"]))}}
+        ))
+        if len(operations) >= batch_size:
+            updated += restaurants_col.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += restaurants_col.bulk_write(operations, ordered=False).modified_count
+    return updated
+
+
+def encode_cursor(mode, values):
+    """Curseur opaque: mode de recherche + clé de tri du dernier résultat."""
+    raw = json.dumps([mode] + list(values), separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Renvoie (mode, clé). Lève ValueError si le curseur est invalide."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        raise ValueError("Curseur invalide")
+    if not isinstance(data, list) or len(data) != 3 or data[0] not in ('prefix', 'text'):
+        raise ValueError("Curseur invalide")
+    return data[0], data[1:]
+
+
+class RestaurantSearch:
+    """Recherche de restaurants appuyée sur des index, paginée par clé.
+
+    - préfixe: regex ancrée sur name_normalized (index name_normalized, _id) ;
+    - texte: $text sur l'index texte de 'name', trié par score de pertinence ;
+    - pagination par curseur (clé du dernier résultat) au lieu de skip().
+
+    Une page coûte le même prix quelle que soit sa profondeur en mode
+    préfixe ; en mode texte le coût dépend du nombre de correspondances, pas
+    du numéro de page. Les totaux sont mis en cache (count_ttl secondes).
+    """
+
+    def __init__(self, restaurants_col, count_ttl=60, max_counts=1000):
+        self.restaurants_col = restaurants_col
+        self.count_ttl = count_ttl
+        self.max_counts = max_counts
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def search(self, term='', cursor=None, limit=10):
+        """Renvoie (restaurants [{id, name}], next_cursor, mode).
+
+        Sans curseur, un terme d'un seul mot est cherché par préfixe, puis en
+        texte intégral si le préfixe ne donne rien ; plusieurs mots partent
+        directement en texte intégral. Le curseur fixe le mode des pages suivantes.
+        """
+        normalized = normalize_name(term)
+        if cursor:
+            mode, after = decode_cursor(cursor)
+        else:
+            mode, after = ('text' if ' ' in normalized else 'prefix'), None
+
+        if mode == 'prefix':
+            restaurants, next_cursor = self._prefix_page(normalized, after, limit)
+            if not restaurants and after is None and normalized:
+                mode = 'text'
+        if mode == 'text':
+            restaurants, next_cursor = self._text_page(term, after, limit)
+        return restaurants, next_cursor, mode
+
+    def _prefix_page(self, normalized, after, limit):
+        conditions = []
+        if normalized:
+            conditions.append({"name_normalized": {"$regex": "^" + re.escape(normalized)}})
+        if after is not None:
+            last_name, last_id = after
+            conditions.append({"$or": [
+                {"name_normalized": {"$gt": last_name}},
+                {"name_normalized": last_name, "_id": {"$gt": last_id}}
+            ]})
+        query = {"$and": conditions} if conditions else {}
+
+        docs = list(self.restaurants_col.find(
+            query, {"name": 1, "name_normalized": 1}
+        ).sort([("name_normalized", ASCENDING), ("_id", ASCENDING)]).limit(limit + 1))
+
+        next_cursor = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_cursor = encode_cursor('prefix', [docs[-1].get("name_normalized", ""), docs[-1]["_id"]])
+        return [self._format(doc) for doc in docs], next_cursor
+
+    def _text_page(self, term, after, limit):
+        pipeline = [
+            {"$match": {"$text": {"$search": term}}},
+            {"$project": {"name": 1, "score": {"$meta": "textScore"}}}
+        ]
+        if after is not None:
+            last_score, last_id = after
+            pipeline.append({"$match": {"$or": [
+                {"score": {"$lt": last_score}},
+                {"score": last_score, "_id": {"$gt": last_id}}
+            ]}})
+        pipeline += [
+            {"$sort": {"score": -1, "_id": 1}},
+            {"$limit": limit + 1}
+        ]
+
+        docs = list(self.restaurants_col.aggregate(pipeline))
+        next_cursor = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_cursor = encode_cursor('text', [docs[-1]["score"], docs[-1]["_id"]])
+        return [self._format(doc) for doc in docs], next_cursor
+
+    def count(self, term, mode):
+        """Nombre total de résultats, mis en cache. Sans terme: estimation via les métadonnées."""
+        normalized = normalize_name(term)
+        key = (mode, normalized)
+        now = time.monotonic()
+        with self.lock:
+            cached = self.counts.get(key)
+            if cached is not None and cached[1] > now:
+                return cached[0]
+
+        if not normalized:
+            total = self.restaurants_col.estimated_document_count()
+        elif mode == 'prefix':
+            total = self.restaurants_col.count_documents(
+                {"name_normalized": {"$regex": "^" + re.escape(normalized)}}
+            )
+        else:
+            total = self.restaurants_col.count_documents({"$text": {"$search": term}})
+
+        with self.lock:
+            if len(self.counts) >= self.max_counts:
+                self.counts.clear()
+            self.counts[key] = (total, now + self.count_ttl)
+        return total
+
+    def clear_counts(self, restaurant_id=None):
+        """Oublie les totaux (appelé quand un restaurant change)."""
+        with self.lock:
+            self.counts.clear()
+
+    @staticmethod
+    def _format(doc):
+        return {"id": doc["_id"], "name": doc.get("name", doc["_id"])}
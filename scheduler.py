@@ -0,0 +1,176 @@
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class TimerScheduler:
+    """Planificateur unique pour les fenêtres des commandes.
+
+    Chaque timer est persisté dans le champ 'timer' de la commande
+    (type, expires_at, status) et suivi en mémoire dans un tas trié par
+    échéance. Un seul thread attend la prochaine échéance, au lieu d'un
+    thread endormi par commande. Au démarrage, les timers actifs sont
+    rechargés depuis MongoDB et ceux déjà échus partent immédiatement.
+    Un timer réservé ('firing') depuis plus de firing_grace secondes est
+    celui d'un processus arrêté pendant son exécution: il est réarmé.
+    """
+
+    def __init__(self, orders_col, firing_grace=30):
+        self.orders_col = orders_col
+        self.firing_grace = firing_grace
+        self.handlers = {}
+        self.heap = []
+        self.entries = {}  # order_id -> entrée courante du tas
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def register(self, timer_type, handler):
+        """Associe une fonction handler(order_id) à un type de timer."""
+        self.handlers[timer_type] = handler
+
+    def start(self):
+        """Recharge les timers persistés et démarre le thread unique."""
+        count = self.load_pending()
+        with self.cond:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        # Réservations trop récentes au démarrage (arrêt juste avant): revues après le délai de grâce
+        recheck = threading.Timer(self.firing_grace, self.recover_stale)
+        recheck.daemon = True
+        recheck.start()
+        print(f"⏱️ Planificateur démarré ({count} timer(s) rechargé(s))")
+
+    def load_pending(self):
+        self.recover_stale()  # réarmés puis rechargés avec les timers actifs
+        count = 0
+        for order in self.orders_col.find({"timer.status": "active"}, {"timer": 1}):
+            timer = order['timer']
+            if timer.get('type') not in self.handlers:
+                continue
+            expires_at = datetime.fromisoformat(timer['expires_at'])
+            self._push(order['_id'], timer['type'], expires_at)
+            count += 1
+        return count
+
+    def recover_stale(self):
+        """Réarme les timers réservés depuis plus de firing_grace secondes. Renvoie leur nombre."""
+        stale = (datetime.now() - timedelta(seconds=self.firing_grace)).isoformat()
+        count = 0
+        for order in self.orders_col.find(
+            {"timer.status": "firing",
+             "$or": [{"timer.fired_at": {"$lt": stale}}, {"timer.fired_at": {"$exists": False}}]},
+            {"timer": 1}
+        ):
+            timer = order['timer']
+            if timer.get('type') not in self.handlers:
+                continue
+            # Conditionnel: un autre processus a pu le réarmer ou le terminer entre-temps
+            result = self.orders_col.update_one(
+                {"_id": order['_id'], "timer.status": "firing", "timer.expires_at": timer['expires_at']},
+                {"$set": {"timer.status": "active"}, "$unset": {"timer.fired_at": ""},
+                 "$currentDate": {"updated_at": True}}
+            )
+            if result.modified_count:
+                self._push(order['_id'], timer['type'], datetime.fromisoformat(timer['expires_at']))
+                count += 1
+        if count:
+            print(f"⏱️ {count} timer(s) interrompu(s) réarmé(s)")
+        return count
+
+    def schedule(self, order_id, timer_type, delay_seconds):
+        """Persiste un timer sur la commande et le programme. Renvoie l'échéance."""
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=delay_seconds)
+        timer_data = {
+            "type": timer_type,
+            "expires_at": expires_at.isoformat(),
+            "status": "active",
+            "created_at": now.isoformat()
+        }
+        self.orders_col.update_one(
+            {"_id": order_id},
+            {"$set": {"timer": timer_data}, "$currentDate": {"updated_at": True}}
+        )
+        self._push(order_id, timer_type, expires_at)
+        return expires_at
+
+    def reschedule(self, order_id, delay_seconds):
+        """Repousse (ou avance) l'échéance du timer courant d'une commande."""
+        with self.cond:
+            entry = self.entries.get(order_id)
+        if entry is None:
+            return None
+        timer_type = entry[2]
+        expires_at = datetime.now() + timedelta(seconds=delay_seconds)
+        result = self.orders_col.update_one(
+            {"_id": order_id, "timer.type": timer_type, "timer.status": "active"},
+            {"$set": {"timer.expires_at": expires_at.isoformat()},
+             "$currentDate": {"updated_at": True}}
+        )
+        if result.matched_count == 0:
+            self.cancel(order_id)
+            return None
+        self._push(order_id, timer_type, expires_at)
+        return expires_at
+
+    def cancel(self, order_id):
+        """Annule le timer en mémoire. Le champ 'timer' est retiré par l'appelant
+        dans la même mise à jour que le changement de statut."""
+        with self.cond:
+            entry = self.entries.pop(order_id, None)
+            if entry is not None:
+                entry[3] = False
+        return entry is not None
+
+    def pending_count(self):
+        with self.cond:
+            return len(self.entries)
+
+    def _push(self, order_id, timer_type, expires_at):
+        # [échéance, order_id, type, valide, expires_at iso]
+        entry = [expires_at.timestamp(), order_id, timer_type, True, expires_at.isoformat()]
+        with self.cond:
+            previous = self.entries.get(order_id)
+            if previous is not None:
+                previous[3] = False
+            self.entries[order_id] = entry
+            heapq.heappush(self.heap, entry)
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while True:
+                    # Purger les entrées annulées ou remplacées
+                    while self.heap and not self.heap[0][3]:
+                        heapq.heappop(self.heap)
+                    if not self.heap:
+                        self.cond.wait()
+                        continue
+                    delay = self.heap[0][0] - time.time()
+                    if delay <= 0:
+                        break
+                    self.cond.wait(delay)
+                entry = heapq.heappop(self.heap)
+                entry[3] = False
+                if self.entries.get(entry[1]) is entry:
+                    del self.entries[entry[1]]
+            self._fire(entry[1], entry[2], entry[4])
+
+    def _fire(self, order_id, timer_type, expires_at):
+        # Réservation atomique: un seul processus exécute le timer, et un timer
+        # annulé ou remplacé entre-temps n'est pas exécuté.
+        claimed = self.orders_col.find_one_and_update(
+            {"_id": order_id, "timer.type": timer_type,
+             "timer.expires_at": expires_at, "timer.status": "active"},
+            {"$set": {"timer.status": "firing", "timer.fired_at": datetime.now().isoformat()}},
+            projection={"_id": 1}
+        )
+        if not claimed:
+            return
+        try:
+            self.handlers[timer_type](order_id)
+        except Exception as e:
+            print(f"Erreur timer {timer_type} pour {order_id}: {e}")
@@ -0,0 +1,428 @@
+"""Générateur de données synthétiques pour tester l'application aux volumes de production.
+
+Comptes (clients, managers, restaurants, livreurs), restaurants répartis
+autour des grandes villes avec des menus par type de cuisine, notes et
+positions des livreurs, et historique de commandes (répartition réaliste
+des statuts, heures de pointe, restaurants plus ou moins populaires).
+Tout est déterministe pour une graine donnée (--seed) ; chaque collection
+a sa propre suite aléatoire, changer le nombre de commandes ne change
+donc pas les restaurants.
+
+Les documents sont générés à la volée et écrits par insert_many non
+ordonnés de --batch-size documents, pendant que le lot suivant est
+généré: la mémoire ne dépend pas du volume. Les commandes peuvent être
+réparties sur plusieurs processus (--workers). Les documents existants
+(même _id) sont conservés. Les index manquants sont créés après le
+chargement, plus rapide que de les tenir à jour à chaque insertion.
+
+    python seed_data.py --mongo-uri "$MONGO_URI" --restaurants 100000 --drivers 20000 \\
+        --clients 500000 --orders 10000000 --workers 4 --drop
+    python seed_data.py --json donnees_fusionnees_avec_menus.json --restaurants 1000   # fichier d'initialisation
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+
+from indexes import ensure_indexes
+from restaurant_search import normalize_name
+
+PASSWORD_HASH = hashlib.sha256(b'123456').hexdigest()  # mot de passe des comptes de test
+DUPLICATE_KEY = 11000
+
+# Villes (longitude, latitude, poids, étalement en degrés): restaurants et livreurs autour du centre
+CITIES = [
+    ('Paris', 2.3488, 48.8534, 40, 0.06),
+    ('Lyon', 4.8357, 45.7640, 10, 0.04),
+    ('Marseille', 5.3698, 43.2965, 9, 0.05),
+    ('Toulouse', 1.4442, 43.6047, 7, 0.04),
+    ('Lille', 3.0573, 50.6292, 6, 0.03),
+    ('Bordeaux', -0.5792, 44.8378, 6, 0.04),
+    ('Nice', 7.2620, 43.7102, 5, 0.03),
+    ('Nantes', -1.5536, 47.2184, 5, 0.03),
+    ('Strasbourg', 7.7521, 48.5734, 4, 0.03),
+    ('Montpellier', 3.8767, 43.6108, 4, 0.03),
+    ('Rennes', -1.6778, 48.1173, 4, 0.03),
+]
+CITY_WEIGHTS = [city[3] for city in CITIES]
+
+# Type de cuisine -> (modèles de noms, plats et prix de base)
+CUISINES = {
+    'pizzeria': (['Pizzeria {n}', 'La Bella {n}', 'Pizza {n}'], [
+        ('Pizza Margherita', 10.5), ('Pizza Reine', 12.0), ('Pizza 4 Fromages', 13.5), ('Pizza Calzone', 13.0),
+        ('Pizza Diavola', 13.0), ('Pizza Végétarienne', 12.5), ('Lasagnes', 13.5), ('Salade César', 11.0)]),
+    'italien': (['Trattoria {n}', 'Da {n}', 'Osteria {n}'], [
+        ('Spaghetti Carbonara', 14.0), ('Penne Arrabbiata', 12.5), ('Risotto aux Champignons', 16.0),
+        ('Gnocchi Pesto', 14.5), ('Osso Buco', 21.0), ('Burrata', 11.0), ('Tagliatelle Bolognaise', 14.0)]),
+    'japonais': (['Sushi {n}', '{n} Sushi Bar', 'Yamato {n}'], [
+        ('Plateau Sushi 12 pièces', 17.0), ('California Rolls x8', 9.5), ('Maki Saumon x6', 6.5),
+        ('Chirashi Saumon', 16.5), ('Ramen Tonkotsu', 14.0), ('Gyozas x6', 7.0), ('Soupe Miso', 3.5)]),
+    'burger': (['{n} Burger', 'Burger & Co {n}', 'Le Smash {n}'], [
+        ('Cheeseburger', 11.0), ('Bacon Burger', 13.0), ('Burger Végétarien', 12.0), ('Double Smash', 14.5),
+        ('Chicken Burger', 12.5), ('Frites Maison', 4.0), ('Onion Rings', 5.0)]),
+    'indien': (['Taj {n}', 'Le Rajasthan {n}', 'Curry {n}'], [
+        ('Poulet Tikka Masala', 14.0), ('Poulet Butter', 14.5), ('Agneau Korma', 16.0), ('Dal Makhani', 11.0),
+        ('Biryani Poulet', 15.0), ('Cheese Naan', 4.0), ('Samoussas x3', 6.0)]),
+    'libanais': (['Le Cèdre {n}', 'Beyrouth {n}', 'Byblos {n}'], [
+        ('Assiette Mezzés', 15.0), ('Falafels x6', 7.5), ('Chawarma Poulet', 9.5), ('Houmous', 6.0),
+        ('Taboulé', 6.0), ('Kafta Grillée', 13.5), ('Manakish Zaatar', 5.5)]),
+    'chinois': (['Le Dragon {n}', 'Jardin de {n}', 'Wok {n}'], [
+        ('Canard Laqué', 17.0), ('Porc Aigre-Doux', 12.5), ('Nouilles Sautées', 10.5), ('Riz Cantonais', 8.0),
+        ('Raviolis Vapeur x6', 7.5), ('Poulet aux Noix de Cajou', 13.0), ('Bœuf aux Oignons', 13.5)]),
+    'thai': (['Bangkok {n}', 'Thaï {n}', 'Siam {n}'], [
+        ('Pad Thaï Crevettes', 14.0), ('Curry Vert Poulet', 13.5), ('Tom Yum', 9.0), ('Bœuf Loc Lac', 14.5),
+        ('Nems x4', 6.5), ('Riz Gluant', 3.5), ('Salade de Papaye', 8.5)]),
+    'mexicain': (['El {n}', 'Taqueria {n}', 'Cantina {n}'], [
+        ('Tacos al Pastor x3', 11.0), ('Burrito Bœuf', 12.5), ('Quesadilla Poulet', 10.5), ('Nachos', 8.0),
+        ('Chili con Carne', 12.0), ('Guacamole', 6.0), ('Enchiladas', 13.0)]),
+    'francais': (['Le Bistrot {n}', 'Chez {n}', 'La Table de {n}'], [
+        ('Bœuf Bourguignon', 18.5), ('Confit de Canard', 19.0), ('Croque-Monsieur', 10.0),
+        ('Quiche Lorraine', 9.5), ('Steak Frites', 17.0), ('Soupe à l\'Oignon', 8.5), ('Salade Niçoise', 12.5)]),
+    'kebab': (['{n} Kebab', 'Grill {n}', 'Istanbul {n}'], [
+        ('Kebab Sandwich', 7.5), ('Assiette Kebab', 11.0), ('Tacos XL', 9.5), ('Galette Poulet', 8.0),
+        ('Frites', 3.0), ('Durum', 8.5)]),
+}
+CUISINE_NAMES = list(CUISINES)
+NAME_WORDS = ['Marco', 'Luigi', 'Sakura', 'Nour', 'Léa', 'Antoine', 'Tokyo', 'Milano', 'Roma', 'Chloé',
+              'Karim', 'Mei', 'Paolo', 'Maison', 'Sofia', 'Hugo', 'Jade', 'Bastille', 'Montmartre', 'Vieux Port',
+              'Saint-Michel', 'Capitole', 'Croix-Rousse', 'Lumière', 'Soleil', 'Étoile', 'Papa', 'Mama']
+DRINKS = [('Coca-Cola', 3.0), ('Eau Minérale', 2.0), ('Limonade', 3.5), ('Thé Glacé', 3.5), ('Bière', 4.5)]
+DESSERTS = [('Tiramisu', 6.0), ('Fondant au Chocolat', 6.5), ('Cheesecake', 6.0), ('Crème Brûlée', 6.0),
+            ('Glace 2 Boules', 4.5)]
+
+# Historique: statuts d'une commande terminée, puis des commandes en cours (dernières heures)
+CLOSED_STATUSES = [('delivered', 92), ('cancelled', 8)]
+OPEN_STATUSES = [('pending', 25), ('ready', 15), ('assigned', 35), ('delivered', 25)]
+OPEN_WINDOW = timedelta(hours=2)
+ORDER_CHUNK = 100000
+# Répartition des commandes dans la journée (heures de pointe du déjeuner et du dîner)
+HOUR_WEIGHTS = [1, 0, 0, 0, 0, 0, 1, 2, 3, 3, 4, 9, 16, 14, 6, 3, 3, 5, 10, 17, 18, 12, 6, 3]
+
+
+def weighted(rng, choices):
+    return rng.choices([value for value, _ in choices], [weight for _, weight in choices])[0]
+
+
+def place(rng):
+    """Point (lon, lat) autour d'une ville tirée selon son poids."""
+    _, lon, lat, _, spread = rng.choices(CITIES, CITY_WEIGHTS)[0]
+    return round(lon + rng.gauss(0, spread), 6), round(lat + rng.gauss(0, spread * 0.7), 6)
+
+
+class Restaurant:
+    """Ce qu'il faut garder en mémoire d'un restaurant pour générer ses commandes."""
+
+    __slots__ = ('id', 'name', 'lon', 'lat', 'cuisine', 'price_factor')
+
+    def __init__(self, index, rng):
+        self.id = f"restaurant{index}"
+        self.cuisine = rng.choice(CUISINE_NAMES)
+        self.name = rng.choice(CUISINES[self.cuisine][0]).format(n=rng.choice(NAME_WORDS))
+        self.lon, self.lat = place(rng)
+        # Restaurants plus ou moins chers: un facteur sur les prix de base
+        self.price_factor = round(rng.uniform(0.85, 1.3), 2)
+
+    def menu(self):
+        dishes = CUISINES[self.cuisine][1] + DRINKS + DESSERTS
+        return [{'nom_article': name, 'prix': round(price * self.price_factor, 1)} for name, price in dishes]
+
+
+def generate_restaurants(count, seed):
+    rng = random.Random(f"{seed}-restaurants")
+    return [Restaurant(i, rng) for i in range(1, count + 1)]
+
+
+def restaurant_documents(restaurants):
+    for resto in restaurants:
+        yield {
+            '_id': resto.id,
+            'name': resto.name,
+            'name_normalized': normalize_name(resto.name),
+            'location': {'type': 'Point', 'coordinates': [resto.lon, resto.lat]},
+            'menu': resto.menu()
+        }
+
+
+def user_documents(prefix, role, count):
+    for i in range(1, count + 1):
+        yield {'_id': f"{prefix}{i}", 'password': PASSWORD_HASH, 'role': role}
+
+
+def driver_stat_documents(count, seed):
+    rng = random.Random(f"{seed}-drivers")
+    for i in range(1, count + 1):
+        deliveries = max(1, int(rng.lognormvariate(4, 1)))
+        avg = round(min(5.0, max(1.0, rng.gauss(4.5, 0.35))), 2)
+        yield {'_id': f"livreur{i}", 'avg_rating': avg, 'delivery_count': deliveries,
+               'total_rating': round(avg * deliveries, 2)}
+
+
+def position_documents(count, seed, now):
+    rng = random.Random(f"{seed}-positions")
+    for i in range(1, count + 1):
+        lon, lat = place(rng)
+        # Un tiers des livreurs en service (position récente), les autres hors ligne
+        age = rng.uniform(0, 300) if rng.random() < 0.33 else rng.uniform(3600, 30 * 86400)
+        yield {'_id': f"livreur{i}", 'location': {'type': 'Point', 'coordinates': [lon, lat]},
+               'updated_at': now - timedelta(seconds=age)}
+
+
+class OrderGenerator:
+    """Commandes historiques, de la plus ancienne à la plus récente, par tranches de ORDER_CHUNK.
+
+    Chaque tranche a sa propre suite aléatoire: le résultat ne dépend pas du
+    nombre de processus qui les génèrent. Les _id ('h' + 9 chiffres
+    hexadécimaux) ne peuvent pas entrer en collision avec ceux de
+    /passer_commande (8 caractères).
+    """
+
+    def __init__(self, count, restaurants, n_clients, n_drivers, days, seed, now):
+        self.count = count
+        self.restaurants = restaurants
+        self.n_drivers = n_drivers
+        self.days = days
+        self.seed = seed
+        self.now = now
+        self.start = now - timedelta(days=days)
+        # Popularité inégale (queue lourde pour les restaurants), tirage par poids cumulés
+        rng = random.Random(f"{seed}-popularity")
+        self.resto_weights = list(itertools.accumulate(rng.paretovariate(1.5) for _ in restaurants))
+        self.clients = range(1, n_clients + 1)
+        self.client_weights = list(itertools.accumulate(rng.lognormvariate(0, 0.8) for _ in self.clients))
+
+    def chunks(self):
+        return range((self.count + ORDER_CHUNK - 1) // ORDER_CHUNK)
+
+    def documents(self, chunk):
+        rng = random.Random(f"{self.seed}-orders-{chunk}")
+        now = self.now
+        for i in range(chunk * ORDER_CHUNK, min(self.count, (chunk + 1) * ORDER_CHUNK)):
+            # Jour uniforme sur la période, heure selon la charge de la journée ;
+            # la fin du dernier jour devient les commandes en cours
+            day = self.start + timedelta(days=self.days * i / self.count)
+            hour = rng.choices(range(24), HOUR_WEIGHTS)[0]
+            created_at = day.replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60),
+                                     microsecond=rng.randrange(1000000))
+            if created_at > now:
+                created_at = now - timedelta(seconds=rng.uniform(0, OPEN_WINDOW.total_seconds()))
+            resto = rng.choices(self.restaurants, cum_weights=self.resto_weights)[0]
+            client = f"client{rng.choices(self.clients, cum_weights=self.client_weights)[0]}"
+            dishes = CUISINES[resto.cuisine][1]
+            items = [(rng.choice(dishes), rng.choice((1, 1, 1, 2)))]
+            if rng.random() < 0.5:
+                items.append((rng.choice(DRINKS), rng.choice((1, 2))))
+            if rng.random() < 0.25:
+                items.append((rng.choice(DESSERTS), 1))
+            order_id = f"h{i:09x}"
+            order = {
+                '_id': order_id,
+                'id': order_id,
+                'client': client,
+                'restaurant': resto.id,
+                'restaurant_name': resto.name,
+                'restaurant_lon': str(resto.lon),
+                'restaurant_lat': str(resto.lat),
+                'articles': ", ".join(f"{quantity}x {name}" for (name, _), quantity in items),
+                'total_price': round(sum(price * resto.price_factor * quantity for (_, price), quantity in items), 2),
+                'created_at': created_at
+            }
+            status = weighted(rng, OPEN_STATUSES if now - created_at < OPEN_WINDOW else CLOSED_STATUSES)
+            order['status'] = status
+            if status in ('assigned', 'delivered'):
+                order['assigned_driver'] = f"livreur{rng.randrange(self.n_drivers) + 1}"
+            if status == 'delivered' and rng.random() < 0.6:
+                order['client_rating'] = weighted(rng, [(5, 55), (4, 30), (3, 9), (2, 3), (1, 3)])
+                order['rated_at'] = created_at + timedelta(minutes=rng.uniform(40, 180))
+            order['updated_at'] = created_at + timedelta(minutes=rng.uniform(1, 60))
+            yield order
+
+
+def insert_batch(collection, batch):
+    """insert_many non ordonné ; sur une base déjà remplie, les documents existants sont conservés."""
+    try:
+        collection.insert_many(batch, ordered=False)
+    except BulkWriteError as e:
+        if any(err.get('code') != DUPLICATE_KEY for err in e.details.get('writeErrors', [])):
+            raise
+
+
+class BulkLoader:
+    """Écrit les lots dans un thread pendant que le suivant est généré."""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.batches = queue.Queue(maxsize=4)
+        self.error = None
+        self.writer = threading.Thread(target=self._write, daemon=True)
+        self.writer.start()
+
+    def load(self, collection, documents, label, total):
+        start = time.perf_counter()
+        last_report = start
+        written = 0
+        batch = []
+        for doc in documents:
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                self._put(collection, batch)
+                written += len(batch)
+                batch = []
+                now = time.perf_counter()
+                if now - last_report >= 5:
+                    last_report = now
+                    print(f"  {label}: {written}/{total} ({written / (now - start):,.0f} docs/s)")
+        if batch:
+            self._put(collection, batch)
+            written += len(batch)
+        self.batches.join()
+        if self.error:
+            raise self.error
+        elapsed = time.perf_counter() - start
+        print(f"✅ {label}: {written} documents en {elapsed:.1f} s ({written / max(elapsed, 1e-9):,.0f} docs/s)")
+
+    def _put(self, collection, batch):
+        if self.error:
+            raise self.error
+        self.batches.put((collection, batch))
+
+    def _write(self):
+        while True:
+            collection, batch = self.batches.get()
+            try:
+                if self.error is None:
+                    insert_batch(collection, batch)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.batches.task_done()
+
+
+# --- Commandes sur plusieurs processus (--workers) ---
+_worker = {}
+
+
+def _init_worker(mongo_uri, db_name, batch_size, orders):
+    _worker['collection'] = MongoClient(mongo_uri)[db_name]['orders']
+    _worker['batch_size'] = batch_size
+    _worker['orders'] = orders
+
+
+def _load_chunk(chunk):
+    collection, batch_size = _worker['collection'], _worker['batch_size']
+    written = 0
+    batch = []
+    for doc in _worker['orders'].documents(chunk):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            insert_batch(collection, batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        insert_batch(collection, batch)
+        written += len(batch)
+    return written
+
+
+def load_orders_parallel(args, orders):
+    """Une tranche de ORDER_CHUNK commandes par tâche, générée et écrite par chaque processus."""
+    start = time.perf_counter()
+    written = 0
+    with multiprocessing.Pool(args.workers, _init_worker,
+                              (args.mongo_uri, args.db, args.batch_size, orders)) as pool:
+        for count in pool.imap_unordered(_load_chunk, orders.chunks()):
+            written += count
+            elapsed = time.perf_counter() - start
+            print(f"  commandes: {written}/{args.orders} ({written / elapsed:,.0f} docs/s)")
+    elapsed = time.perf_counter() - start
+    print(f"✅ commandes: {written} documents en {elapsed:.1f} s ({written / max(elapsed, 1e-9):,.0f} docs/s, "
+          f"{args.workers} processus)")
+
+
+def write_json(path, args, restaurants):
+    """Fichier d'initialisation au format lu par init_test_users (sans les commandes)."""
+    drivers = driver_stat_documents(args.drivers, args.seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"utilisateurs": [')
+        users = (doc for prefix, role, count in (('client', 'client', args.clients),
+                                                 ('manager', 'manager', args.managers))
+                 for doc in user_documents(prefix, role, count))
+        f.write(',\n'.join(json.dumps({'username': user['_id'], 'password_hash': PASSWORD_HASH,
+                                        'role': user['role']}) for user in users))
+        f.write('],\n"livreurs": [')
+        f.write(',\n'.join(json.dumps({
+            'username': stat['_id'], 'password_hash': PASSWORD_HASH, 'role': 'livreur',
+            'livreur': {'avg_rating': stat['avg_rating']}
+        }) for stat in drivers))
+        f.write('],\n"restaurants": [')
+        f.write(',\n'.join(json.dumps({
+            'username': resto.id, 'password_hash': PASSWORD_HASH, 'role': 'restaurant',
+            'restaurant': {'nom': resto.name, 'longitude': resto.lon, 'latitude': resto.lat, 'menu': resto.menu()}
+        }, ensure_ascii=False) for resto in restaurants))
+        f.write(']}\n')
+    print(f"✅ Fichier d'initialisation écrit: {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default=os.environ.get('MONGO_URI'))
+    parser.add_argument('--db', default=os.environ.get('MONGO_DB', 'delivery_db'))
+    parser.add_argument('--json', help="écrire aussi un fichier d'initialisation (comptes et restaurants)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--clients', type=int, default=10000)
+    parser.add_argument('--managers', type=int, default=10)
+    parser.add_argument('--restaurants', type=int, default=2000)
+    parser.add_argument('--drivers', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=200000)
+    parser.add_argument('--days', type=int, default=365, help="période couverte par l'historique")
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processus pour les commandes (résultat identique quel que soit le nombre)")
+    parser.add_argument('--drop', action='store_true', help="vider les collections avant le chargement")
+    args = parser.parse_args()
+
+    restaurants = generate_restaurants(args.restaurants, args.seed)
+    if args.json:
+        write_json(args.json, args, restaurants)
+    if not args.mongo_uri:
+        if not args.json:
+            parser.error("--mongo-uri (ou MONGO_URI) ou --json requis")
+        return
+
+    db = MongoClient(args.mongo_uri)[args.db]
+    if args.drop:
+        for name in ('users', 'restaurants', 'livreur_stats', 'livreurs_positions', 'orders'):
+            db[name].drop()
+    now = datetime.now()
+    loader = BulkLoader(args.batch_size)
+    for prefix, role, count in (('client', 'client', args.clients), ('manager', 'manager', args.managers),
+                                ('restaurant', 'restaurant', args.restaurants),
+                                ('livreur', 'livreur', args.drivers)):
+        loader.load(db['users'], user_documents(prefix, role, count), f"comptes {role}", count)
+    loader.load(db['restaurants'], restaurant_documents(restaurants), "restaurants", args.restaurants)
+    loader.load(db['livreur_stats'], driver_stat_documents(args.drivers, args.seed), "notes des livreurs",
+                args.drivers)
+    loader.load(db['livreurs_positions'], position_documents(args.drivers, args.seed, now), "positions",
+                args.drivers)
+    orders = OrderGenerator(args.orders, restaurants, args.clients, args.drivers, args.days, args.seed, now)
+    if args.workers > 1:
+        load_orders_parallel(args, orders)
+    else:
+        loader.load(db['orders'], itertools.chain.from_iterable(orders.documents(c) for c in orders.chunks()),
+                    "commandes", args.orders)
+    start = time.perf_counter()
+    created = ensure_indexes(db)
+    print(f"✅ index: {sum(len(names) for names in created.values())} créés en {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
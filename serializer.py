@@ -0,0 +1,57 @@
+import base64
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+from bson import Binary, Decimal128, ObjectId
+
+try:
+    import orjson
+except ImportError:  # dépendance optionnelle
+    orjson = None
+
+
+def _default(obj):
+    """Types non JSON natifs rencontrés dans les documents MongoDB."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return float(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (bytes, Binary)):
+        return base64.b64encode(bytes(obj)).decode()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError(f"Type non sérialisable: {type(obj).__name__}")
+
+
+def _default_std(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return _default(obj)
+
+
+if orjson is not None:
+    def dumps(doc):
+        """Document pymongo -> octets JSON, en une seule passe.
+
+        Dates en ISO 8601 (comme isoformat()), ObjectId en chaîne. Pas
+        d'arbre intermédiaire comme avec json.loads(json_util.dumps(doc)).
+        """
+        return orjson.dumps(doc, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    # Sans orjson: module json standard, même conversion des types BSON
+    _encoder = json.JSONEncoder(default=_default_std, separators=(',', ':'), ensure_ascii=False)
+
+    def dumps(doc):
+        """Document pymongo -> octets JSON, en une seule passe."""
+        return _encoder.encode(doc).encode()
+
+
+def sse_frame(doc, event_id=None):
+    """Trame Server-Sent Events prête à envoyer, avec un id si fourni (reprise via Last-Event-ID)."""
+    if event_id is None:
+        return b"data: " + dumps(doc) + b"\n\n"
+    return b"id: " + event_id.encode() + b"\ndata: " + dumps(doc) + b"\n\n"
@@ -0,0 +1,64 @@
+"""Point d'entrée de production: serveur WSGI eventlet.
+
+Chaque requête, y compris les flux /events qui restent ouverts, est une
+green thread et non un thread système: un flux en attente d'événement ne
+coûte que sa pile de greenlet, sa file d'abonné et son socket. Après
+monkey_patch(), les sockets de pymongo, les verrous et les conditions
+sont coopératifs: une attente MongoDB rend la main aux autres connexions
+au lieu de bloquer le processus.
+
+Cible: 10 000 flux SSE simultanés par processus, sans déconnexion, et un
+événement diffusé à tous en moins de 3 s au p99 (vérification:
+python -m benchmarks.soak_sse).
+
+    python serve.py        # HOST, PORT, SERVER_MAX_CONNECTIONS
+"""
+import eventlet
+
+eventlet.monkey_patch()  # avant tout import de pymongo, threading ou socket
+
+import os
+import resource
+
+import eventlet.wsgi
+
+# Transport WebSocket (WEBSOCKET_TRANSPORT=1) sur les green threads d'eventlet
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'eventlet')
+
+from app_mongo import app, init_test_users, start_background_services
+
+HOST = os.environ.get('HOST', '0.0.0.0')
+PORT = int(os.environ.get('PORT', 5000))
+# Connexions simultanées servies (flux SSE compris) ; eventlet en accepte 1024 par défaut
+SERVER_MAX_CONNECTIONS = int(os.environ.get('SERVER_MAX_CONNECTIONS', 12000))
+
+
+def raise_fd_limit(needed):
+    """Un descripteur par connexion: relève la limite souple jusqu'à la limite dure."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = hard if hard == resource.RLIM_INFINITY else min(hard, max(soft, needed))
+    if target > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    if target < needed:
+        print(f"⚠️ Limite de descripteurs à {target} (< {needed}): augmentez 'ulimit -n'")
+
+
+def main():
+    raise_fd_limit(SERVER_MAX_CONNECTIONS + 1024)
+    init_test_users()
+    start_background_services()
+    listener = eventlet.listen((HOST, PORT), backlog=2048)
+    print(f"🚀 Serveur eventlet sur http://{HOST}:{PORT} ({SERVER_MAX_CONNECTIONS} connexions max)")
+    eventlet.wsgi.server(
+        listener, app,
+        max_size=SERVER_MAX_CONNECTIONS,
+        log_output=False,
+        # Envoyer chaque trame SSE tout de suite (eventlet regroupe par défaut jusqu'à 4 Ko)
+        minimum_chunk_size=0,
+        # Les flux SSE n'écrivent qu'un ping toutes les 15 s: pas de délai d'inactivité
+        socket_timeout=None
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+from datetime import datetime, timezone
+
+# Marge de sécurité sur la version initiale (écart d'horloge application / serveur MongoDB)
+CLOCK_MARGIN_MS = 5000
+
+
+def to_version(dt):
+    """Version = millisecondes epoch d'un updated_at (datetime UTC naïve renvoyée par pymongo)."""
+    return int(dt.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def from_version(version):
+    return datetime.fromtimestamp(version / 1000.0, tz=timezone.utc).replace(tzinfo=None)
+
+
+def current_version():
+    """Version à donner à une page qui vient d'être rendue."""
+    return int(datetime.now(timezone.utc).timestamp() * 1000) - CLOCK_MARGIN_MS
+
+
+def changes_since(orders_col, scope, since, projection=None, limit=200):
+    """Commandes du périmètre modifiées depuis la version 'since'.
+
+    updated_at est posé par $currentDate à chaque écriture sur une commande.
+    On utilise $gte: une commande modifiée dans la même milliseconde que la
+    dernière version est renvoyée deux fois plutôt que perdue (l'application
+    côté navigateur est idempotente).
+    Renvoie (commandes, nouvelle version, has_more).
+    """
+    query = dict(scope)
+    query["updated_at"] = {"$gte": from_version(since)}
+    orders = list(orders_col.find(query, projection).sort("updated_at", 1).limit(limit + 1))
+
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+    version = to_version(orders[-1]["updated_at"]) if orders else since
+    if has_more and version == since:
+        version += 1  # Page entière dans la même milliseconde: éviter de boucler
+    return orders, version, has_more
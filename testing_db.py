@@ -0,0 +1,27 @@
+"""Base MongoDB en mémoire (mongomock) pour les tests et les benchmarks.
+
+À appeler avant l'import de app_mongo: pymongo.MongoClient renvoie alors
+un client mongomock partagé.
+"""
+
+
+def install_memory_client(db_name):
+    """Remplace pymongo.MongoClient par un client mongomock et le renvoie (pip install mongomock)."""
+    import mongomock
+    import pymongo
+    from mongomock.collection import BulkOperationBuilder
+
+    # UpdateOne de pymongo 4.11+ passe 'sort' à bulk_write, que mongomock ne connaît pas
+    add_update = BulkOperationBuilder.add_update
+    if not getattr(add_update, 'accepts_sort', False):
+        def add_update_without_sort(self, *args, sort=None, **kwargs):
+            return add_update(self, *args, **kwargs)
+        add_update_without_sort.accepts_sort = True
+        BulkOperationBuilder.add_update = add_update_without_sort
+
+    client = mongomock.MongoClient()
+    # Collection plafonnée et time-series non gérées par mongomock: créées simples d'avance
+    for name in ('events', 'livreurs_positions_history'):
+        client[db_name].create_collection(name)
+    pymongo.MongoClient = lambda *args, **kwargs: client
+    return client
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_DB = 'delivery_test'
+
+
+@pytest.fixture(scope='session')
+def app_mongo():
+    """app_mongo sur une base de test, sans ses threads de fond.
+
+    MONGO_TEST_URI désigne un mongod jetable (la base delivery_test y est
+    recréée puis supprimée) ; sinon une base en mémoire (mongomock).
+    """
+    os.environ['MONGO_DB'] = TEST_DB
+    os.environ['EVENT_BUS'] = 'memory'
+    mongo_uri = os.environ.get('MONGO_TEST_URI')
+    if mongo_uri:
+        from pymongo import MongoClient
+        MongoClient(mongo_uri).drop_database(TEST_DB)
+        os.environ['MONGO_URI'] = mongo_uri
+    else:
+        pytest.importorskip('mongomock')
+        from testing_db import install_memory_client
+        install_memory_client(TEST_DB)
+    import app_mongo
+    app_mongo.app.config['TESTING'] = True
+    yield app_mongo
+    app_mongo.client.drop_database(TEST_DB)
+
+
+@pytest.fixture
+def in_memory(app_mongo):
+    return not os.environ.get('MONGO_TEST_URI')
@@ -0,0 +1,136 @@
+"""Nombre de requêtes MongoDB par rendu des tableaux de bord manager et restaurant.
+
+Les aides des templates (get_candidates_count, has_candidates,
+get_timer_data) lisent les commandes déjà chargées: le nombre de requêtes
+d'un rendu ne dépend pas du nombre de commandes affichées.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from flask import render_template
+
+COUNTED = {
+    'find', 'find_one', 'aggregate', 'count_documents', 'distinct', 'find_one_and_update',
+    'insert_one', 'insert_many', 'update_one', 'update_many', 'delete_one', 'delete_many', 'bulk_write'
+}
+STATUSES = ['pending', 'ready', 'assigned', 'delivered']
+
+
+class CountingCollection:
+    """Collection qui note chaque opération envoyée à MongoDB: (collection, opération)."""
+
+    def __init__(self, collection, calls):
+        self._collection = collection
+        self._calls = calls
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in COUNTED:
+            return attr
+
+        def counted(*args, **kwargs):
+            self._calls.append((self._collection.name, name))
+            return attr(*args, **kwargs)
+        return counted
+
+
+@pytest.fixture
+def queries(app_mongo, monkeypatch):
+    calls = []
+    for name in ('users_col', 'orders_col', 'stats_col', 'positions_col', 'restaurants_col'):
+        monkeypatch.setattr(app_mongo, name, CountingCollection(getattr(app_mongo, name), calls))
+    return calls
+
+
+def seed_orders(app_mongo, count, restaurant='restaurant1'):
+    app_mongo.orders_col.delete_many({})
+    now = datetime.now()
+    orders = []
+    for i in range(count):
+        status = STATUSES[i % len(STATUSES)]
+        order_id = f"t{i:06d}"
+        order = {
+            '_id': order_id,
+            'id': order_id,
+            'client': 'client1',
+            'restaurant': restaurant,
+            'restaurant_name': 'Restaurant 1',
+            'restaurant_lon': '2.35',
+            'restaurant_lat': '48.86',
+            'articles': '1x Pizza Reine',
+            'total_price': 12.0,
+            'status': status,
+            'candidates': [f"livreur{j}" for j in range(i % 3)],
+            'created_at': now - timedelta(seconds=i),
+            'updated_at': now - timedelta(seconds=i)
+        }
+        if status == 'ready':
+            order['timer'] = {'type': 'acceptance_window', 'status': 'active',
+                              'expires_at': (now + timedelta(seconds=60)).isoformat()}
+        if status in ('assigned', 'delivered'):
+            order['assigned_driver'] = 'livreur1'
+        orders.append(order)
+    app_mongo.orders_col.insert_many(orders)
+
+
+def login(app_mongo, username, role):
+    client = app_mongo.app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = username
+        session['role'] = role
+    return client
+
+
+@pytest.mark.parametrize('count', [10, 200])
+def test_manager_render_without_queries(app_mongo, queries, count):
+    seed_orders(app_mongo, count)
+    orders = list(app_mongo.orders_col.find())
+    with app_mongo.app.test_request_context('/dashboard'):
+        del queries[:]
+        html = render_template('manager_simple.html', username='manager1', all_orders=orders,
+                               next_cursor=None, status_filter='', restaurant_filter='',
+                               sync_version=0, get_livreur_score=app_mongo.get_livreur_score)
+    assert 't000000' in html
+    assert queries == []
+
+
+@pytest.mark.parametrize('count', [10, 200])
+def test_restaurant_render_without_queries(app_mongo, queries, count):
+    seed_orders(app_mongo, count)
+    orders = app_mongo.get_restaurant_orders('restaurant1')
+    with app_mongo.app.test_request_context('/dashboard'):
+        del queries[:]
+        html = render_template('restaurant_simple.html', username='Restaurant 1', orders=orders,
+                               sync_version=0)
+    assert 't000001' in html
+    assert queries == []
+
+
+def dashboard_queries(app_mongo, queries, count, username, role):
+    seed_orders(app_mongo, count)
+    client = login(app_mongo, username, role)
+    del queries[:]
+    response = client.get('/dashboard')
+    assert response.status_code == 200
+    return list(queries)
+
+
+def test_restaurant_dashboard_query_count_is_constant(app_mongo, queries):
+    small = dashboard_queries(app_mongo, queries, 10, 'restaurant1', 'restaurant')
+    large = dashboard_queries(app_mongo, queries, 200, 'restaurant1', 'restaurant')
+    assert small == large == [('orders', 'find')]
+
+
+def test_manager_dashboard_query_count_is_constant(app_mongo, queries):
+    small = dashboard_queries(app_mongo, queries, 10, 'manager1', 'manager')
+    large = dashboard_queries(app_mongo, queries, 200, 'manager1', 'manager')
+    assert small == large == [('orders', 'aggregate')]
+
+
+def test_manager_page_counts_candidates(app_mongo):
+    seed_orders(app_mongo, 10)
+    orders, next_cursor = app_mongo.get_orders_page(limit=5)
+    assert [order['_id'] for order in orders] == [f"t{i:06d}" for i in range(5)]
+    assert [order['candidates_count'] for order in orders] == [i % 3 for i in range(5)]
+    assert 'candidates' not in orders[0]
+    assert next_cursor is not None
@@ -0,0 +1,29 @@
+"""Bus changestream sur un serveur sans Change Streams: arrêt net, pas de boucle de reprise."""
+import pytest
+from pymongo.errors import OperationFailure
+
+from event_bus import ChangeStreamBus
+
+
+class StandaloneEvents:
+    """Collection d'un mongod seul: watch() refusé (code 40573)."""
+
+    def __init__(self):
+        self.watch_calls = 0
+
+    def watch(self, *args, **kwargs):
+        self.watch_calls += 1
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+
+
+def test_check_refuses_standalone_server():
+    with pytest.raises(RuntimeError, match='EVENT_BUS=memory'):
+        ChangeStreamBus(StandaloneEvents()).check()
+
+
+def test_listen_stops_without_change_streams():
+    events = StandaloneEvents()
+    ready = []
+    ChangeStreamBus(events).listen(lambda doc: None, on_ready=lambda: ready.append(True))
+    assert events.watch_calls == 1
+    assert ready == []
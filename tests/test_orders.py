@@ -0,0 +1,41 @@
+"""Création de commande: un identifiant déjà pris ne touche pas la commande existante."""
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def restaurant(app_mongo):
+    app_mongo.restaurants_col.replace_one(
+        {'_id': 'resto_test'},
+        {'_id': 'resto_test', 'name': 'Resto Test',
+         'location': {'type': 'Point', 'coordinates': [2.35, 48.86]},
+         'menu': [{'item': 'Pizza', 'price': 12}]},
+        upsert=True)
+    yield 'resto_test'
+    app_mongo.restaurants_col.delete_one({'_id': 'resto_test'})
+
+
+def order_client(app_mongo, username):
+    client = app_mongo.app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = username
+        session['role'] = 'client'
+    return client
+
+
+def test_order_id_collision_leaves_existing_order(app_mongo, restaurant, in_memory, monkeypatch):
+    if in_memory:
+        monkeypatch.setattr(app_mongo, '_transactions_supported', False)  # pas de commande hello
+    taken = uuid.UUID('12345678-0000-4000-8000-000000000000')
+    monkeypatch.setattr(uuid, 'uuid4', lambda: taken)
+    payload = {'restaurant_id': restaurant, 'items': [{'item': 'Pizza', 'quantity': 1, 'price': 12}]}
+
+    first = order_client(app_mongo, 'client1').post('/passer_commande', json=payload).get_json()
+    assert first == {'status': 'success', 'order_id': str(taken)}
+    stored = app_mongo.orders_col.find_one({'_id': str(taken)})
+
+    second = order_client(app_mongo, 'client2').post('/passer_commande', json=payload).get_json()
+    assert second['status'] == 'error'
+    assert app_mongo.orders_col.find_one({'_id': str(taken)}) == stored
+    app_mongo.orders_col.delete_one({'_id': str(taken)})
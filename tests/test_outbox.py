@@ -0,0 +1,61 @@
+"""Ordre de publication entre la boîte d'envoi (transactions) et la file en mémoire."""
+import threading
+
+import pytest
+
+from outbox import EventOutbox
+
+
+class RecordingBus:
+    def __init__(self):
+        self.written = []
+        self.lock = threading.Lock()
+
+    def write(self, events, ordered=True):
+        with self.lock:
+            self.written.extend(event['type'] for event in events)
+
+
+@pytest.fixture
+def outbox_col():
+    mongomock = pytest.importorskip('mongomock')
+    return mongomock.MongoClient()['delivery_test']['events_outbox']
+
+
+def wait_for(outbox, count, timeout=2.0):
+    with outbox.cond:
+        outbox.cond.wait_for(lambda: outbox.counters['published'] + outbox.counters['relayed'] >= count, timeout)
+
+
+def test_transaction_event_published_before_later_queued_events(outbox_col):
+    bus = RecordingBus()
+    # Intervalles longs: seul request_relay() peut déclencher le relais à temps
+    outbox = EventOutbox(bus, outbox_col, interval_ms=50, relay_interval=60.0)
+    outbox.start()
+    try:
+        outbox.publish_in_transaction({'type': 'order_created'}, None)
+        outbox.request_relay()  # validation de la transaction
+        outbox.publish({'type': 'order_ready'})
+        wait_for(outbox, 2)
+    finally:
+        outbox.stop()
+    assert bus.written == ['order_created', 'order_ready']
+    assert outbox_col.count_documents({}) == 0
+
+
+def test_relay_waits_for_commit(outbox_col):
+    bus = RecordingBus()
+    outbox = EventOutbox(bus, outbox_col, interval_ms=10, relay_interval=60.0)
+    outbox.start()
+    try:
+        outbox.publish({'type': 'order_ready'})
+        wait_for(outbox, 1)  # relais du démarrage passé
+        outbox.publish_in_transaction({'type': 'driver_assigned'}, None)
+        outbox.publish({'type': 'position_updated'})
+        wait_for(outbox, 2)
+        assert bus.written == ['order_ready', 'position_updated']  # pas de relais avant request_relay()
+        outbox.request_relay()
+        wait_for(outbox, 3)
+    finally:
+        outbox.stop()
+    assert bus.written == ['order_ready', 'position_updated', 'driver_assigned']
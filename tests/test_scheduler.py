@@ -0,0 +1,48 @@
+"""Reprise des timers après un arrêt du processus pendant leur exécution."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from scheduler import TimerScheduler
+
+
+@pytest.fixture
+def orders_col():
+    mongomock = pytest.importorskip('mongomock')
+    return mongomock.MongoClient()['delivery_test']['orders']
+
+
+def firing_order(orders_col, order_id, fired_seconds_ago):
+    now = datetime.now()
+    timer = {'type': 'acceptance_window', 'status': 'firing',
+             'expires_at': (now - timedelta(seconds=60)).isoformat(),
+             'created_at': (now - timedelta(seconds=120)).isoformat()}
+    if fired_seconds_ago is not None:
+        timer['fired_at'] = (now - timedelta(seconds=fired_seconds_ago)).isoformat()
+    orders_col.insert_one({'_id': order_id, 'status': 'ready', 'timer': timer})
+
+
+def test_stale_firing_timers_are_rearmed(orders_col):
+    firing_order(orders_col, 'stale', 120)
+    firing_order(orders_col, 'legacy', None)  # réservé avant l'ajout de fired_at
+    firing_order(orders_col, 'recent', 5)  # peut-être en cours dans un autre processus
+    scheduler = TimerScheduler(orders_col, firing_grace=30)
+    scheduler.register('acceptance_window', lambda order_id: None)
+
+    assert scheduler.load_pending() == 2
+    assert set(scheduler.entries) == {'stale', 'legacy'}
+    statuses = {order['_id']: order['timer']['status'] for order in orders_col.find()}
+    assert statuses == {'stale': 'active', 'legacy': 'active', 'recent': 'firing'}
+
+
+def test_rearmed_timer_fires_once(orders_col):
+    firing_order(orders_col, 'stale', 120)
+    fired = []
+    scheduler = TimerScheduler(orders_col, firing_grace=30)
+    scheduler.register('acceptance_window', fired.append)
+    scheduler.load_pending()
+    entry = scheduler.entries['stale']
+
+    scheduler._fire('stale', 'acceptance_window', entry[4])
+    scheduler._fire('stale', 'acceptance_window', entry[4])
+    assert fired == ['stale']